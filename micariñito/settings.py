@@ -46,6 +46,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'tabla.metricas.MetricasMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -135,11 +136,87 @@ STATIC_URL = 'static/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Envío de los archivos de MEDIA_URL (tabla/media.py): None los sirve Django
+# con FileResponse; 'x-accel' delega en nginx (location interna en
+# MEDIA_X_ACCEL_PREFIJO con alias a MEDIA_ROOT); 'x-sendfile' en Apache/lighttpd.
+MEDIA_SERVIDOR = None
+MEDIA_X_ACCEL_PREFIJO = '/media-interno/'
+
+# PDFs de reportes ya generados, direccionados por el hash de sus cifras
+REPORTES_CACHE_DIR = os.path.join(BASE_DIR, 'reportes_cache')
+REPORTES_CACHE_MAX_BYTES = 200 * 1024 * 1024
+
+# Gráfica del PDF: 'reportlab' (vectorial) o 'matplotlib' (imagen PNG)
+REPORTES_GRAFICO = 'reportlab'
+
+# Generación de reportes en un pool local de procesos (tabla/trabajos.py)
+REPORTES_EN_SEGUNDO_PLANO = True
+REPORTES_PROCESOS = 2
+REPORTES_MAX_PENDIENTES = 10
+REPORTES_TIMEOUT = 120  # segundos; al vencer, el proceso del render se termina
+REPORTES_RETENCION = 24 * 60 * 60  # segundos que se conservan los trabajos terminados
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# En producción, 'default' debe apuntar a una caché compartida entre workers
+# (p. ej. django.core.cache.backends.redis.RedisCache o memcached)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+
+# Alias de CACHES y duración (s) de las respuestas del menú (tabla/cache.py)
+MENU_CACHE = 'default'
+MENU_CACHE_TIMEOUT = 60 * 60 * 24
+
+REST_FRAMEWORK = {
+    'DEFAULT_PAGINATION_CLASS': 'tabla.paginacion.PaginacionPorCursor',
+    'PAGE_SIZE': 50,
+}
+
+# Tamaño máximo que un cliente puede pedir con ?tamano=
+API_TAMANO_PAGINA_MAXIMO = 500
+
+# Hilos del pool local para tareas en segundo plano (tabla/tareas.py)
+TAREAS_HILOS = 2
+
+# Máximo de ventas aceptadas por /api/registros-venta/lote/
+LOTE_VENTAS_MAXIMO = 1000
+
+# Reservas (tabla/disponibilidad.py): capacidad de cada mesa, duración de una
+# reserva y franjas en que se reparte el día
+MESAS_CAPACIDAD = {1: 2, 2: 2, 3: 4, 4: 4, 5: 4, 6: 6, 7: 8}
+RESERVA_DURACION_MINUTOS = 120
+RESERVA_INTERVALO_MINUTOS = 30
+RESERVA_APERTURA = '12:00'
+RESERVA_ULTIMO_TURNO = '22:00'
+
+# Variantes reducidas de las imágenes del menú (tabla/imagenes.py): se generan
+# en el pool de hilos al subir la imagen
+IMAGENES_EN_SEGUNDO_PLANO = True
+IMAGENES_CALIDAD = 80
+
+# Filas leídas por consulta (y por prefetch de relaciones) al exportar ventas y reservas
+EXPORTACION_TAMANO_LOTE = 2000
+
+# Changelists del admin (tabla/paginacion.py): sin filtros, por encima de esta
+# cantidad de filas se usa el conteo estimado del motor en lugar de COUNT(*)
+ADMIN_CONTEO_EXACTO_MAXIMO = 10000
+
+# Duración (s) en la caché 'default' de la serie diaria de la gráfica de
+# GananciaMes; además se invalida con cada venta o reserva del mes
+GRAFICO_GANANCIAS_CACHE_TIMEOUT = 60 * 60
+
+# Métricas por petición (tabla/metricas.py): IPs que pueden leer /metrics y,
+# si no es None, umbral en ms a partir del cual se registra cada consulta SQL
+# con su texto y el punto del código que la hizo (logger "tabla.metricas")
+METRICAS_IPS = ['127.0.0.1', '::1']
+METRICAS_CONSULTA_LENTA_MS = None
+
 JAZZMIN_SETTINGS = {
     "site_title": "Administración",
     "site_brand": "Administrador",
@@ -15,14 +15,16 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import include, path
+import re
+
+from django.urls import include, path, re_path
 from django.conf import settings
-from django.conf.urls.static import static
+from tabla.views import servir_media
 
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('tabla.urls')),
+    # También sin DEBUG: la vista delega en el servidor web con MEDIA_SERVIDOR
+    re_path(r'^%s(?P<path>.*)$' % re.escape(settings.MEDIA_URL.lstrip('/')), servir_media),
 ]
-
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
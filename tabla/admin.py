@@ -1,16 +1,70 @@
-import json
-from django.db.models import Sum
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.http import HttpResponseRedirect
 from django.urls import path, reverse
 from django.utils.html import format_html
 from django.utils.safestring import mark_safe
 import datetime
 from .models import (Usuario, Categoria, NotificacionMovil, ReservaDeMesa, Plato,
                      PromocionDePlato, ComentarioCalificacion, Cliente,
-                     RegistroDeVenta, Bebida, Entrada, Contacto, GananciaMes)
-from .views import descargar_reporte_pdf
+                     RegistroDeVenta, Bebida, Entrada, Contacto, GananciaMes, MesaNoDisponible)
+from . import disponibilidad
+from .paginacion import PaginadorEstimado
+from .views import datos_grafico_ganancias, descargar_reporte_pdf, descargar_trabajo_pdf, estado_reporte_pdf, grafico_ganancias_mes
+from .views import reporte_rango, solicitar_reporte_pdf
+
+class FiltroAutocompletar(admin.RelatedFieldListFilter):
+    # Filtro por clave foránea con el buscador del autocompletado del admin, en
+    # lugar de cargar todos los objetos relacionados en la lista de opciones.
+    # El admin del modelo relacionado debe definir search_fields.
+    template = 'admin/tabla/filtro_autocompletar.html'
+
+    def field_choices(self, field, request, model_admin):
+        # Las opciones se piden por AJAX mientras se escribe
+        return []
+
+    def has_output(self):
+        return True
+
+    def choices(self, changelist):
+        valor = self.lookup_val[-1] if isinstance(self.lookup_val, list) else self.lookup_val
+        campo = forms.ModelChoiceField(
+            queryset=self.field.remote_field.model._default_manager.all(),
+            to_field_name=self.field.target_field.name,
+            required=False,
+            widget=AutocompleteSelect(self.field, changelist.model_admin.admin_site,
+                                      attrs={'data-parametro': self.lookup_kwarg}),
+        )
+        # Sin atributo name: filtro_autocompletar.js lo pone al enviar si hay valor
+        html = campo.widget.render('', valor or '', attrs={'id': f'filtro_{self.field_path}'})
+        yield {
+            'selected': bool(valor),
+            'query_string': changelist.get_query_string(remove=[self.lookup_kwarg, self.lookup_kwarg_isnull]),
+            'display': self.title,
+            'widget': mark_safe(html.replace(' name=""', '')),
+        }
+
+class FiltrosAutocompletarMixin:
+    # Agrega los scripts del autocompletado si el admin usa FiltroAutocompletar
+    @property
+    def media(self):
+        media = super().media
+        for filtro in self.list_filter:
+            if isinstance(filtro, tuple) and issubclass(filtro[1], FiltroAutocompletar):
+                campo = self.model._meta.get_field(filtro[0])
+                media += AutocompleteSelect(campo, self.admin_site).media
+                media += forms.Media(js=['filtro_autocompletar.js'])
+        return media
+
+class BasicModelAdmin(FiltrosAutocompletarMixin, admin.ModelAdmin):
+    # Sin filtros, las tablas grandes se cuentan con la estimación del motor
+    # (ver PaginadorEstimado) y nunca se cuenta el total aparte de lo filtrado
+    paginator = PaginadorEstimado
+    show_full_result_count = False
+    # El mismo orden que el changelist usa por defecto; también ordena el autocompletado
+    ordering = ['-pk']
 
-class BasicModelAdmin(admin.ModelAdmin):
     class Media:
         css = {
             'all': ('customadmin.css',)
@@ -48,30 +102,68 @@ class FullCRUDModelAdmin(BasicModelAdmin):
 
 class UsuarioAdmin(BasicModelAdmin):
     list_display = ['nombre', 'apellido', 'correo_electronico', 'nombre_usuario']
+    search_fields = ['nombre_usuario', 'nombre', 'apellido', 'correo_electronico']
 
 class CategoriaAdmin(FullCRUDModelAdmin):
     list_display = ['nombre']
+    search_fields = ['nombre']
 
 class NotificacionMovilAdmin(FullCRUDModelAdmin):
     list_display = ['titulo', 'mensaje', 'fecha']
     list_filter = ['fecha']
+    autocomplete_fields = ['usuario']
+
+class ReservaDeMesaForm(forms.ModelForm):
+    class Meta:
+        model = ReservaDeMesa
+        fields = '__all__'
+
+    def clean(self):
+        # El solapamiento se informa en el formulario en vez de fallar al guardar
+        datos = super().clean()
+        mesa, fecha, hora = datos.get('numero_mesa'), datos.get('fecha'), datos.get('hora')
+        if None not in (mesa, fecha, hora) and disponibilidad.mesa_ocupada(mesa, fecha, hora, excluir=self.instance.pk):
+            raise forms.ValidationError(f'La mesa {mesa} ya está reservada el {fecha} a las {hora:%H:%M}.')
+        return datos
 
 class ReservaDeMesaAdmin(BasicModelAdmin):
+    form = ReservaDeMesaForm
     list_display = ['usuario', 'num_personas', 'numero_mesa', 'fecha', 'precio', 'hora', 'nota']
-    list_filter = ['fecha', 'usuario']
+    list_filter = ['fecha', ('usuario', FiltroAutocompletar)]
+    list_select_related = ['usuario']
+    autocomplete_fields = ['usuario']
+
+    def changeform_view(self, request, object_id=None, form_url='', extra_context=None):
+        # Si otra reserva ocupa la mesa entre clean() y el guardado, la excepción
+        # deshace toda la transacción del admin (fila, relaciones e historial) y
+        # el formulario se procesa de nuevo: ahora clean() ve la mesa ocupada y
+        # lo muestra como error del formulario.
+        for _ in range(2):
+            try:
+                return super().changeform_view(request, object_id, form_url, extra_context)
+            except MesaNoDisponible as error:
+                conflicto = error
+        self.message_user(request, ' '.join(conflicto.messages), messages.ERROR)
+        return HttpResponseRedirect(request.get_full_path())
 
 class PlatoAdmin(FullCRUDModelAdmin):
     list_display = ['nombre', 'descripcion', 'categoria', 'precio']
-    list_filter = ['categoria']
+    list_filter = [('categoria', FiltroAutocompletar)]
+    list_select_related = ['categoria']
+    search_fields = ['nombre']
+    autocomplete_fields = ['categoria']
 
 class PromocionDePlatoAdmin(FullCRUDModelAdmin):
     list_display = ['plato', 'enunciado', 'precio_descuento']
-    list_filter = ['plato']
+    list_filter = [('plato', FiltroAutocompletar)]
+    list_select_related = ['plato']
+    autocomplete_fields = ['plato']
 
 class ComentarioCalificacionAdmin(BasicModelAdmin):
     list_display = ['usuario', 'nombre_cliente', 'fecha', 'calificacion', 'comentario_formateado', 'acciones']
     list_filter = ['fecha', 'calificacion']
-    
+    list_select_related = ['usuario']
+
     def comentario_formateado(self, obj):
         return mark_safe(f'<div style="white-space: pre-wrap; word-wrap: break-word; max-width: 300px;">{obj.comentario}</div>')
     comentario_formateado.short_description = 'Comentario'
@@ -88,18 +180,23 @@ class ComentarioCalificacionAdmin(BasicModelAdmin):
 
 class ClienteAdmin(BasicModelAdmin):
     list_display = ['nombre', 'apellido', 'correo_electronico']
+    search_fields = ['nombre', 'apellido', 'correo_electronico']
 
 class RegistroDeVentaAdmin(BasicModelAdmin):
     list_display = ['cliente', 'total', 'fecha_venta']
-    list_filter = ['fecha_venta']
+    list_filter = ['fecha_venta', ('cliente', FiltroAutocompletar)]
+    list_select_related = ['cliente']
+    autocomplete_fields = ['cliente', 'platos', 'bebidas', 'entradas']
 
 class BebidaAdmin(FullCRUDModelAdmin):
     list_display = ['nombre', 'precio']
     list_filter = ['precio']
+    search_fields = ['nombre']
 
 class EntradaAdmin(FullCRUDModelAdmin):
     list_display = ['nombre', 'precio']
     list_filter = ['precio']
+    search_fields = ['nombre']
 
 class ContactoAdmin(BasicModelAdmin):
     list_display = ['nombre', 'correo_electronico', 'mensaje']
@@ -114,7 +211,12 @@ class GananciaMesAdmin(BasicModelAdmin):
     mes_anio.short_description = 'Mes'
 
     def acciones(self, obj):
-        return format_html('<a class="button" href="{}">Descargar PDF</a>', reverse('admin:descargar_reporte_pdf', args=[obj.pk]))
+        # Con JavaScript el botón encola el reporte y consulta su estado; sin él, descarga directo
+        return format_html(
+            '<a class="button reporte-pdf" href="{}" data-solicitar-url="{}">Descargar PDF</a>',
+            reverse('admin:descargar_reporte_pdf', args=[obj.pk]),
+            reverse('admin:solicitar_reporte_pdf', args=[obj.pk]),
+        )
     acciones.short_description = 'Acciones'
 
     def has_change_permission(self, request, obj=None):
@@ -124,34 +226,20 @@ class GananciaMesAdmin(BasicModelAdmin):
         return False
 
     def changelist_view(self, request, extra_context=None):
+        # La gráfica abre con el mes actual; los demás meses se piden a grafico_ganancias_mes
         extra_context = extra_context or {}
-        hoy = datetime.date.today()
-        primer_dia = datetime.date(hoy.year, hoy.month, 1)
-        ultimo_dia = primer_dia + datetime.timedelta(days=32)
-        ultimo_dia = ultimo_dia.replace(day=1) - datetime.timedelta(days=1)
-        reservas = ReservaDeMesa.objects.filter(fecha_reg__range=(primer_dia, ultimo_dia)).values('fecha_reg').annotate(total_dia=Sum('precio'))
-        ventas = RegistroDeVenta.objects.filter(fecha_venta__range=(primer_dia, ultimo_dia)).values('fecha_venta').annotate(total_dia=Sum('total'))
-        fechas = [dia for dia in range(1, ultimo_dia.day + 1)]
-        ganancias_reservas = [0] * ultimo_dia.day
-        ganancias_ventas = [0] * ultimo_dia.day
-        for reserva in reservas:
-            ganancias_reservas[reserva['fecha_reg'].day - 1] = float(reserva['total_dia'] or 0)
-        for venta in ventas:
-            ganancias_ventas[venta['fecha_venta'].day - 1] = float(venta['total_dia'] or 0)
-        chart_data = [
-            fechas,
-            ganancias_reservas,
-            ganancias_ventas,
-        ]
-        extra_context.update({
-            'chart_data': json.dumps(chart_data),
-        })
+        extra_context['chart_data'] = datos_grafico_ganancias(datetime.date.today().replace(day=1))
         return super().changelist_view(request, extra_context=extra_context)
 
     def get_urls(self):
         urls = super().get_urls()
         custom_urls = [
             path('descargar-reporte-pdf/<int:pk>/', self.admin_site.admin_view(descargar_reporte_pdf), name='descargar_reporte_pdf'),
+            path('reporte-pdf/<int:pk>/solicitar/', self.admin_site.admin_view(solicitar_reporte_pdf), name='solicitar_reporte_pdf'),
+            path('reporte-pdf/trabajo/<uuid:trabajo_id>/', self.admin_site.admin_view(estado_reporte_pdf), name='estado_reporte_pdf'),
+            path('reporte-pdf/trabajo/<uuid:trabajo_id>/descargar/', self.admin_site.admin_view(descargar_trabajo_pdf), name='descargar_trabajo_pdf'),
+            path('reporte-rango/', self.admin_site.admin_view(reporte_rango), name='reporte_rango_ganancias'),
+            path('grafico/', self.admin_site.admin_view(grafico_ganancias_mes), name='grafico_ganancias_mes'),
         ]
         return custom_urls + urls
 
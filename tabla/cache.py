@@ -0,0 +1,85 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+
+def cache_menu():
+    # Alias configurable: memoria local en pruebas, caché compartida en producción
+    return caches[getattr(settings, 'MENU_CACHE', 'default')]
+
+
+def _clave_version(modelo):
+    return f'menu:version:{modelo._meta.label_lower}'
+
+
+def version(modelo):
+    # La versión es el instante (en ns) del último cambio del modelo. Si la clave
+    # se pierde de la caché se reinicia con el instante actual, nunca con un
+    # valor ya usado, así no se sirven respuestas viejas.
+    cache = cache_menu()
+    clave = _clave_version(modelo)
+    valor = cache.get(clave)
+    if valor is None:
+        cache.add(clave, time.time_ns(), None)
+        valor = cache.get(clave)
+    return valor
+
+
+def incrementar_version(modelo):
+    cache_menu().set(_clave_version(modelo), time.time_ns(), None)
+
+
+def clave_grafico_ganancias(mes):
+    return f'ganancias:grafico:{mes:%Y-%m}'
+
+
+def invalidar_grafico_ganancias(*meses):
+    # La gráfica del changelist de GananciaMes vive en la caché 'default'
+    cache.delete_many([clave_grafico_ganancias(mes) for mes in meses])
+
+
+def etag_de_versiones(modelos, *partes):
+    # ETag y Last-Modified (segundos) a partir de las versiones de los modelos
+    versiones = [version(modelo) for modelo in modelos]
+    huella = ':'.join(str(parte) for parte in [*versiones, *partes])
+    return '"%s"' % hashlib.md5(huella.encode()).hexdigest(), max(versiones) // 1_000_000_000
+
+
+class CacheMenuMixin:
+    # Sirve list y retrieve desde la caché, con ETag y Last-Modified derivados
+    # de las versiones de `modelos_cache`. Un GET condicional que coincide se
+    # responde con 304 sin tocar la base de datos.
+    modelos_cache = ()
+
+    def list(self, request, *args, **kwargs):
+        return self.respuesta_cacheada(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.respuesta_cacheada(request, super().retrieve, *args, **kwargs)
+
+    def respuesta_cacheada(self, request, vista, *args, **kwargs):
+        etag, ultima_modificacion = etag_de_versiones(
+            self.modelos_cache, request.get_host(), request.get_full_path(), request.accepted_renderer.format)
+
+        no_modificado = get_conditional_response(request, etag=etag, last_modified=ultima_modificacion)
+        if no_modificado is not None:
+            return no_modificado
+
+        cache = cache_menu()
+        clave = f'menu:respuesta:{etag}'
+        datos = cache.get(clave)
+        if datos is None:
+            respuesta = vista(request, *args, **kwargs)
+            if respuesta.status_code != 200:
+                return respuesta
+            cache.set(clave, respuesta.data, getattr(settings, 'MENU_CACHE_TIMEOUT', 60 * 60 * 24))
+        else:
+            respuesta = Response(datos)
+        respuesta['ETag'] = etag
+        respuesta['Last-Modified'] = http_date(ultima_modificacion)
+        return respuesta
@@ -0,0 +1,79 @@
+import datetime
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import Q
+
+from .models import MesaNoDisponible, ReservaDeMesa, TurnoMesa, capacidades, turnos_de_reserva
+
+
+def _mesas_candidatas(personas):
+    # De menor a mayor capacidad: se ofrece primero la mesa que mejor se ajusta
+    return [mesa for capacidad, mesa in sorted((capacidad, mesa) for mesa, capacidad in capacidades().items())
+            if capacidad >= personas]
+
+
+def _turnos_solapados(fecha, hora):
+    turnos = turnos_de_reserva(fecha, hora)
+    condicion = Q()
+    for dia in {dia for dia, _ in turnos}:
+        condicion |= Q(fecha=dia, inicio__in=[inicio for otro_dia, inicio in turnos if otro_dia == dia])
+    return TurnoMesa.objects.filter(condicion)
+
+
+def mesas_ocupadas(fecha, hora):
+    return set(_turnos_solapados(fecha, hora).values_list('numero_mesa', flat=True))
+
+
+def mesa_ocupada(numero_mesa, fecha, hora, excluir=None):
+    """Si otra reserva (distinta de la de id ``excluir``) usa la mesa en fecha/hora."""
+    return _turnos_solapados(fecha, hora).filter(numero_mesa=numero_mesa).exclude(reserva_id=excluir).exists()
+
+
+def mesas_libres(fecha, hora, personas):
+    """Mesas con capacidad suficiente y sin reservas que se solapen con fecha/hora."""
+    ocupadas = mesas_ocupadas(fecha, hora)
+    return [mesa for mesa in _mesas_candidatas(personas) if mesa not in ocupadas]
+
+
+def _hora(nombre, por_defecto):
+    return datetime.time.fromisoformat(getattr(settings, nombre, por_defecto))
+
+
+def horarios_del_dia(fecha, personas):
+    """Mesas libres en cada horario de inicio del día, con una sola consulta."""
+    ocupadas = defaultdict(set)
+    franjas = TurnoMesa.objects.filter(fecha__in=[fecha, fecha + datetime.timedelta(days=1)])
+    for dia, inicio, mesa in franjas.values_list('fecha', 'inicio', 'numero_mesa'):
+        ocupadas[dia, inicio].add(mesa)
+
+    candidatas = _mesas_candidatas(personas)
+    intervalo = datetime.timedelta(minutes=getattr(settings, 'RESERVA_INTERVALO_MINUTOS', 30))
+    actual = datetime.datetime.combine(fecha, _hora('RESERVA_APERTURA', '12:00'))
+    ultimo = datetime.datetime.combine(fecha, _hora('RESERVA_ULTIMO_TURNO', '22:00'))
+    horarios = []
+    while actual <= ultimo:
+        en_uso = set().union(*(ocupadas[turno] for turno in turnos_de_reserva(fecha, actual.time())))
+        horarios.append({'hora': actual.time(), 'mesas': [mesa for mesa in candidatas if mesa not in en_uso]})
+        actual += intervalo
+    return horarios
+
+
+def reservar(usuario, num_personas, fecha, hora, precio, nota=None, numero_mesa=None):
+    """Crea la reserva en ``numero_mesa`` o, si no se indica, en la mesa libre
+    que mejor se ajuste. Lanza MesaNoDisponible si no queda ninguna."""
+    if numero_mesa is not None:
+        # La capacidad de la mesa la valida ReservaDeMesa.save()
+        candidatas = [numero_mesa]
+    else:
+        candidatas = mesas_libres(fecha, hora, num_personas)
+
+    for mesa in candidatas:
+        try:
+            return ReservaDeMesa.objects.create(usuario=usuario, num_personas=num_personas, numero_mesa=mesa,
+                                                fecha=fecha, hora=hora, precio=precio, nota=nota)
+        except MesaNoDisponible:
+            # Otra petición la ocupó entre la consulta y la inserción: se prueba la siguiente
+            if numero_mesa is not None:
+                raise
+    raise MesaNoDisponible(f'No hay mesas disponibles para {num_personas} personas el {fecha} a las {hora:%H:%M}.')
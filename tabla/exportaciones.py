@@ -0,0 +1,128 @@
+import datetime
+
+from django.conf import settings
+
+from .models import RegistroDeVenta, ReservaDeMesa
+from .streaming import lineas_csv, lineas_ndjson
+
+FORMATOS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+COLUMNAS_VENTAS = ['id', 'fecha_venta', 'cliente', 'total', 'platos', 'bebidas', 'entradas']
+COLUMNAS_RESERVAS = ['id', 'fecha', 'hora', 'usuario', 'numero_mesa', 'num_personas', 'precio', 'nota', 'fecha_reg']
+
+
+def tamano_lote():
+    return getattr(settings, 'EXPORTACION_TAMANO_LOTE', 2000)
+
+
+def _leer_fecha(parametros, nombre):
+    valor = parametros.get(nombre)
+    if not valor:
+        return None
+    try:
+        return datetime.date.fromisoformat(valor)
+    except ValueError:
+        raise ValueError(f'Fecha inválida en "{nombre}"; se espera AAAA-MM-DD.')
+
+
+def _leer_id(parametros, nombre):
+    valor = parametros.get(nombre)
+    if not valor:
+        return None
+    try:
+        return int(valor)
+    except ValueError:
+        raise ValueError(f'"{nombre}" debe ser un número entero.')
+
+
+def ventas(parametros):
+    # Filtros: desde, hasta (fecha_venta, inclusive) y cliente (id)
+    desde, hasta = _leer_fecha(parametros, 'desde'), _leer_fecha(parametros, 'hasta')
+    cliente = _leer_id(parametros, 'cliente')
+    queryset = RegistroDeVenta.objects.order_by('id')
+    if desde:
+        queryset = queryset.filter(fecha_venta__gte=desde)
+    if hasta:
+        queryset = queryset.filter(fecha_venta__lte=hasta)
+    if cliente:
+        queryset = queryset.filter(cliente_id=cliente)
+    # Con iterator(), el prefetch se hace una vez por lote de filas
+    return queryset.prefetch_related(*RegistroDeVenta.prefetch_ids())
+
+
+def reservas(parametros):
+    # Filtros: desde, hasta (fecha de la reserva, inclusive) y usuario (id)
+    desde, hasta = _leer_fecha(parametros, 'desde'), _leer_fecha(parametros, 'hasta')
+    usuario = _leer_id(parametros, 'usuario')
+    queryset = ReservaDeMesa.objects.order_by('id')
+    if desde:
+        queryset = queryset.filter(fecha__gte=desde)
+    if hasta:
+        queryset = queryset.filter(fecha__lte=hasta)
+    if usuario:
+        queryset = queryset.filter(usuario_id=usuario)
+    return queryset
+
+
+def _ids(relacion):
+    # Lee la caché del prefetch; all() no vuelve a consultar
+    return [objeto.pk for objeto in relacion.all()]
+
+
+def registros_ventas(queryset):
+    for venta in queryset.iterator(chunk_size=tamano_lote()):
+        yield {
+            'id': venta.pk,
+            'fecha_venta': venta.fecha_venta,
+            'cliente': venta.cliente_id,
+            'total': venta.total,
+            'platos': _ids(venta.platos),
+            'bebidas': _ids(venta.bebidas),
+            'entradas': _ids(venta.entradas),
+        }
+
+
+def registros_reservas(queryset):
+    for reserva in queryset.iterator(chunk_size=tamano_lote()):
+        yield {
+            'id': reserva.pk,
+            'fecha': reserva.fecha,
+            'hora': reserva.hora,
+            'usuario': reserva.usuario_id,
+            'numero_mesa': reserva.numero_mesa,
+            'num_personas': reserva.num_personas,
+            'precio': reserva.precio,
+            'nota': reserva.nota,
+            'fecha_reg': reserva.fecha_reg,
+        }
+
+
+EXPORTACIONES = {
+    'ventas': (ventas, registros_ventas, COLUMNAS_VENTAS),
+    'reservas': (reservas, registros_reservas, COLUMNAS_RESERVAS),
+}
+
+
+def _filas_csv(registros, columnas):
+    yield columnas
+    for registro in registros:
+        # Las relaciones van en una sola celda, con los ids separados por espacios
+        yield [' '.join(map(str, valor)) if isinstance(valor, list) else valor
+               for valor in (registro[columna] for columna in columnas)]
+
+
+def lineas(tipo, parametros, formato):
+    """Devuelve un generador de líneas con la exportación pedida.
+
+    Los filtros se validan aquí (ValueError), antes de empezar a emitir.
+    """
+    if formato not in FORMATOS:
+        raise ValueError(f'Formato inválido; opciones: {", ".join(FORMATOS)}.')
+    filtrar, registros, columnas = EXPORTACIONES[tipo]
+    filas = registros(filtrar(parametros))
+    if formato == 'csv':
+        return lineas_csv(_filas_csv(filas, columnas))
+    return lineas_ndjson(filas)
@@ -0,0 +1,129 @@
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.urls import reverse
+
+# Lado mayor, en píxeles, de cada variante. Nunca se amplía una imagen más
+# pequeña que la variante.
+VARIANTES = {
+    'miniatura': 160,
+    'tarjeta': 480,
+    'completa': 1200,
+}
+
+FORMATOS = {
+    'webp': 'WEBP',
+    'jpeg': 'JPEG',
+}
+
+
+def calidad():
+    return getattr(settings, 'IMAGENES_CALIDAD', 80)
+
+
+def ruta_derivado(nombre, variante, formato):
+    # images/plato/foto.jpg -> images/plato/derivados/foto/tarjeta.webp
+    carpeta, archivo = os.path.split(nombre)
+    base = os.path.splitext(archivo)[0]
+    return '/'.join([carpeta, 'derivados', base, f'{variante}.{formato}'])
+
+
+def borrar_derivados(nombre, storage):
+    for variante in VARIANTES:
+        for formato in FORMATOS:
+            storage.delete(ruta_derivado(nombre, variante, formato))
+
+
+def almacenamiento():
+    # El mismo storage que usan los ImageField del menú
+    from .models import image_storage
+    return image_storage
+
+
+def derivados_generados(nombre, storage):
+    # La variante más pequeña en el último formato es la que se escribe al final
+    ultima = ruta_derivado(nombre, min(VARIANTES, key=VARIANTES.get), list(FORMATOS)[-1])
+    return storage.exists(ultima)
+
+
+def _codificar(imagen, formato):
+    from PIL import Image
+
+    if formato == 'jpeg' and imagen.mode != 'RGB':
+        # JPEG no admite transparencia: se aplana sobre fondo blanco
+        fondo = Image.new('RGB', imagen.size, (255, 255, 255))
+        fondo.paste(imagen, mask=imagen.getchannel('A') if 'A' in imagen.getbands() else None)
+        imagen = fondo
+    salida = BytesIO()
+    opciones = {'quality': calidad(), 'optimize': True, 'progressive': True} if formato == 'jpeg' else {'quality': calidad(), 'method': 4}
+    imagen.save(salida, FORMATOS[formato], **opciones)
+    return salida.getvalue()
+
+
+def generar_derivados(nombre, storage, forzar=False):
+    """Genera todas las variantes de la imagen ``nombre`` y las guarda en ``storage``.
+
+    Devuelve la cantidad de archivos escritos (0 si ya existían).
+    """
+    if not forzar and derivados_generados(nombre, storage):
+        return 0
+    from PIL import Image, ImageOps
+
+    lado_mayor = max(VARIANTES.values())
+    with storage.open(nombre, 'rb') as archivo:
+        original = Image.open(archivo)
+        # En JPEG, draft() decodifica directamente a una escala reducida: evita
+        # descomprimir la foto del teléfono a resolución completa
+        original.draft('RGB', (lado_mayor, lado_mayor))
+        original = ImageOps.exif_transpose(original)
+        original = original.convert('RGBA' if 'A' in original.getbands() or 'transparency' in original.info else 'RGB')
+
+    # En AlmacenamientoPorContenido, save() renombraría el archivo por su hash
+    guardar = getattr(storage, 'guardar_con_nombre', storage.save)
+    escritos = 0
+    # De la variante mayor a la menor, reduciendo cada una desde la anterior
+    imagen = original
+    for variante, lado in sorted(VARIANTES.items(), key=lambda item: -item[1]):
+        imagen = imagen.copy()
+        imagen.thumbnail((lado, lado), Image.LANCZOS)
+        for formato in FORMATOS:
+            ruta = ruta_derivado(nombre, variante, formato)
+            if storage.exists(ruta):
+                storage.delete(ruta)
+            guardar(ruta, ContentFile(_codificar(imagen, formato)))
+            escritos += 1
+    return escritos
+
+
+def programar_derivados(campo):
+    """Genera las variantes de un ImageField recién guardado, en el pool de hilos.
+
+    Con IMAGENES_EN_SEGUNDO_PLANO = False se generan en el momento.
+    """
+    if not campo or derivados_generados(campo.name, campo.storage):
+        return
+    if getattr(settings, 'IMAGENES_EN_SEGUNDO_PLANO', True):
+        from .tareas import en_segundo_plano
+        en_segundo_plano(generar_derivados, campo.name, campo.storage)
+    else:
+        generar_derivados(campo.name, campo.storage)
+
+
+def urls_variantes(campo, construir_url=None):
+    """Mapa de URLs por variante y formato, más un ``srcset`` por formato."""
+    if not campo:
+        return None
+    resultado = {}
+    srcset = {formato: [] for formato in FORMATOS}
+    for variante, lado in VARIANTES.items():
+        resultado[variante] = {}
+        for formato in FORMATOS:
+            url = reverse('imagen_derivada', kwargs={'variante': variante, 'formato': formato, 'nombre': campo.name})
+            if construir_url:
+                url = construir_url(url)
+            resultado[variante][formato] = url
+            srcset[formato].append(f'{url} {lado}w')
+    resultado['srcset'] = {formato: ', '.join(urls) for formato, urls in srcset.items()}
+    return resultado
@@ -0,0 +1,175 @@
+import json
+import platform
+import statistics
+import subprocess
+import time
+from contextlib import contextmanager
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from tabla.cache import cache_menu
+from tabla.models import (Bebida, Cliente, ComentarioCalificacion, Entrada, GananciaDia, GananciaMes, Plato,
+                          RegistroDeVenta, ReservaDeMesa, Usuario)
+from tabla.reportes import generar_pdf
+from tabla.urls import router
+
+MODELOS_CONTADOS = [Usuario, Cliente, Plato, Bebida, Entrada, RegistroDeVenta, ReservaDeMesa, ComentarioCalificacion,
+                    GananciaMes, GananciaDia]
+CHANGELISTS = ['gananciames', 'registrodeventa', 'reservademesa', 'comentariocalificacion']
+
+
+@contextmanager
+def sin_cambios():
+    # Las pruebas que escriben se deshacen para no alterar los datos entre repeticiones
+    with transaction.atomic():
+        yield
+        transaction.set_rollback(True)
+
+
+def commit_actual():
+    try:
+        salida = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True)
+    except OSError:
+        return None
+    return salida.stdout.strip() or None
+
+
+def _host():
+    # Un host aceptado por ALLOWED_HOSTS para el cliente de pruebas
+    for host in settings.ALLOWED_HOSTS:
+        if host == 'testserver' or '*' not in host:
+            return host.lstrip('.')
+    return 'localhost'
+
+
+class Command(BaseCommand):
+    help = ('Mide los caminos más usados (listados de la API, menú, ganancias, PDF, changelists del admin y '
+            'alta de ventas) sobre los datos actuales y guarda los resultados en JSON. '
+            'Para un conjunto de datos de prueba, ver generar_datos.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticiones', type=int, default=5)
+        parser.add_argument('--calentamiento', type=int, default=1, help='Ejecuciones previas que no se miden.')
+        parser.add_argument('--solo', action='append', default=[],
+                            help='Mide solo los casos cuyo nombre contiene este texto (se puede repetir).')
+        parser.add_argument('--salida', help='Archivo JSON de resultados. Por defecto, bench-<motor>-<commit>.json.')
+        parser.add_argument('--comparar', help='JSON de una ejecución anterior con el que comparar las medianas.')
+
+    def handle(self, *args, **options):
+        if options['repeticiones'] < 1:
+            raise CommandError('--repeticiones debe ser al menos 1.')
+        anterior = None
+        if options['comparar']:
+            try:
+                with open(options['comparar'], encoding='utf-8') as archivo:
+                    anterior = json.load(archivo)['resultados']
+            except (OSError, ValueError, KeyError) as error:
+                raise CommandError(f'No se pudo leer {options["comparar"]}: {error}')
+
+        self.cliente = Client(HTTP_HOST=_host())
+        admin, _ = User.objects.get_or_create(username='bench-admin', defaults={'is_staff': True, 'is_superuser': True})
+        self.cliente.force_login(admin)
+
+        resultados = {}
+        for nombre, caso in self.casos():
+            if options['solo'] and not any(texto in nombre for texto in options['solo']):
+                continue
+            resultados[nombre] = self.medir(caso, options['repeticiones'], options['calentamiento'])
+            self.imprimir(nombre, resultados[nombre], (anterior or {}).get(nombre))
+
+        commit = commit_actual()
+        informe = {
+            'fecha': timezone.now().isoformat(),
+            'commit': commit,
+            'base_de_datos': connection.vendor,
+            'debug': settings.DEBUG,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'filas': {modelo.__name__: modelo.objects.count() for modelo in MODELOS_CONTADOS},
+            'repeticiones': options['repeticiones'],
+            'resultados': resultados,
+        }
+        salida = options['salida'] or f'bench-{connection.vendor}-{(commit or "sin-commit")[:10]}.json'
+        with open(salida, 'w', encoding='utf-8') as archivo:
+            json.dump(informe, archivo, indent=2, ensure_ascii=False)
+        self.stdout.write(self.style.SUCCESS(f'{len(resultados)} casos medidos; resultados en {salida}.'))
+
+    def casos(self):
+        for prefijo, _, basename in router.registry:
+            yield f'api:{prefijo}', self.get(reverse(f'{basename}-list'))
+        yield 'api:menu', self.get(reverse('menu'), vaciar_cache=True)
+        yield 'api:menu (en caché)', self.get(reverse('menu'))
+        for modelo in CHANGELISTS:
+            yield f'admin:{modelo}', self.get(reverse(f'admin:tabla_{modelo}_changelist'))
+
+        ultimo_mes = GananciaMes.objects.order_by('-mes').first()
+        if ultimo_mes:
+            def actualizar_ganancias():
+                with sin_cambios():
+                    ultimo_mes.actualizar_ganancias()
+            yield 'ganancias:actualizar_ganancias', actualizar_ganancias
+            yield 'reportes:generar_pdf', lambda: generar_pdf(GananciaMes.objects.get(pk=ultimo_mes.pk))
+
+        venta = self.datos_venta()
+        if venta:
+            def crear_venta():
+                with sin_cambios():
+                    respuesta = self.cliente.post(reverse('registrodeventa-list'), venta, content_type='application/json')
+                if respuesta.status_code != 201:
+                    raise CommandError(f'Alta de venta: HTTP {respuesta.status_code} {respuesta.content[:200]!r}')
+            yield 'ventas:crear', crear_venta
+
+    def get(self, url, vaciar_cache=False):
+        def caso():
+            if vaciar_cache:
+                cache_menu().clear()
+            respuesta = self.cliente.get(url)
+            if respuesta.status_code != 200:
+                raise CommandError(f'{url}: HTTP {respuesta.status_code}')
+        return caso
+
+    def datos_venta(self):
+        cliente = Cliente.objects.values_list('pk', flat=True).first()
+        platos = list(Plato.objects.values_list('pk', flat=True)[:3])
+        if cliente is None or not platos:
+            return None
+        return {
+            'cliente': cliente,
+            'platos': platos,
+            'bebidas': list(Bebida.objects.values_list('pk', flat=True)[:2]),
+            'entradas': list(Entrada.objects.values_list('pk', flat=True)[:1]),
+            'total': '99.90',
+        }
+
+    def medir(self, caso, repeticiones, calentamiento):
+        for _ in range(calentamiento):
+            caso()
+        tiempos = []
+        for _ in range(repeticiones):
+            # Con DEBUG activo connection.queries crecería entre repeticiones
+            reset_queries()
+            with CaptureQueriesContext(connection) as consultas:
+                comienzo = time.perf_counter()
+                caso()
+                tiempos.append((time.perf_counter() - comienzo) * 1000)
+        return {
+            'mediana_ms': round(statistics.median(tiempos), 3),
+            'minimo_ms': round(min(tiempos), 3),
+            'maximo_ms': round(max(tiempos), 3),
+            'consultas': len(consultas),
+            'tiempos_ms': [round(tiempo, 3) for tiempo in tiempos],
+        }
+
+    def imprimir(self, nombre, resultado, anterior):
+        linea = f'{nombre:<36} mediana {resultado["mediana_ms"]:9.1f} ms  {resultado["consultas"]:4} consultas'
+        if anterior:
+            linea += f'  ({resultado["mediana_ms"] / anterior["mediana_ms"]:.2f}x respecto de la anterior)'
+        self.stdout.write(linea)
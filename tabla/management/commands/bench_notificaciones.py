@@ -0,0 +1,59 @@
+import time
+import tracemalloc
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import reset_queries
+
+from tabla.models import NotificacionMovil, Usuario
+
+
+class Command(BaseCommand):
+    help = ('Mide tiempo y memoria de NotificacionMovil.enviar_a_todos. '
+            'Crea usuarios de prueba: úsese sobre una base de datos descartable.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuarios', type=int, default=100000)
+        parser.add_argument('--lote', type=int, default=2000)
+        parser.add_argument('--limpiar', action='store_true', help='Borra los usuarios y notificaciones de prueba al terminar.')
+
+    def handle(self, *args, **options):
+        faltantes = options['usuarios'] - Usuario.objects.filter(nombre_usuario__startswith='bench-').count()
+        if faltantes > 0:
+            # Un único hash para todos: el objetivo es medir el envío, no el alta
+            contraseña = make_password('bench')
+            inicio = Usuario.objects.filter(nombre_usuario__startswith='bench-').count()
+            for desde in range(inicio, inicio + faltantes, 5000):
+                hasta = min(desde + 5000, inicio + faltantes)
+                Usuario.objects.bulk_create([
+                    Usuario(nombre='Bench', apellido=str(i), correo_electronico=f'bench-{i}@example.com',
+                            nombre_usuario=f'bench-{i}', contraseña=contraseña)
+                    for i in range(desde, hasta)
+                ])
+            self.stdout.write(f'{faltantes} usuarios de prueba creados.')
+
+        muestras = []
+
+        def progreso(enviadas):
+            # Con DEBUG activo el registro de consultas crecería y falsearía la medición
+            reset_queries()
+            muestras.append((enviadas, tracemalloc.get_traced_memory()[1]))
+            tracemalloc.reset_peak()
+
+        tracemalloc.start()
+        comienzo = time.monotonic()
+        enviadas = NotificacionMovil.enviar_a_todos('Bench', 'Mensaje de prueba', tamano_lote=options['lote'], progreso=progreso)
+        duracion = time.monotonic() - comienzo
+        tracemalloc.stop()
+
+        for enviadas_hasta, pico in muestras[:: max(1, len(muestras) // 10)]:
+            self.stdout.write(f'{enviadas_hasta:>9} enviadas  pico del lote: {pico / 1024:8.0f} KiB')
+        picos = [pico for _, pico in muestras]
+        self.stdout.write(
+            f'{enviadas} notificaciones en {duracion:.2f} s ({enviadas / duracion:.0f}/s); '
+            f'pico por lote entre {min(picos) / 1024:.0f} y {max(picos) / 1024:.0f} KiB.'
+        )
+
+        if options['limpiar']:
+            NotificacionMovil.objects.filter(titulo='Bench', usuario__nombre_usuario__startswith='bench-').delete()
+            Usuario.objects.filter(nombre_usuario__startswith='bench-').delete()
@@ -0,0 +1,37 @@
+import datetime
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+
+from tabla.reportes import generar_pdf_desde_datos
+
+
+class Command(BaseCommand):
+    help = 'Compara tiempo de generación y tamaño del PDF mensual con cada motor de gráficas.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=31)
+        parser.add_argument('--repeticiones', type=int, default=5)
+
+    def handle(self, *args, **options):
+        aleatorio = random.Random(0)
+        mes = datetime.date(2024, 1, 1)
+        fechas = list(range(1, options['dias'] + 1))
+        reservas = [Decimal(aleatorio.randint(0, 50000)) / 100 for _ in fechas]
+        ventas = [Decimal(aleatorio.randint(0, 200000)) / 100 for _ in fechas]
+
+        for grafico in ('matplotlib', 'reportlab'):
+            # Una pasada previa para no medir la carga inicial de fuentes y módulos
+            generar_pdf_desde_datos(mes, fechas, reservas, ventas, grafico=grafico)
+            tiempos = []
+            for _ in range(options['repeticiones']):
+                comienzo = time.perf_counter()
+                contenido = generar_pdf_desde_datos(mes, fechas, reservas, ventas, grafico=grafico).getvalue()
+                tiempos.append(time.perf_counter() - comienzo)
+            self.stdout.write(
+                f'{grafico:<10} mediana {statistics.median(tiempos) * 1000:8.1f} ms   '
+                f'tamaño {len(contenido) / 1024:8.1f} KiB'
+            )
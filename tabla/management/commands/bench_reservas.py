@@ -0,0 +1,67 @@
+import datetime
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections
+
+from tabla.disponibilidad import _mesas_candidatas, reservar
+from tabla.models import MesaNoDisponible, ReservaDeMesa, TurnoMesa, Usuario
+
+
+class Command(BaseCommand):
+    help = ('Prueba de carga de reservas: muchos intentos en paralelo sobre el mismo horario. '
+            'Comprueba que no quedan reservas solapadas. Úsese sobre una base de datos descartable.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--intentos', type=int, default=200)
+        parser.add_argument('--hilos', type=int, default=16)
+        parser.add_argument('--personas', type=int, default=2)
+        parser.add_argument('--fecha', default='2099-01-01', help='Día de prueba (AAAA-MM-DD); se vacía antes de empezar.')
+        parser.add_argument('--hora', default='20:00')
+        parser.add_argument('--mesa', type=int, help='Todos los intentos piden esta mesa en lugar de la mejor libre.')
+
+    def handle(self, *args, **options):
+        fecha = datetime.date.fromisoformat(options['fecha'])
+        hora = datetime.time.fromisoformat(options['hora'])
+        usuario, _ = Usuario.objects.get_or_create(
+            nombre_usuario='bench-reservas',
+            defaults={'nombre': 'Bench', 'apellido': 'Reservas', 'correo_electronico': 'bench-reservas@example.com',
+                      'contraseña': 'bench'})
+        ReservaDeMesa.objects.filter(fecha__range=(fecha - datetime.timedelta(days=1), fecha), usuario=usuario).delete()
+        esperadas = 1 if options['mesa'] else len(_mesas_candidatas(options['personas']))
+
+        def intento(indice):
+            # Horarios escalonados cada 30 minutos para que también haya solapamientos parciales
+            desplazamiento = datetime.timedelta(minutes=30 * (indice % 3))
+            inicio = (datetime.datetime.combine(fecha, hora) + desplazamiento).time()
+            try:
+                reservar(usuario, options['personas'], fecha, inicio, Decimal('10.00'), numero_mesa=options['mesa'])
+                return 'reservada'
+            except MesaNoDisponible:
+                return 'rechazada'
+            except OperationalError:
+                # SQLite serializa las escrituras; con mucha contención puede agotar su espera
+                return 'bloqueo'
+            finally:
+                connections.close_all()
+
+        comienzo = time.monotonic()
+        with ThreadPoolExecutor(max_workers=options['hilos']) as pool:
+            resultados = Counter(pool.map(intento, range(options['intentos'])))
+        duracion = time.monotonic() - comienzo
+
+        # Invariante: ninguna mesa tiene dos reservas con franjas en común
+        repetidas = Counter(TurnoMesa.objects.filter(reserva__usuario=usuario).values_list('fecha', 'inicio', 'numero_mesa'))
+        solapadas = [turno for turno, cantidad in repetidas.items() if cantidad > 1]
+        reservas = ReservaDeMesa.objects.filter(usuario=usuario, fecha=fecha)
+        sin_turnos = reservas.filter(turnos__isnull=True).count()
+
+        self.stdout.write(f'{options["intentos"]} intentos con {options["hilos"]} hilos en {duracion:.2f} s '
+                          f'({options["intentos"] / duracion:.0f} intentos/s): {dict(resultados)}')
+        self.stdout.write(f'{reservas.count()} reservas creadas; mesas con capacidad suficiente: {esperadas}.')
+        if solapadas or sin_turnos:
+            raise CommandError(f'Reservas solapadas: {solapadas}; reservas sin franjas: {sin_turnos}.')
+        self.stdout.write(self.style.SUCCESS('Sin reservas solapadas.'))
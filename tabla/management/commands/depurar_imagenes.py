@@ -0,0 +1,88 @@
+import os
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from tabla.imagenes import borrar_derivados
+from tabla.models import Bebida, Entrada, Plato, PromocionDePlato, ReferenciaImagen, image_storage, upsert_en_bloque
+from tabla.storage import es_nombre_por_contenido
+
+MODELOS_CON_IMAGEN = (Plato, PromocionDePlato, Bebida, Entrada)
+
+
+def _archivos(storage, carpeta):
+    # Recorre el storage devolviendo las rutas relativas de los originales
+    directorios, archivos = storage.listdir(carpeta)
+    for archivo in archivos:
+        yield f'{carpeta}/{archivo}'
+    for directorio in directorios:
+        if directorio != 'derivados':
+            yield from _archivos(storage, f'{carpeta}/{directorio}')
+
+
+class Command(BaseCommand):
+    help = ('Recalcula las referencias de las imágenes del menú y borra los archivos que ninguna fila usa. '
+            'Con --migrar, pasa las imágenes antiguas al almacenamiento por contenido.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--migrar', action='store_true',
+                            help='Renombra por su hash las imágenes subidas antes del almacenamiento por contenido.')
+        parser.add_argument('--simular', action='store_true', help='Solo informa lo que se borraría.')
+        parser.add_argument('--edad-minima', type=int, default=3600,
+                            help='Segundos de antigüedad para borrar un archivo huérfano; protege subidas en curso.')
+        parser.add_argument('--carpeta', default='images')
+
+    def handle(self, *args, **options):
+        if options['migrar'] and not options['simular']:
+            self.migrar()
+
+        referencias = Counter()
+        for modelo in MODELOS_CON_IMAGEN:
+            filas = modelo.objects.exclude(imagen='').exclude(imagen__isnull=True).values('imagen').annotate(cantidad=Count('id'))
+            for fila in filas:
+                referencias[fila['imagen']] += fila['cantidad']
+        if not options['simular']:
+            with transaction.atomic():
+                ReferenciaImagen.objects.exclude(nombre__in=list(referencias)).delete()
+                upsert_en_bloque(
+                    ReferenciaImagen,
+                    [ReferenciaImagen(nombre=nombre, referencias=cantidad) for nombre, cantidad in referencias.items()],
+                    ['nombre'], ['referencias'],
+                )
+
+        if not image_storage.exists(options['carpeta']):
+            return
+        limite = time.time() - options['edad_minima']
+        huerfanos = [
+            nombre for nombre in _archivos(image_storage, options['carpeta'])
+            if nombre not in referencias and image_storage.get_modified_time(nombre).timestamp() < limite
+        ]
+        for nombre in huerfanos:
+            self.stdout.write(('Se borraría ' if options['simular'] else 'Borrado ') + nombre)
+            if not options['simular']:
+                image_storage.delete(nombre)
+                borrar_derivados(nombre, image_storage)
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(referencias)} imágenes en uso, {len(huerfanos)} archivos huérfanos.'))
+
+    def migrar(self):
+        # Las filas se actualizan con update() para no disparar el conteo por
+        # fila; las referencias se recalculan después desde cero
+        renombrados = {}
+        for modelo in MODELOS_CON_IMAGEN:
+            nombres = modelo.objects.exclude(imagen='').exclude(imagen__isnull=True).values_list('imagen', flat=True).distinct()
+            for nombre in nombres:
+                if es_nombre_por_contenido(nombre):
+                    continue
+                if nombre not in renombrados:
+                    if not image_storage.exists(nombre):
+                        self.stderr.write(f'No existe el archivo {nombre}; se deja la fila como está.')
+                        continue
+                    with image_storage.open(nombre, 'rb') as archivo:
+                        renombrados[nombre] = image_storage.save(os.path.basename(nombre), archivo)
+                modelo.objects.filter(imagen=nombre).update(imagen=renombrados[nombre])
+        for anterior, nuevo in renombrados.items():
+            self.stdout.write(f'{anterior} -> {nuevo}')
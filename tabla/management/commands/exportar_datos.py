@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from tabla import exportaciones
+
+
+class Command(BaseCommand):
+    help = 'Exporta ventas o reservas en CSV o NDJSON, en streaming y con memoria constante.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('tipo', choices=sorted(exportaciones.EXPORTACIONES))
+        parser.add_argument('--formato', choices=sorted(exportaciones.FORMATOS), default='ndjson')
+        parser.add_argument('--desde', help='Fecha inicial AAAA-MM-DD (inclusive).')
+        parser.add_argument('--hasta', help='Fecha final AAAA-MM-DD (inclusive).')
+        parser.add_argument('--cliente', help='Id del cliente (solo ventas).')
+        parser.add_argument('--usuario', help='Id del usuario (solo reservas).')
+        parser.add_argument('--salida', help='Archivo de destino; por defecto la salida estándar.')
+
+    def handle(self, *args, **options):
+        parametros = {campo: options[campo] for campo in ('desde', 'hasta', 'cliente', 'usuario')}
+        try:
+            lineas = exportaciones.lineas(options['tipo'], parametros, options['formato'])
+        except ValueError as error:
+            raise CommandError(error)
+
+        if not options['salida']:
+            for linea in lineas:
+                self.stdout.write(linea, ending='')
+            return
+        filas = 0
+        with open(options['salida'], 'w', encoding='utf-8', newline='') as archivo:
+            for linea in lineas:
+                archivo.write(linea)
+                filas += 1
+        self.stderr.write(f'{filas} líneas escritas en {options["salida"]}.')
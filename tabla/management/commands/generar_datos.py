@@ -0,0 +1,243 @@
+import datetime
+import random
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from tabla.disponibilidad import capacidades
+from tabla.models import (Bebida, Categoria, Cliente, ComentarioCalificacion, Entrada, GananciaMes, Plato,
+                          PromocionDePlato, RegistroDeVenta, ReservaDeMesa, ResumenCalificacion, TurnoMesa, Usuario,
+                          siguiente_mes, turnos_de_reserva)
+
+# Más movimiento de viernes a domingo (lunes = 0)
+PESO_DIA_SEMANA = [0.7, 0.8, 0.9, 1.0, 1.4, 1.7, 1.5]
+# Reparto de estrellas de 1 a 5
+PESO_CALIFICACION = [5, 7, 15, 33, 40]
+
+
+def crear_con_fechas(modelo, objetos, campo):
+    # bulk_create respeta auto_now_add y pisa las fechas generadas; se vuelven
+    # a escribir con bulk_update, que no lo aplica (los objetos ya traen id)
+    fechas = [getattr(objeto, campo) for objeto in objetos]
+    modelo.objects.bulk_create(objetos)
+    for objeto, fecha in zip(objetos, fechas):
+        setattr(objeto, campo, fecha)
+    modelo.objects.bulk_update(objetos, [campo])
+
+
+def siguiente_id(modelo):
+    # Ids asignados aquí: MySQL no los devuelve tras bulk_create
+    return (modelo.objects.aggregate(maximo=Max('id'))['maximo'] or 0) + 1
+
+
+def horarios_sin_solape():
+    # Inicios separados por al menos la duración de una reserva, para que las
+    # reservas generadas de una misma mesa nunca compartan franjas
+    intervalo = getattr(settings, 'RESERVA_INTERVALO_MINUTOS', 30)
+    duracion = getattr(settings, 'RESERVA_DURACION_MINUTOS', 120)
+    paso = datetime.timedelta(minutes=-(-duracion // intervalo) * intervalo)
+    hoy = datetime.date.today()
+    actual = datetime.datetime.combine(hoy, datetime.time.fromisoformat(getattr(settings, 'RESERVA_APERTURA', '12:00')))
+    ultimo = datetime.datetime.combine(hoy, datetime.time.fromisoformat(getattr(settings, 'RESERVA_ULTIMO_TURNO', '22:00')))
+    horarios = []
+    while actual <= ultimo:
+        horarios.append(actual.time())
+        actual += paso
+    return horarios
+
+
+class Command(BaseCommand):
+    help = ('Genera datos sintéticos del restaurante (menú, usuarios, clientes, ventas, reservas y comentarios) '
+            'con bulk_create y reconstruye las ganancias y el resumen de calificaciones. '
+            'Úsese sobre una base de datos descartable.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ventas', type=int, default=50000)
+        parser.add_argument('--reservas', type=int, default=5000)
+        parser.add_argument('--comentarios', type=int, default=5000)
+        parser.add_argument('--usuarios', type=int, default=1000)
+        parser.add_argument('--clientes', type=int, default=2000)
+        parser.add_argument('--categorias', type=int, default=6)
+        parser.add_argument('--platos', type=int, default=40)
+        parser.add_argument('--bebidas', type=int, default=15)
+        parser.add_argument('--entradas', type=int, default=10)
+        parser.add_argument('--dias', type=int, default=365, help='Días de historia, hasta --hasta inclusive.')
+        parser.add_argument('--hasta', help='Último día con datos (AAAA-MM-DD). Por defecto, hoy.')
+        parser.add_argument('--semilla', type=int, default=0)
+        parser.add_argument('--lote', type=int, default=5000, help='Filas por bulk_create.')
+
+    def handle(self, *args, **options):
+        try:
+            hasta = datetime.date.fromisoformat(options['hasta']) if options['hasta'] else datetime.date.today()
+        except ValueError:
+            raise CommandError('--hasta debe tener el formato AAAA-MM-DD.')
+        if options['dias'] < 1:
+            raise CommandError('--dias debe ser al menos 1.')
+        if options['ventas'] and (not options['clientes'] or not options['platos']):
+            raise CommandError('Las ventas necesitan al menos un cliente y un plato.')
+        if options['reservas'] and not options['usuarios']:
+            raise CommandError('Las reservas necesitan al menos un usuario.')
+        mesas = sorted(capacidades())
+        cupo = options['dias'] * len(mesas) * len(horarios_sin_solape())
+        if options['reservas'] > cupo:
+            raise CommandError(f'Solo caben {cupo} reservas sin solaparse en {options["dias"]} días; aumente --dias.')
+
+        self.aleatorio = random.Random(options['semilla'])
+        self.lote = options['lote']
+        self.dias = [hasta - datetime.timedelta(days=i) for i in range(options['dias'] - 1, -1, -1)]
+        self.pesos_dias = [PESO_DIA_SEMANA[dia.weekday()] for dia in self.dias]
+
+        menu = self.etapa('menú', self.generar_menu, options)
+        usuarios = self.etapa('usuarios', self.generar_usuarios, options['usuarios'])
+        clientes = self.etapa('clientes', self.generar_clientes, options['clientes'])
+        self.etapa('ventas', self.generar_ventas, options['ventas'], clientes, menu)
+        self.etapa('reservas', self.generar_reservas, options['reservas'], usuarios, mesas)
+        self.etapa('comentarios', self.generar_comentarios, options['comentarios'], usuarios)
+
+        # bulk_create no pasa por save(): las tablas derivadas se reconstruyen al final
+        # Las reservas se registran hasta 14 días antes de su fecha
+        desde = (self.dias[0] - datetime.timedelta(days=14)).replace(day=1)
+        self.etapa('ganancias', GananciaMes.recalcular_rango, desde, siguiente_mes(hasta.replace(day=1)))
+        self.etapa('resumen de calificaciones', ResumenCalificacion.recalcular)
+        self.stdout.write(self.style.SUCCESS(f'Datos generados del {self.dias[0]} al {hasta}.'))
+
+    def etapa(self, nombre, funcion, *args):
+        comienzo = time.monotonic()
+        resultado = funcion(*args)
+        duracion = time.monotonic() - comienzo
+        cantidad = f'{len(resultado)} filas, ' if isinstance(resultado, (list, range)) else ''
+        self.stdout.write(f'{nombre}: {cantidad}{duracion:.2f} s')
+        return resultado
+
+    def fecha_al_azar(self):
+        return self.aleatorio.choices(self.dias, weights=self.pesos_dias)[0]
+
+    def en_lotes(self, cantidad):
+        for inicio in range(0, cantidad, self.lote):
+            yield range(inicio, min(inicio + self.lote, cantidad))
+
+    def generar_menu(self, options):
+        # Pocas filas: se crean con save() para que se invalide la caché del menú
+        aleatorio = self.aleatorio
+
+        def precio(minimo, maximo):
+            return Decimal(aleatorio.randint(minimo * 10, maximo * 10)) / 10
+
+        categorias = [Categoria.objects.create(nombre=f'Categoría {i + 1}') for i in range(options['categorias'])]
+        platos = []
+        for i in range(options['platos'] if categorias else 0):
+            platos.append(Plato.objects.create(nombre=f'Plato {i + 1}', descripcion='Plato generado.',
+                                               categoria=aleatorio.choice(categorias), precio=precio(15, 60)))
+        for plato in aleatorio.sample(platos, len(platos) // 5):
+            PromocionDePlato.objects.create(plato=plato, enunciado='Promoción generada.',
+                                            precio_descuento=(plato.precio * Decimal('0.8')).quantize(Decimal('0.01')))
+        bebidas = [Bebida.objects.create(nombre=f'Bebida {i + 1}', precio=precio(3, 15)) for i in range(options['bebidas'])]
+        entradas = [Entrada.objects.create(nombre=f'Entrada {i + 1}', precio=precio(8, 25)) for i in range(options['entradas'])]
+        return {
+            'platos': {plato.pk: plato.precio for plato in platos},
+            'bebidas': {bebida.pk: bebida.precio for bebida in bebidas},
+            'entradas': {entrada.pk: entrada.precio for entrada in entradas},
+        }
+
+    def generar_usuarios(self, cantidad):
+        # Un único hash para todos: el objetivo es tener filas, no medir el alta
+        contraseña = make_password('generado')
+        primero = siguiente_id(Usuario)
+        ids = list(range(primero, primero + cantidad))
+        for tramo in self.en_lotes(cantidad):
+            Usuario.objects.bulk_create([
+                Usuario(id=ids[i], nombre='Usuario', apellido=str(ids[i]), nombre_usuario=f'gen-{ids[i]}',
+                        correo_electronico=f'gen-{ids[i]}@example.com', contraseña=contraseña)
+                for i in tramo
+            ])
+        return ids
+
+    def generar_clientes(self, cantidad):
+        primero = siguiente_id(Cliente)
+        ids = list(range(primero, primero + cantidad))
+        for tramo in self.en_lotes(cantidad):
+            Cliente.objects.bulk_create([
+                Cliente(id=ids[i], nombre='Cliente', apellido=str(ids[i]), correo_electronico=f'gen-{ids[i]}@example.com')
+                for i in tramo
+            ])
+        return ids
+
+    def generar_ventas(self, cantidad, clientes, menu):
+        aleatorio = self.aleatorio
+        relaciones = [
+            # (campo M2M, columna destino, precios, mínimo y máximo de ítems por venta)
+            ('platos', 'plato_id', menu['platos'], (1, 4)),
+            ('bebidas', 'bebida_id', menu['bebidas'], (0, 3)),
+            ('entradas', 'entrada_id', menu['entradas'], (0, 2)),
+        ]
+        ids = {campo: sorted(precios) for campo, _, precios, _ in relaciones}
+        primero = siguiente_id(RegistroDeVenta)
+        for tramo in self.en_lotes(cantidad):
+            ventas, filas = [], {campo: [] for campo, *_ in relaciones}
+            for i in tramo:
+                total = Decimal('0.00')
+                for campo, destino, precios, (minimo, maximo) in relaciones:
+                    elegidos = aleatorio.sample(ids[campo], min(aleatorio.randint(minimo, maximo), len(precios)))
+                    total += sum((precios[item] for item in elegidos), Decimal('0.00'))
+                    filas[campo].extend((primero + i, item) for item in elegidos)
+                ventas.append(RegistroDeVenta(id=primero + i, cliente_id=aleatorio.choice(clientes),
+                                              total=total, fecha_venta=self.fecha_al_azar()))
+            with transaction.atomic():
+                crear_con_fechas(RegistroDeVenta, ventas, 'fecha_venta')
+                for campo, destino, *_ in relaciones:
+                    through = getattr(RegistroDeVenta, campo).through
+                    through.objects.bulk_create([through(registrodeventa_id=venta, **{destino: item})
+                                                 for venta, item in filas[campo]])
+        return range(primero, primero + cantidad)
+
+    def generar_reservas(self, cantidad, usuarios, mesas):
+        aleatorio = self.aleatorio
+        capacidad = capacidades()
+        horarios = horarios_sin_solape()
+        # Cada índice es un par (día, mesa, horario) distinto: ninguna reserva se solapa
+        casillas = aleatorio.sample(range(len(self.dias) * len(mesas) * len(horarios)), cantidad)
+        primero = siguiente_id(ReservaDeMesa)
+        for tramo in self.en_lotes(cantidad):
+            reservas, turnos = [], []
+            for i in tramo:
+                resto, horario = divmod(casillas[i], len(horarios))
+                dia, mesa = divmod(resto, len(mesas))
+                fecha, hora, mesa = self.dias[dia], horarios[horario], mesas[mesa]
+                personas = aleatorio.randint(1, capacidad[mesa])
+                reservas.append(ReservaDeMesa(
+                    id=primero + i, usuario_id=aleatorio.choice(usuarios), num_personas=personas,
+                    numero_mesa=mesa, fecha=fecha, hora=hora, precio=Decimal(10 * personas),
+                    fecha_reg=fecha - datetime.timedelta(days=aleatorio.randint(0, 14))))
+                turnos.extend(TurnoMesa(reserva_id=primero + i, numero_mesa=mesa, fecha=dia_turno, inicio=inicio)
+                              for dia_turno, inicio in turnos_de_reserva(fecha, hora))
+            with transaction.atomic():
+                crear_con_fechas(ReservaDeMesa, reservas, 'fecha_reg')
+                TurnoMesa.objects.bulk_create(turnos)
+        return range(primero, primero + cantidad)
+
+    def generar_comentarios(self, cantidad, usuarios):
+        aleatorio = self.aleatorio
+        zona = timezone.get_current_timezone() if settings.USE_TZ else None
+        primero = siguiente_id(ComentarioCalificacion)
+        for tramo in self.en_lotes(cantidad):
+            comentarios = []
+            for i in tramo:
+                fecha = datetime.datetime.combine(self.fecha_al_azar(),
+                                                  datetime.time(aleatorio.randint(12, 23), aleatorio.randint(0, 59)))
+                if zona:
+                    fecha = timezone.make_aware(fecha, zona)
+                # Como en ComentarioCalificacion.save: o usuario o nombre_cliente
+                usuario = aleatorio.choice(usuarios) if usuarios and aleatorio.random() < 0.7 else None
+                comentarios.append(ComentarioCalificacion(
+                    id=primero + i, usuario_id=usuario, nombre_cliente=None if usuario else 'Anónimo', fecha=fecha,
+                    calificacion=aleatorio.choices(range(1, 6), weights=PESO_CALIFICACION)[0],
+                    comentario='Comentario generado.'))
+            with transaction.atomic():
+                crear_con_fechas(ComentarioCalificacion, comentarios, 'fecha')
+        return range(primero, primero + cantidad)
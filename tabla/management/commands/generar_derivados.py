@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from tabla.imagenes import almacenamiento, derivados_generados, generar_derivados
+from tabla.models import Bebida, Entrada, Plato, PromocionDePlato
+from tabla.tareas import pool_de_procesos
+
+
+def _generar(nombre, forzar):
+    # Se ejecuta en un proceso hijo; solo usa el storage, no la base de datos
+    try:
+        return nombre, generar_derivados(nombre, almacenamiento(), forzar=forzar), None
+    except OSError as error:
+        return nombre, 0, str(error)
+
+
+class Command(BaseCommand):
+    help = 'Genera las variantes reducidas (WebP y JPEG) de las imágenes del menú que aún no las tienen.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--forzar', action='store_true', help='Regenera también las variantes existentes.')
+        parser.add_argument('--procesos', type=int, default=1)
+
+    def handle(self, *args, **options):
+        nombres = set()
+        for modelo in (Plato, PromocionDePlato, Bebida, Entrada):
+            nombres.update(modelo.objects.exclude(imagen='').exclude(imagen__isnull=True).values_list('imagen', flat=True))
+        storage = almacenamiento()
+        if not options['forzar']:
+            nombres = {nombre for nombre in nombres if not derivados_generados(nombre, storage)}
+        if not nombres:
+            self.stdout.write('No hay imágenes pendientes.')
+            return
+
+        comienzo = time.monotonic()
+        if options['procesos'] > 1:
+            with pool_de_procesos(options['procesos']) as pool:
+                resultados = list(pool.map(_generar, sorted(nombres), [options['forzar']] * len(nombres)))
+        else:
+            resultados = [_generar(nombre, options['forzar']) for nombre in sorted(nombres)]
+
+        archivos = 0
+        for nombre, escritos, error in resultados:
+            if error:
+                self.stderr.write(f'{nombre}: {error}')
+            archivos += escritos
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(nombres)} imágenes procesadas, {archivos} variantes escritas en {time.monotonic() - comienzo:.1f} s.'))
@@ -0,0 +1,106 @@
+import csv
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+
+from tabla.models import Usuario
+from tabla.tareas import pool_de_procesos
+
+COLUMNAS = ('nombre', 'apellido', 'correo_electronico', 'nombre_usuario', 'contraseña')
+
+
+def _hashear(contraseñas):
+    # Se ejecuta en un proceso hijo: solo CPU, sin base de datos
+    return [make_password(valor) for valor in contraseñas]
+
+
+def _lotes(filas, tamano):
+    lote = []
+    for fila in filas:
+        lote.append(fila)
+        if len(lote) >= tamano:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+class Command(BaseCommand):
+    help = ('Importa usuarios desde un CSV con columnas nombre, apellido, correo_electronico, nombre_usuario '
+            'y contraseña. Las contraseñas se hashean en paralelo y las filas se insertan con bulk_create.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo')
+        parser.add_argument('--procesos', type=int, default=4, help='Procesos para hashear contraseñas.')
+        parser.add_argument('--lote', type=int, default=1000, help='Filas leídas, hasheadas e insertadas por vez.')
+        parser.add_argument('--hasheadas', action='store_true',
+                            help='La columna contraseña ya trae hashes de Django (p. ej. exportados de otro sistema) '
+                                 'y se guarda tal cual.')
+
+    def handle(self, *args, **options):
+        try:
+            archivo = open(options['archivo'], newline='', encoding='utf-8-sig')
+        except OSError as error:
+            raise CommandError(error)
+
+        comienzo = time.monotonic()
+        creados = omitidos = 0
+        pool = None
+        if options['procesos'] > 1:
+            pool = pool_de_procesos(options['procesos'])
+        try:
+            with archivo:
+                lector = csv.DictReader(archivo)
+                faltantes = set(COLUMNAS) - set(lector.fieldnames or ())
+                if faltantes:
+                    raise CommandError(f'Faltan columnas: {", ".join(sorted(faltantes))}.')
+                for lote in _lotes(lector, options['lote']):
+                    nuevos, descartadas = self.filtrar(lote)
+                    omitidos += descartadas
+                    if not nuevos:
+                        continue
+                    contraseñas = [fila['contraseña'] for fila in nuevos]
+                    if options['hasheadas']:
+                        hashes = contraseñas
+                    elif pool:
+                        # Un tramo por proceso: menos viajes entre procesos que una tarea por fila
+                        tramo = -(-len(contraseñas) // options['procesos'])
+                        hashes = [h for parte in pool.map(_hashear, [contraseñas[i:i + tramo] for i in range(0, len(contraseñas), tramo)])
+                                  for h in parte]
+                    else:
+                        hashes = _hashear(contraseñas)
+                    usuarios = [Usuario(**{campo: fila[campo] for campo in COLUMNAS[:-1]}, contraseña=hash_)
+                                for fila, hash_ in zip(nuevos, hashes)]
+                    # Las contraseñas ya van hasheadas: bulk_create no llama a Usuario.save(),
+                    # que las volvería a hashear
+                    Usuario.objects.bulk_create(usuarios)
+                    creados += len(usuarios)
+                    self.stdout.write(f'{creados} usuarios importados...')
+        finally:
+            if pool:
+                pool.shutdown()
+
+        duracion = time.monotonic() - comienzo
+        self.stdout.write(self.style.SUCCESS(
+            f'{creados} usuarios importados y {omitidos} filas omitidas en {duracion:.1f} s '
+            f'({creados / duracion if duracion else 0:.0f} usuarios/s).'))
+
+    def filtrar(self, lote):
+        # Una consulta por lote para descartar correos y nombres de usuario ya registrados
+        correos = {fila['correo_electronico'] for fila in lote}
+        nombres = {fila['nombre_usuario'] for fila in lote}
+        existentes_correo = set(Usuario.objects.filter(correo_electronico__in=correos).values_list('correo_electronico', flat=True))
+        existentes_nombre = set(Usuario.objects.filter(nombre_usuario__in=nombres).values_list('nombre_usuario', flat=True))
+        nuevos = []
+        for fila in lote:
+            if not all(fila.get(campo) for campo in COLUMNAS):
+                self.stderr.write(f'Fila incompleta omitida: {fila}')
+            elif fila['correo_electronico'] in existentes_correo or fila['nombre_usuario'] in existentes_nombre:
+                self.stderr.write(f'Usuario ya registrado omitido: {fila["correo_electronico"]}')
+            else:
+                # Repetidos dentro del mismo archivo: vale la primera aparición
+                existentes_correo.add(fila['correo_electronico'])
+                existentes_nombre.add(fila['nombre_usuario'])
+                nuevos.append(fila)
+        return nuevos, len(lote) - len(nuevos)
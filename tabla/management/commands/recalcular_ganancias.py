@@ -0,0 +1,105 @@
+import datetime
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Count, Min, Max, Sum
+
+from tabla.models import GananciaDia, GananciaMes, RegistroDeVenta, ReservaDeMesa, siguiente_mes
+from tabla.tareas import pool_de_procesos
+
+
+def _leer_mes(valor):
+    try:
+        return datetime.datetime.strptime(valor, '%Y-%m').date()
+    except ValueError:
+        raise CommandError(f'Mes inválido "{valor}", use el formato AAAA-MM.')
+
+
+def _recalcular_tramo(desde, hasta, batch_size):
+    # Se ejecuta en un proceso hijo: cada uno abre su propia conexión
+    try:
+        return GananciaMes.recalcular_rango(desde, hasta, batch_size=batch_size)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye GananciaMes y GananciaDia a partir de las reservas y ventas registradas.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', help='Primer mes a recalcular (AAAA-MM). Por defecto, el más antiguo con datos.')
+        parser.add_argument('--hasta', help='Último mes a recalcular (AAAA-MM). Por defecto, el más reciente con datos.')
+        parser.add_argument('--procesos', type=int, default=1, help='Procesos para repartir los tramos de meses.')
+        parser.add_argument('--meses-por-tramo', type=int, default=12)
+        parser.add_argument('--lote', type=int, default=500, help='Tamaño de lote de los upserts.')
+
+    def handle(self, *args, **options):
+        desde, hasta = self.rango(options['desde'], options['hasta'])
+        if desde is None:
+            self.stdout.write('No hay reservas ni ventas para recalcular.')
+            return
+
+        tramos = []
+        inicio = desde
+        while inicio < hasta:
+            fin = inicio
+            for _ in range(options['meses_por_tramo']):
+                fin = siguiente_mes(fin)
+            fin = min(fin, hasta)
+            tramos.append((inicio, fin))
+            inicio = fin
+
+        comienzo = time.monotonic()
+        if options['procesos'] > 1 and len(tramos) > 1:
+            with pool_de_procesos(options['procesos']) as pool:
+                futuros = [pool.submit(_recalcular_tramo, inicio, fin, options['lote']) for inicio, fin in tramos]
+                filas = sum(futuro.result() for futuro in futuros)
+        else:
+            filas = sum(GananciaMes.recalcular_rango(inicio, fin, batch_size=options['lote']) for inicio, fin in tramos)
+        duracion = time.monotonic() - comienzo
+
+        self.stdout.write(
+            f'{len(tramos)} tramo(s), {filas} filas de origen en {duracion:.2f} s '
+            f'({filas / duracion if duracion else filas:.0f} filas/s).'
+        )
+        self.verificar(desde, hasta)
+        ultimo_mes = hasta - datetime.timedelta(days=1)
+        self.stdout.write(self.style.SUCCESS(f'Ganancias recalculadas de {desde:%Y-%m} a {ultimo_mes:%Y-%m}.'))
+
+    def rango(self, desde, hasta):
+        if desde and hasta:
+            desde, hasta = _leer_mes(desde), _leer_mes(hasta)
+        else:
+            reservas = ReservaDeMesa.objects.aggregate(min=Min('fecha_reg'), max=Max('fecha_reg'))
+            ventas = RegistroDeVenta.objects.aggregate(min=Min('fecha_venta'), max=Max('fecha_venta'))
+            minimos = [fecha for fecha in (reservas['min'], ventas['min']) if fecha]
+            maximos = [fecha for fecha in (reservas['max'], ventas['max']) if fecha]
+            if not minimos:
+                return None, None
+            desde = _leer_mes(desde) if desde else min(minimos).replace(day=1)
+            hasta = _leer_mes(hasta) if hasta else max(maximos).replace(day=1)
+        if desde > hasta:
+            raise CommandError('--desde no puede ser posterior a --hasta.')
+        return desde, siguiente_mes(hasta)
+
+    def verificar(self, desde, hasta):
+        # Compara los totales de origen con los de GananciaMes y GananciaDia
+        reservas = ReservaDeMesa.objects.filter(fecha_reg__gte=desde, fecha_reg__lt=hasta).aggregate(
+            cantidad=Count('id'), monto=Sum('precio'))
+        ventas = RegistroDeVenta.objects.filter(fecha_venta__gte=desde, fecha_venta__lt=hasta).aggregate(
+            cantidad=Count('id'), monto=Sum('total'))
+        esperado = (reservas['cantidad'], reservas['monto'] or Decimal('0.00'),
+                    ventas['cantidad'], ventas['monto'] or Decimal('0.00'))
+        totales = dict(total_reservas=Sum('total_reservas'), ganancia_reservas=Sum('ganancia_reservas'),
+                       total_registros_venta=Sum('total_registros_venta'),
+                       ganancia_registros_venta=Sum('ganancia_registros_venta'))
+        for modelo, filtro in ((GananciaMes, {'mes__gte': desde, 'mes__lt': hasta}),
+                               (GananciaDia, {'dia__gte': desde, 'dia__lt': hasta})):
+            obtenido = modelo.objects.filter(**filtro).aggregate(**totales)
+            obtenido = (obtenido['total_reservas'] or 0, obtenido['ganancia_reservas'] or Decimal('0.00'),
+                        obtenido['total_registros_venta'] or 0, obtenido['ganancia_registros_venta'] or Decimal('0.00'))
+            if obtenido != esperado:
+                raise CommandError(f'Verificación fallida en {modelo.__name__}: se esperaba {esperado} y se obtuvo {obtenido}.')
+        self.stdout.write('Verificación correcta.')
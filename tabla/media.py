@@ -0,0 +1,146 @@
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+from .storage import es_nombre_por_contenido
+
+RANGO = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class _Tramo:
+    # Vista de solo lectura de un tramo de un archivo abierto. Conserva
+    # fileno() para que el servidor WSGI pueda usar sendfile: gunicorn envía
+    # desde la posición actual tantos bytes como indique Content-Length.
+    def __init__(self, archivo, inicio, longitud):
+        archivo.seek(inicio)
+        self.archivo = archivo
+        self.restante = longitud
+
+    def read(self, tamano=-1):
+        if self.restante <= 0:
+            return b''
+        tamano = self.restante if tamano is None or tamano < 0 else min(tamano, self.restante)
+        datos = self.archivo.read(tamano)
+        self.restante -= len(datos)
+        return datos
+
+    def fileno(self):
+        return self.archivo.fileno()
+
+    def close(self):
+        self.archivo.close()
+
+
+def etag_archivo(nombre, estado):
+    if es_nombre_por_contenido(nombre):
+        # El nombre ya identifica el contenido: images/ab/<hash>.png o
+        # images/ab/derivados/<hash>/tarjeta.webp
+        return '"%s"' % nombre.split('/', 2)[2].replace('derivados/', '').replace('/', '-')
+    return '"%x-%x"' % (estado.st_mtime_ns, estado.st_size)
+
+
+def leer_rango(cabecera, tamano):
+    """Devuelve (inicio, fin) inclusivos, None si no hay rango utilizable, o
+    False si el rango no se puede satisfacer."""
+    coincidencia = RANGO.match(cabecera.replace(' ', ''))
+    if not coincidencia:
+        # Varios rangos o sintaxis desconocida: se responde el archivo completo
+        return None
+    inicio, fin = coincidencia.groups()
+    if not inicio and not fin:
+        return None
+    if not inicio:
+        # bytes=-N: los últimos N bytes
+        longitud = int(fin)
+        if longitud == 0:
+            return False
+        return max(tamano - longitud, 0), tamano - 1
+    inicio = int(inicio)
+    fin = min(int(fin), tamano - 1) if fin else tamano - 1
+    if inicio >= tamano or inicio > fin:
+        return False
+    return inicio, fin
+
+
+def _rango_vigente(request, etag, ultima_modificacion):
+    # If-Range: el rango solo vale si el cliente tiene la misma versión
+    condicion = request.headers.get('If-Range')
+    if not condicion:
+        return True
+    if condicion.startswith('"') or condicion.startswith('W/'):
+        return condicion == etag
+    fecha = parse_http_date_safe(condicion)
+    return fecha is not None and fecha >= ultima_modificacion
+
+
+def servir_archivo(request, nombre, raiz=None, cache_control=None, content_type=None):
+    """Sirve ``nombre`` (relativo a ``raiz``, por defecto MEDIA_ROOT).
+
+    Responde 304/412 según If-None-Match/If-Modified-Since, 206/416 para
+    peticiones Range, y delega el envío en el servidor web cuando
+    MEDIA_SERVIDOR lo indica (``x-accel`` para nginx, ``x-sendfile`` para
+    Apache/lighttpd). Sin delegación usa FileResponse, que permite sendfile
+    del sistema operativo en el servidor WSGI.
+    """
+    raiz = raiz or settings.MEDIA_ROOT
+    try:
+        ruta = safe_join(raiz, nombre)
+        estado = os.stat(ruta)
+    except (SuspiciousFileOperation, OSError):
+        raise Http404
+    if not os.path.isfile(ruta):
+        raise Http404
+
+    etag = etag_archivo(nombre, estado)
+    ultima_modificacion = int(estado.st_mtime)
+    content_type = content_type or mimetypes.guess_type(ruta)[0] or 'application/octet-stream'
+
+    def cabeceras(respuesta):
+        respuesta['ETag'] = etag
+        respuesta['Last-Modified'] = http_date(ultima_modificacion)
+        respuesta['Accept-Ranges'] = 'bytes'
+        if cache_control:
+            respuesta['Cache-Control'] = cache_control
+        return respuesta
+
+    condicional = get_conditional_response(request, etag=etag, last_modified=ultima_modificacion)
+    if condicional is not None:
+        return cabeceras(condicional)
+
+    servidor = getattr(settings, 'MEDIA_SERVIDOR', None)
+    if servidor == 'x-accel':
+        # nginx resuelve Range y envía el archivo desde una location "internal"
+        respuesta = HttpResponse(content_type=content_type)
+        respuesta['X-Accel-Redirect'] = getattr(settings, 'MEDIA_X_ACCEL_PREFIJO', '/media-interno/') + quote(nombre)
+        return cabeceras(respuesta)
+    if servidor == 'x-sendfile':
+        respuesta = HttpResponse(content_type=content_type)
+        respuesta['X-Sendfile'] = ruta
+        return cabeceras(respuesta)
+
+    rango = None
+    if request.method == 'GET' and 'Range' in request.headers and _rango_vigente(request, etag, ultima_modificacion):
+        rango = leer_rango(request.headers['Range'], estado.st_size)
+    if rango is False:
+        respuesta = HttpResponse(status=416)
+        respuesta['Content-Range'] = f'bytes */{estado.st_size}'
+        return cabeceras(respuesta)
+
+    archivo = open(ruta, 'rb')
+    if rango is None:
+        respuesta = FileResponse(archivo, content_type=content_type)
+        respuesta['Content-Length'] = estado.st_size
+        return cabeceras(respuesta)
+    inicio, fin = rango
+    respuesta = FileResponse(_Tramo(archivo, inicio, fin - inicio + 1), status=206, content_type=content_type)
+    respuesta['Content-Length'] = fin - inicio + 1
+    respuesta['Content-Range'] = f'bytes {inicio}-{fin}/{estado.st_size}'
+    return cabeceras(respuesta)
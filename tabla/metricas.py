@@ -0,0 +1,175 @@
+import logging
+import os
+import threading
+import time
+import traceback
+from bisect import bisect_left
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# Límites superiores (le) de cada histograma, como en los clientes de Prometheus
+SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+CONSULTAS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+_DIRECTORIO_DJANGO = os.path.dirname(os.path.dirname(os.path.abspath(__import__('django').__file__)))
+
+
+class Histograma:
+    """Histograma acumulativo por combinación de etiquetas, seguro entre hilos.
+
+    Los valores viven en la memoria del proceso: con varios workers, cada uno
+    expone los suyos y Prometheus los distingue por instancia.
+    """
+
+    def __init__(self, nombre, ayuda, etiquetas, limites):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = etiquetas
+        self.limites = limites
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observar(self, valor, *etiquetas):
+        # El último contador corresponde a +Inf
+        posicion = bisect_left(self.limites, valor)
+        with self.lock:
+            serie = self.series.get(etiquetas)
+            if serie is None:
+                serie = self.series[etiquetas] = [[0] * (len(self.limites) + 1), 0, 0]
+            serie[0][posicion] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    def reiniciar(self):
+        with self.lock:
+            self.series.clear()
+
+    def texto(self):
+        lineas = [f'# HELP {self.nombre} {self.ayuda}', f'# TYPE {self.nombre} histogram']
+        with self.lock:
+            series = sorted((etiquetas, [list(cubos), suma, cantidad])
+                            for etiquetas, (cubos, suma, cantidad) in self.series.items())
+        for valores, (cubos, suma, cantidad) in series:
+            etiquetas = ','.join(f'{nombre}="{_escapar(valor)}"' for nombre, valor in zip(self.etiquetas, valores))
+            acumulado = 0
+            for limite, cubo in zip([*map(_numero, self.limites), '+Inf'], cubos):
+                acumulado += cubo
+                lineas.append(f'{self.nombre}_bucket{{{etiquetas},le="{limite}"}} {acumulado}')
+            lineas.append(f'{self.nombre}_sum{{{etiquetas}}} {_numero(suma)}')
+            lineas.append(f'{self.nombre}_count{{{etiquetas}}} {cantidad}')
+        return '\n'.join(lineas)
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _numero(valor):
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+DURACION = Histograma('http_request_duration_seconds', 'Tiempo total de la petición.',
+                      ('route', 'method', 'status'), SEGUNDOS)
+CONSULTAS_SQL = Histograma('http_request_sql_queries', 'Consultas SQL por petición.',
+                           ('route', 'method'), CONSULTAS)
+DURACION_SQL = Histograma('http_request_sql_duration_seconds', 'Tiempo en SQL por petición.',
+                          ('route', 'method'), SEGUNDOS)
+HISTOGRAMAS = (DURACION, CONSULTAS_SQL, DURACION_SQL)
+
+
+def exportar():
+    """Todas las métricas en el formato de texto de Prometheus."""
+    return '\n'.join(histograma.texto() for histograma in HISTOGRAMAS) + '\n'
+
+
+def reiniciar():
+    for histograma in HISTOGRAMAS:
+        histograma.reiniciar()
+
+
+def _origen():
+    # Marco más cercano del proyecto (no de Django ni de librerías) entre la
+    # consulta y el middleware; al llegar al middleware ya no hay código propio
+    pila = traceback.extract_stack()
+    while pila and pila[-1].filename == __file__:
+        pila.pop()
+    for marco in reversed(pila):
+        archivo = marco.filename
+        if archivo == __file__:
+            break
+        if archivo.startswith(_DIRECTORIO_DJANGO) or 'site-packages' in archivo:
+            continue
+        return f'{os.path.relpath(archivo, settings.BASE_DIR)}:{marco.lineno} en {marco.name}'
+    return 'desconocido'
+
+
+class MedicionSQL:
+    """Envoltorio para ``connection.execute_wrapper``: cuenta y cronometra las
+    consultas, y registra las que superan METRICAS_CONSULTA_LENTA_MS."""
+
+    def __init__(self):
+        self.consultas = 0
+        self.segundos = 0.0
+        self.umbral = getattr(settings, 'METRICAS_CONSULTA_LENTA_MS', None)
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duracion = time.perf_counter() - inicio
+            self.consultas += 1
+            self.segundos += duracion
+            if self.umbral is not None and duracion * 1000 >= self.umbral:
+                logger.warning('Consulta lenta (%.1f ms) desde %s: %s', duracion * 1000, _origen(), sql)
+
+
+METODOS = frozenset({'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS', 'TRACE', 'CONNECT'})
+
+
+def _metodo(request):
+    # El método lo elige el cliente: cualquier otro token crearía series nuevas sin límite
+    return request.method if request.method in METODOS else 'other'
+
+
+def _ruta(request):
+    # El patrón de la URL, no la ruta concreta: así las series no crecen con cada id
+    coincidencia = getattr(request, 'resolver_match', None)
+    if coincidencia is None:
+        return 'sin_ruta'
+    return '/' + coincidencia.route.lstrip('^').rstrip('$')
+
+
+class MetricasMiddleware:
+    """Mide cada petición: ruta, estado, tiempo total, cantidad y tiempo de SQL.
+
+    Las cifras se devuelven en la cabecera ``Server-Timing`` y se acumulan en
+    los histogramas que expone ``exponer_metricas`` en /metrics. En respuestas con
+    streaming solo se cuenta lo ocurrido antes de empezar a enviar el cuerpo.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        medicion = MedicionSQL()
+        inicio = time.perf_counter()
+        with ExitStack() as pila:
+            for conexion in connections.all():
+                pila.enter_context(conexion.execute_wrapper(medicion))
+            response = self.get_response(request)
+        duracion = time.perf_counter() - inicio
+
+        ruta, metodo = _ruta(request), _metodo(request)
+        DURACION.observar(duracion, ruta, metodo, response.status_code)
+        CONSULTAS_SQL.observar(medicion.consultas, ruta, metodo)
+        DURACION_SQL.observar(medicion.segundos, ruta, metodo)
+        response['Server-Timing'] = ', '.join([
+            f'sql;dur={medicion.segundos * 1000:.1f};desc="{medicion.consultas} consultas"',
+            f'total;dur={duracion * 1000:.1f}',
+        ])
+        return response
@@ -0,0 +1,58 @@
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def poblar_ganancias_dia(apps, schema_editor):
+    GananciaMes = apps.get_model('tabla', 'GananciaMes')
+    GananciaDia = apps.get_model('tabla', 'GananciaDia')
+    ReservaDeMesa = apps.get_model('tabla', 'ReservaDeMesa')
+    RegistroDeVenta = apps.get_model('tabla', 'RegistroDeVenta')
+
+    dias = {}
+    for fila in ReservaDeMesa.objects.values('fecha_reg').annotate(cantidad=Count('id'), monto=Sum('precio')):
+        dia = dias.setdefault(fila['fecha_reg'], GananciaDia(dia=fila['fecha_reg']))
+        dia.total_reservas = fila['cantidad']
+        dia.ganancia_reservas = fila['monto'] or Decimal('0.00')
+    for fila in RegistroDeVenta.objects.values('fecha_venta').annotate(cantidad=Count('id'), monto=Sum('total')):
+        dia = dias.setdefault(fila['fecha_venta'], GananciaDia(dia=fila['fecha_venta']))
+        dia.total_registros_venta = fila['cantidad']
+        dia.ganancia_registros_venta = fila['monto'] or Decimal('0.00')
+
+    meses = {}
+    for dia in dias.values():
+        mes = dia.dia.replace(day=1)
+        if mes not in meses:
+            meses[mes], _ = GananciaMes.objects.get_or_create(mes=mes)
+        dia.ganancia_mes = meses[mes]
+        dia.ganancia_total = dia.ganancia_reservas + dia.ganancia_registros_venta
+    GananciaDia.objects.bulk_create(dias.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tabla', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GananciaDia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField(unique=True)),
+                ('total_reservas', models.IntegerField(default=0)),
+                ('total_registros_venta', models.IntegerField(default=0)),
+                ('ganancia_reservas', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=10)),
+                ('ganancia_registros_venta', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=10)),
+                ('ganancia_total', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=10)),
+                ('ganancia_mes', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='dias', to='tabla.gananciames')),
+            ],
+            options={
+                'ordering': ['dia'],
+            },
+        ),
+        migrations.RunPython(poblar_ganancias_dia, migrations.RunPython.noop),
+    ]
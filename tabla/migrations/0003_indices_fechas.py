@@ -0,0 +1,35 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tabla', '0002_gananciadia'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notificacionmovil',
+            index=models.Index(fields=['usuario', 'fecha'], name='tabla_notif_usuario_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notificacionmovil',
+            index=models.Index(fields=['fecha'], name='tabla_notif_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comentariocalificacion',
+            index=models.Index(fields=['fecha'], name='tabla_comentario_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='registrodeventa',
+            index=models.Index(fields=['fecha_venta'], name='tabla_venta_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservademesa',
+            index=models.Index(fields=['fecha_reg'], name='tabla_reserva_fecha_reg_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservademesa',
+            index=models.Index(fields=['fecha', 'numero_mesa', 'hora'], name='tabla_reserva_mesa_idx'),
+        ),
+    ]
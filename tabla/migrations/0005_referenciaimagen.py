@@ -0,0 +1,51 @@
+from collections import Counter
+
+import tabla.models
+import tabla.storage
+from django.db import migrations, models
+from django.db.models import Count
+
+MODELOS_CON_IMAGEN = ('Plato', 'PromocionDePlato', 'Bebida', 'Entrada')
+
+
+def contar_referencias(apps, schema_editor):
+    # Las imágenes ya subidas conservan su nombre; solo se cuentan sus usos
+    ReferenciaImagen = apps.get_model('tabla', 'ReferenciaImagen')
+    referencias = Counter()
+    for nombre_modelo in MODELOS_CON_IMAGEN:
+        modelo = apps.get_model('tabla', nombre_modelo)
+        filas = modelo.objects.exclude(imagen='').exclude(imagen__isnull=True).values('imagen').annotate(cantidad=Count('id'))
+        for fila in filas:
+            referencias[fila['imagen']] += fila['cantidad']
+    ReferenciaImagen.objects.bulk_create(
+        [ReferenciaImagen(nombre=nombre, referencias=cantidad) for nombre, cantidad in referencias.items()],
+        batch_size=500,
+    )
+
+
+def campo_imagen():
+    return models.ImageField(blank=True, null=True, storage=tabla.storage.AlmacenamientoPorContenido(),
+                             upload_to=tabla.models.get_upload_path)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tabla', '0004_trabajoreporte'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReferenciaImagen',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=255, unique=True)),
+                ('referencias', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterField(model_name='bebida', name='imagen', field=campo_imagen()),
+        migrations.AlterField(model_name='entrada', name='imagen', field=campo_imagen()),
+        migrations.AlterField(model_name='plato', name='imagen', field=campo_imagen()),
+        migrations.AlterField(model_name='promociondeplato', name='imagen', field=campo_imagen()),
+        migrations.RunPython(contar_referencias, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,61 @@
+import datetime
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def turnos_de_reserva(fecha, hora):
+    # Copia de tabla.models.turnos_de_reserva al crear esta migración: las
+    # migraciones no deben depender del código actual de los modelos
+    intervalo = getattr(settings, 'RESERVA_INTERVALO_MINUTOS', 30)
+    inicio = datetime.datetime.combine(fecha, hora)
+    fin = inicio + datetime.timedelta(minutes=getattr(settings, 'RESERVA_DURACION_MINUTOS', 120))
+    minutos = (hora.hour * 60 + hora.minute) // intervalo * intervalo
+    actual = datetime.datetime.combine(fecha, datetime.time()) + datetime.timedelta(minutes=minutos)
+    turnos = []
+    while actual < fin:
+        turnos.append((actual.date(), actual.time()))
+        actual += datetime.timedelta(minutes=intervalo)
+    return turnos
+
+
+def ocupar_turnos(apps, schema_editor):
+    # Las reservas solapadas que ya existan se conservan: la primera en orden
+    # de id se queda con las franjas en conflicto
+    ReservaDeMesa = apps.get_model('tabla', 'ReservaDeMesa')
+    TurnoMesa = apps.get_model('tabla', 'TurnoMesa')
+    turnos = []
+    for reserva in ReservaDeMesa.objects.order_by('id').only('id', 'numero_mesa', 'fecha', 'hora').iterator(chunk_size=2000):
+        turnos.extend(
+            TurnoMesa(reserva_id=reserva.pk, numero_mesa=reserva.numero_mesa, fecha=fecha, inicio=inicio)
+            for fecha, inicio in turnos_de_reserva(reserva.fecha, reserva.hora)
+        )
+        if len(turnos) >= 2000:
+            TurnoMesa.objects.bulk_create(turnos, ignore_conflicts=True)
+            turnos = []
+    TurnoMesa.objects.bulk_create(turnos, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tabla', '0005_referenciaimagen'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TurnoMesa',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('numero_mesa', models.IntegerField()),
+                ('fecha', models.DateField()),
+                ('inicio', models.TimeField()),
+                ('reserva', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='turnos', to='tabla.reservademesa')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('fecha', 'inicio', 'numero_mesa'), name='tabla_turno_mesa_unico')],
+            },
+        ),
+        migrations.RunPython(ocupar_turnos, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,61 @@
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+
+def campos_contador():
+    return [
+        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+        ('estrellas_1', models.PositiveIntegerField(default=0)),
+        ('estrellas_2', models.PositiveIntegerField(default=0)),
+        ('estrellas_3', models.PositiveIntegerField(default=0)),
+        ('estrellas_4', models.PositiveIntegerField(default=0)),
+        ('estrellas_5', models.PositiveIntegerField(default=0)),
+        ('cantidad', models.PositiveIntegerField(default=0)),
+        ('suma', models.PositiveIntegerField(default=0)),
+    ]
+
+
+def poblar_resumen(apps, schema_editor):
+    ComentarioCalificacion = apps.get_model('tabla', 'ComentarioCalificacion')
+    CalificacionDia = apps.get_model('tabla', 'CalificacionDia')
+    ResumenCalificacion = apps.get_model('tabla', 'ResumenCalificacion')
+
+    resumen = ResumenCalificacion(pk=1)
+    dias = {}
+    filas = (ComentarioCalificacion.objects.annotate(dia=TruncDate('fecha'))
+             .values('dia', 'calificacion').annotate(n=Count('id')).order_by())
+    for fila in filas:
+        dia = dias.setdefault(fila['dia'], CalificacionDia(dia=fila['dia']))
+        campo = f'estrellas_{fila["calificacion"]}'
+        for contador in (dia, resumen):
+            setattr(contador, campo, getattr(contador, campo) + fila['n'])
+            contador.cantidad += fila['n']
+            contador.suma += fila['n'] * fila['calificacion']
+    CalificacionDia.objects.bulk_create(dias.values(), batch_size=500)
+    resumen.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tabla', '0006_turnomesa'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CalificacionDia',
+            fields=campos_contador() + [('dia', models.DateField(unique=True))],
+            options={
+                'ordering': ['dia'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ResumenCalificacion',
+            fields=campos_contador(),
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.RunPython(poblar_resumen, migrations.RunPython.noop),
+    ]
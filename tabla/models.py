@@ -1,16 +1,19 @@
+import datetime
 import os
+import uuid
 from decimal import Decimal
-from django.db import models
-from django.db.models import Sum
 from django.conf import settings
-from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, connection, models, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
 from django.core.exceptions import ValidationError
-from django.contrib.auth.hashers import make_password, check_password
+from django.contrib.auth.hashers import make_password
+from .cache import invalidar_grafico_ganancias
+from .storage import AlmacenamientoPorContenido
 
-# Define a custom storage location for uploaded images
-image_storage = FileSystemStorage(
-    location=settings.MEDIA_ROOT,
-)
+# Imágenes guardadas bajo el hash de su contenido, en MEDIA_ROOT
+image_storage = AlmacenamientoPorContenido()
 
 # Function to generate upload path based on model name
 def get_upload_path(instance, filename):
@@ -18,6 +21,173 @@ def get_upload_path(instance, filename):
     return os.path.join('images', model_name, filename)
 
 
+def _a_decimal(valor):
+    return Decimal(str(valor)) if valor is not None else Decimal('0.00')
+
+
+def siguiente_mes(fecha):
+    return (fecha.replace(day=1) + datetime.timedelta(days=32)).replace(day=1)
+
+
+def upsert_en_bloque(modelo, objetos, unicos, campos, batch_size=500):
+    # INSERT ... ON CONFLICT UPDATE. MySQL (ON DUPLICATE KEY UPDATE) no admite
+    # indicar la columna única y Django rechaza unique_fields allí: se omite y
+    # el conflicto lo resuelve cualquier clave única de la tabla.
+    opciones = {'update_conflicts': True, 'update_fields': campos}
+    if connection.features.supports_update_conflicts_with_target:
+        opciones['unique_fields'] = unicos
+    return modelo.objects.bulk_create(objetos, batch_size=batch_size, **opciones)
+
+
+def capacidades():
+    """{numero_mesa: capacidad} según MESAS_CAPACIDAD."""
+    return {int(mesa): capacidad for mesa, capacidad in getattr(settings, 'MESAS_CAPACIDAD', {}).items()}
+
+
+def turnos_de_reserva(fecha, hora):
+    # Franjas de RESERVA_INTERVALO_MINUTOS que ocupa una reserva que empieza
+    # en fecha/hora y dura RESERVA_DURACION_MINUTOS. Se devuelven como pares
+    # (fecha, inicio) porque una reserva tardía puede pasar al día siguiente.
+    intervalo = getattr(settings, 'RESERVA_INTERVALO_MINUTOS', 30)
+    inicio = datetime.datetime.combine(fecha, hora)
+    fin = inicio + datetime.timedelta(minutes=getattr(settings, 'RESERVA_DURACION_MINUTOS', 120))
+    minutos = (hora.hour * 60 + hora.minute) // intervalo * intervalo
+    actual = datetime.datetime.combine(fecha, datetime.time()) + datetime.timedelta(minutes=minutos)
+    turnos = []
+    while actual < fin:
+        turnos.append((actual.date(), actual.time()))
+        actual += datetime.timedelta(minutes=intervalo)
+    return turnos
+
+
+class MesaNoDisponible(ValidationError):
+    pass
+
+
+class MovimientoGananciaMixin:
+    # Mantiene GananciaMes al día aplicando deltas en cada escritura, en vez de
+    # recalcular el mes completo. Las subclases indican qué campos usar.
+    campo_fecha = None
+    campo_monto = None
+    tipo_ganancia = None  # 'reservas' o 'ventas'
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Valores con los que se leyó la fila, para calcular el delta al guardar
+        instance._movimiento_original = (
+            instance.__dict__.get(cls.campo_fecha),
+            instance.__dict__.get(cls.campo_monto),
+        )
+        return instance
+
+    def _movimiento_anterior(self):
+        if self._state.adding:
+            return None
+        fecha, monto = getattr(self, '_movimiento_original', (None, None))
+        if fecha is None or monto is None:
+            fecha, monto = type(self).objects.filter(pk=self.pk).values_list(
+                self.campo_fecha, self.campo_monto).first() or (None, None)
+            if fecha is None:
+                return None
+        return fecha, _a_decimal(monto)
+
+    def _movimiento_actual(self):
+        return getattr(self, self.campo_fecha), _a_decimal(getattr(self, self.campo_monto))
+
+    def save(self, *args, registrar_movimiento=True, **kwargs):
+        if not registrar_movimiento:
+            # Quien llama se encarga de aplicar el delta (p. ej. cargas en lote)
+            return super().save(*args, **kwargs)
+        anterior = self._movimiento_anterior()
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            actual = self._movimiento_actual()
+            if anterior is None:
+                GananciaMes.aplicar_delta(actual[0], self.tipo_ganancia, 1, actual[1])
+            elif anterior[0] == actual[0]:
+                if anterior[1] != actual[1]:
+                    GananciaMes.aplicar_delta(actual[0], self.tipo_ganancia, 0, actual[1] - anterior[1])
+            else:
+                GananciaMes.aplicar_delta(anterior[0], self.tipo_ganancia, -1, -anterior[1])
+                GananciaMes.aplicar_delta(actual[0], self.tipo_ganancia, 1, actual[1])
+        self._movimiento_original = actual
+
+    def revertir_movimiento(self):
+        # Se llama desde la señal post_delete (ver signals.py). Se resta lo que
+        # estaba guardado, no lo que se haya cambiado en memoria sin guardar
+        fecha, monto = getattr(self, '_movimiento_original', (None, None))
+        if fecha is None or monto is None:
+            fecha, monto = self._movimiento_actual()
+        GananciaMes.aplicar_delta(fecha, self.tipo_ganancia, -1, -_a_decimal(monto))
+
+
+class ImagenReferenciadaMixin:
+    # Lleva la cuenta de filas que usan cada archivo de imagen (ReferenciaImagen),
+    # para borrar el archivo cuando la última lo reemplaza o se elimina.
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'imagen' in instance.__dict__:
+            instance._imagen_original = instance.__dict__['imagen'] or ''
+        return instance
+
+    def _imagen_anterior(self):
+        if self._state.adding:
+            return ''
+        nombre = getattr(self, '_imagen_original', None)
+        if nombre is None:
+            nombre = type(self).objects.filter(pk=self.pk).values_list('imagen', flat=True).first()
+        return getattr(nombre, 'name', nombre) or ''
+
+    def save(self, *args, **kwargs):
+        anterior = self._imagen_anterior()
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            actual = self.imagen.name or ''
+            if actual != anterior:
+                ReferenciaImagen.sumar(actual, 1)
+                ReferenciaImagen.sumar(anterior, -1)
+        self._imagen_original = actual
+
+    def liberar_imagen(self):
+        # Se llama desde la señal post_delete (ver signals.py)
+        ReferenciaImagen.sumar(self.imagen.name, -1)
+
+
+class ReferenciaImagen(models.Model):
+    nombre = models.CharField(max_length=255, unique=True)
+    referencias = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.nombre} ({self.referencias})'
+
+    @classmethod
+    def sumar(cls, nombre, cantidad):
+        if not nombre:
+            return
+        if not cls.objects.filter(nombre=nombre).update(referencias=F('referencias') + cantidad):
+            if cantidad <= 0:
+                return
+            referencia, creada = cls.objects.get_or_create(nombre=nombre, defaults={'referencias': cantidad})
+            if not creada:
+                cls.objects.filter(pk=referencia.pk).update(referencias=F('referencias') + cantidad)
+        elif cantidad < 0 and cls.objects.filter(nombre=nombre, referencias__lte=0).delete()[0]:
+            transaction.on_commit(lambda: cls.borrar_si_huerfano(nombre))
+
+    @classmethod
+    def borrar_si_huerfano(cls, nombre):
+        # Se comprueba de nuevo: otra subida del mismo contenido pudo volver a
+        # referenciar el archivo antes del commit
+        if cls.objects.filter(nombre=nombre).exists():
+            return False
+        from .imagenes import borrar_derivados
+        image_storage.delete(nombre)
+        borrar_derivados(nombre, image_storage)
+        return True
+
+
 class Usuario(models.Model):
     nombre = models.CharField(max_length=100)
     apellido = models.CharField(max_length=100)
@@ -25,11 +195,23 @@ class Usuario(models.Model):
     nombre_usuario = models.CharField(max_length=50, unique=True)
     contraseña = models.CharField(max_length=128)
 
-    def save(self, *args, **kwargs):
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Hash con el que se leyó la fila: si no cambia, no hay nada que hashear
+        instance._contraseña_original = instance.__dict__.get('contraseña')
+        return instance
 
-        if not self.pk or not check_password(self.contraseña, Usuario.objects.get(pk=self.pk).contraseña):
-            self.contraseña = make_password(self.contraseña)
+    def save(self, *args, **kwargs):
+        # Toda contraseña nueva se hashea, aunque parezca un hash. Solo quien ya
+        # la hasheó (p. ej. importar_usuarios) puede marcarla con _contraseña_hasheada.
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'contraseña' in update_fields:
+            if self.contraseña != getattr(self, '_contraseña_original', None) and not getattr(self, '_contraseña_hasheada', False):
+                self.contraseña = make_password(self.contraseña)
         super().save(*args, **kwargs)
+        self._contraseña_original = self.contraseña
+        self._contraseña_hasheada = False
 
     def __str__(self):
         return f'{self.nombre} {self.apellido}'
@@ -46,16 +228,44 @@ class NotificacionMovil(models.Model):
     mensaje = models.TextField()
     fecha = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['usuario', 'fecha'], name='tabla_notif_usuario_fecha_idx'),
+            models.Index(fields=['fecha'], name='tabla_notif_fecha_idx'),
+        ]
+
     def __str__(self):
         return f'{self.titulo} - {self.usuario.nombre_usuario}'
 
     @classmethod
-    def enviar_a_todos(cls, titulo, mensaje):
-        usuarios = Usuario.objects.all()
-        for usuario in usuarios:
-            cls.objects.create(usuario=usuario, titulo=titulo, mensaje=mensaje)
-
-class Plato(models.Model):
+    def enviar_a_todos(cls, titulo, mensaje, tamano_lote=2000, progreso=None, en_segundo_plano=False):
+        # Recorre los ids de usuario en bloques y crea las notificaciones con
+        # bulk_create, así la memoria no crece con la cantidad de usuarios.
+        # Devuelve la cantidad de notificaciones creadas, o un Future si se
+        # ejecuta en segundo plano. `progreso` recibe el total acumulado.
+        if en_segundo_plano:
+            from .tareas import en_segundo_plano as ejecutar
+            return ejecutar(cls.enviar_a_todos, titulo, mensaje, tamano_lote=tamano_lote, progreso=progreso)
+
+        enviadas = 0
+        lote = []
+        ids = Usuario.objects.order_by().values_list('pk', flat=True).iterator(chunk_size=tamano_lote)
+        for usuario_id in ids:
+            lote.append(cls(usuario_id=usuario_id, titulo=titulo, mensaje=mensaje))
+            if len(lote) >= tamano_lote:
+                cls.objects.bulk_create(lote)
+                enviadas += len(lote)
+                lote = []
+                if progreso:
+                    progreso(enviadas)
+        if lote:
+            cls.objects.bulk_create(lote)
+            enviadas += len(lote)
+            if progreso:
+                progreso(enviadas)
+        return enviadas
+
+class Plato(ImagenReferenciadaMixin, models.Model):
     nombre = models.CharField(max_length=100)
     descripcion = models.TextField()
     categoria = models.ForeignKey(Categoria, on_delete=models.CASCADE)
@@ -65,7 +275,7 @@ class Plato(models.Model):
     def __str__(self):
         return self.nombre
 
-class PromocionDePlato(models.Model):
+class PromocionDePlato(ImagenReferenciadaMixin, models.Model):
     plato = models.ForeignKey(Plato, on_delete=models.CASCADE)
     enunciado = models.TextField(null=True)
     precio_descuento = models.DecimalField(max_digits=6, decimal_places=2)
@@ -76,12 +286,19 @@ class PromocionDePlato(models.Model):
 
 
 class ComentarioCalificacion(models.Model):
+    # El resumen de calificaciones (ResumenCalificacion, CalificacionDia) se
+    # mantiene con deltas al crear, cambiar o borrar un comentario
     usuario = models.ForeignKey(Usuario, on_delete=models.CASCADE, null=True, blank=True)
     nombre_cliente = models.CharField(max_length=100, null=True, blank=True)
     fecha = models.DateTimeField(auto_now_add=True)
     calificacion = models.IntegerField(choices=[(i, i) for i in range(1, 6)])
     comentario = models.TextField(max_length=200, blank=False, null=False)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['fecha'], name='tabla_comentario_fecha_idx'),
+        ]
+
     def _str_(self):
         if self.usuario:
             return f'{self.usuario.nombre_usuario} - {self.calificacion}'
@@ -102,8 +319,104 @@ class ComentarioCalificacion(models.Model):
             else:
                 self.usuario = None
         
-        # Guardar los cambios
-        super().save(*args, **kwargs)
+        # Guardar los cambios y actualizar el resumen de calificaciones
+        anterior = None
+        if not self._state.adding:
+            anterior = getattr(self, '_calificacion_original', None) or type(self).objects.filter(
+                pk=self.pk).values_list('fecha', 'calificacion').first()
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            actual = (self.fecha, self.calificacion)
+            if anterior != actual:
+                if anterior is not None:
+                    ResumenCalificacion.aplicar_delta(*anterior, -1)
+                ResumenCalificacion.aplicar_delta(*actual, 1)
+        self._calificacion_original = actual
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._calificacion_original = (instance.__dict__.get('fecha'), instance.__dict__.get('calificacion'))
+        return instance
+
+    def revertir_calificacion(self):
+        # Se llama desde la señal post_delete (ver signals.py). Como en
+        # revertir_movimiento, se resta lo guardado y no lo cambiado en memoria
+        fecha, calificacion = getattr(self, '_calificacion_original', None) or (self.fecha, self.calificacion)
+        ResumenCalificacion.aplicar_delta(fecha, calificacion, -1)
+
+class ContadorCalificaciones(models.Model):
+    estrellas_1 = models.PositiveIntegerField(default=0)
+    estrellas_2 = models.PositiveIntegerField(default=0)
+    estrellas_3 = models.PositiveIntegerField(default=0)
+    estrellas_4 = models.PositiveIntegerField(default=0)
+    estrellas_5 = models.PositiveIntegerField(default=0)
+    cantidad = models.PositiveIntegerField(default=0)
+    suma = models.PositiveIntegerField(default=0)
+
+    CAMPOS = ['estrellas_1', 'estrellas_2', 'estrellas_3', 'estrellas_4', 'estrellas_5', 'cantidad', 'suma']
+
+    class Meta:
+        abstract = True
+
+    @staticmethod
+    def delta(calificacion, signo):
+        return {f'estrellas_{calificacion}': signo, 'cantidad': signo, 'suma': signo * calificacion}
+
+    @staticmethod
+    def a_dict(valores):
+        cantidad = valores['cantidad'] or 0
+        return {
+            'cantidad': cantidad,
+            'promedio': round(valores['suma'] / cantidad, 2) if cantidad else None,
+            'distribucion': {str(estrellas): valores[f'estrellas_{estrellas}'] or 0 for estrellas in range(1, 6)},
+        }
+
+
+class ResumenCalificacion(ContadorCalificaciones):
+    # Fila única (pk=1) con los totales históricos
+    @classmethod
+    def aplicar_delta(cls, fecha, calificacion, signo):
+        dia = timezone.localdate(fecha) if timezone.is_aware(fecha) else fecha.date()
+        cambios = {campo: F(campo) + valor for campo, valor in cls.delta(calificacion, signo).items()}
+        for modelo, filtro in ((cls, {'pk': 1}), (CalificacionDia, {'dia': dia})):
+            if not modelo.objects.filter(**filtro).update(**cambios):
+                modelo.objects.get_or_create(**filtro)
+                modelo.objects.filter(**filtro).update(**cambios)
+
+    @classmethod
+    def obtener(cls, dias=None):
+        """Resumen total, o de los últimos ``dias`` días (hoy incluido)."""
+        if dias is None:
+            fila = cls.objects.filter(pk=1).values(*cls.CAMPOS).first()
+            return cls.a_dict(fila or {campo: 0 for campo in cls.CAMPOS})
+        desde = timezone.localdate() - datetime.timedelta(days=dias - 1)
+        return cls.a_dict(CalificacionDia.objects.filter(dia__gte=desde).aggregate(**{campo: Sum(campo) for campo in cls.CAMPOS}))
+
+    @classmethod
+    def recalcular(cls):
+        # Reconstruye el resumen y los días desde los comentarios
+        totales = {campo: 0 for campo in cls.CAMPOS}
+        dias = {}
+        filas = (ComentarioCalificacion.objects.annotate(dia=TruncDate('fecha'))
+                 .values('dia', 'calificacion').annotate(n=Count('id')).order_by())
+        for fila in filas:
+            dia = dias.setdefault(fila['dia'], CalificacionDia(dia=fila['dia']))
+            for campo, valor in cls.delta(fila['calificacion'], fila['n']).items():
+                setattr(dia, campo, getattr(dia, campo) + valor)
+                totales[campo] += valor
+        with transaction.atomic():
+            CalificacionDia.objects.all().delete()
+            CalificacionDia.objects.bulk_create(dias.values(), batch_size=500)
+            cls.objects.update_or_create(pk=1, defaults=totales)
+
+
+class CalificacionDia(ContadorCalificaciones):
+    dia = models.DateField(unique=True)
+
+    class Meta:
+        ordering = ['dia']
+
 
 class Cliente(models.Model):
     nombre = models.CharField(max_length=100)
@@ -113,7 +426,7 @@ class Cliente(models.Model):
     def __str__(self):
         return f'{self.nombre} {self.apellido}'
 
-class Bebida(models.Model):
+class Bebida(ImagenReferenciadaMixin, models.Model):
     nombre = models.CharField(max_length=100)
     precio = models.DecimalField(max_digits=6, decimal_places=2)
     imagen = models.ImageField(upload_to=get_upload_path, storage=image_storage, blank=True, null=True)
@@ -121,7 +434,7 @@ class Bebida(models.Model):
     def __str__(self):
         return self.nombre
 
-class Entrada(models.Model):
+class Entrada(ImagenReferenciadaMixin, models.Model):
     nombre = models.CharField(max_length=100)
     precio = models.DecimalField(max_digits=6, decimal_places=2)
     imagen = models.ImageField(upload_to=get_upload_path, storage=image_storage, blank=True, null=True)
@@ -138,7 +451,7 @@ class Contacto(models.Model):
         return f'{self.nombre} - {self.correo_electronico}'
 
 
-class RegistroDeVenta(models.Model):
+class RegistroDeVenta(MovimientoGananciaMixin, models.Model):
     cliente = models.ForeignKey('Cliente', on_delete=models.CASCADE)
     platos = models.ManyToManyField('Plato')
     bebidas = models.ManyToManyField('Bebida', blank=True)
@@ -146,15 +459,60 @@ class RegistroDeVenta(models.Model):
     total = models.DecimalField(max_digits=8, decimal_places=2)
     fecha_venta = models.DateField(auto_now_add=True)
 
+    campo_fecha = 'fecha_venta'
+    campo_monto = 'total'
+    tipo_ganancia = 'ventas'
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['fecha_venta'], name='tabla_venta_fecha_idx'),
+        ]
+
+    @staticmethod
+    def prefetch_ids():
+        # Los serializadores y la exportación solo muestran los ids de las
+        # relaciones: una consulta ligera por relación para todo el lote
+        return [
+            models.Prefetch('platos', queryset=Plato.objects.only('id')),
+            models.Prefetch('bebidas', queryset=Bebida.objects.only('id')),
+            models.Prefetch('entradas', queryset=Entrada.objects.only('id')),
+        ]
+
     def __str__(self):
         fecha_formateada = self.fecha_venta.strftime('%Y-%m-%d')
         return f'{self.cliente.nombre} - {fecha_formateada}'
 
-    def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
-        GananciaMes.actualizar_o_crear_ganancia_mes(self.fecha_venta)
-
-class ReservaDeMesa(models.Model):
+    @classmethod
+    def registrar_lote(cls, ventas):
+        # Inserta un lote de ventas ya validadas. Cada venta es un dict con
+        # 'cliente' (instancia), 'total', 'platos', 'bebidas' y 'entradas' (ids).
+        # Las ganancias se actualizan con un delta por día, no por venta.
+        registros = [cls(cliente=venta['cliente'], total=venta['total']) for venta in ventas]
+        with transaction.atomic():
+            if connection.features.can_return_rows_from_bulk_insert:
+                cls.objects.bulk_create(registros)
+            else:
+                # Sin RETURNING (MySQL) no hay ids tras bulk_create; se insertan uno a uno
+                for registro in registros:
+                    registro.save(registrar_movimiento=False)
+
+            for campo, destino in (('platos', 'plato_id'), ('bebidas', 'bebida_id'), ('entradas', 'entrada_id')):
+                through = getattr(cls, campo).through
+                through.objects.bulk_create([
+                    through(registrodeventa_id=registro.pk, **{destino: item})
+                    for registro, venta in zip(registros, ventas)
+                    for item in dict.fromkeys(venta.get(campo, []))
+                ], batch_size=1000)
+
+            por_dia = {}
+            for registro in registros:
+                cantidad, monto = por_dia.get(registro.fecha_venta, (0, Decimal('0.00')))
+                por_dia[registro.fecha_venta] = (cantidad + 1, monto + _a_decimal(registro.total))
+            for fecha, (cantidad, monto) in por_dia.items():
+                GananciaMes.aplicar_delta(fecha, cls.tipo_ganancia, cantidad, monto)
+        return registros
+
+class ReservaDeMesa(MovimientoGananciaMixin, models.Model):
     usuario = models.ForeignKey('Usuario', on_delete=models.CASCADE)
     num_personas = models.IntegerField()
     numero_mesa = models.IntegerField()
@@ -164,14 +522,76 @@ class ReservaDeMesa(models.Model):
     nota = models.TextField(blank=True, null=True)
     fecha_reg = models.DateField(auto_now_add=True)
 
+    campo_fecha = 'fecha_reg'
+    campo_monto = 'precio'
+    tipo_ganancia = 'reservas'
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['fecha_reg'], name='tabla_reserva_fecha_reg_idx'),
+            models.Index(fields=['fecha', 'numero_mesa', 'hora'], name='tabla_reserva_mesa_idx'),
+        ]
+
     def __str__(self):
         return f'Reserva para {self.usuario.nombre} ({self.fecha} - {self.hora})'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._turno_original = (instance.__dict__.get('numero_mesa'), instance.__dict__.get('fecha'),
+                                    instance.__dict__.get('hora'))
+        return instance
+
+    def clean(self):
+        super().clean()
+        self.validar_capacidad()
+
+    def validar_capacidad(self):
+        # En save(): la API, el admin y el ORM respetan MESAS_CAPACIDAD, no solo reservar()
+        capacidad = capacidades().get(self.numero_mesa)
+        if capacidad is None:
+            raise ValidationError(f'La mesa {self.numero_mesa} no existe.')
+        if self.num_personas > capacidad:
+            raise ValidationError(f'La mesa {self.numero_mesa} es para {capacidad} personas como máximo.')
+
     def save(self, *args, **kwargs):
         if self.hora is None:
             raise ValidationError("La hora no puede ser nula.")
-        super().save(*args, **kwargs)
-        GananciaMes.actualizar_o_crear_ganancia_mes(self.fecha_reg)
+        self.validar_capacidad()
+        turno = (self.numero_mesa, self.fecha, self.hora)
+        with transaction.atomic():
+            cambia_turno = self._state.adding or turno != getattr(self, '_turno_original', None)
+            super().save(*args, **kwargs)
+            if cambia_turno:
+                self.ocupar_turnos()
+        self._turno_original = turno
+
+    def ocupar_turnos(self):
+        # La restricción única de TurnoMesa hace de comprobación e inserción
+        # atómica: dos reservas solapadas de la misma mesa no pueden confirmarse
+        # a la vez, aunque lleguen en paralelo.
+        self.turnos.all().delete()
+        try:
+            with transaction.atomic():
+                TurnoMesa.objects.bulk_create([
+                    TurnoMesa(reserva=self, numero_mesa=self.numero_mesa, fecha=fecha, inicio=inicio)
+                    for fecha, inicio in turnos_de_reserva(self.fecha, self.hora)
+                ])
+        except IntegrityError:
+            raise MesaNoDisponible(f'La mesa {self.numero_mesa} ya está reservada el {self.fecha} a las {self.hora:%H:%M}.')
+
+
+class TurnoMesa(models.Model):
+    # Una fila por mesa y franja ocupada (ver turnos_de_reserva)
+    reserva = models.ForeignKey(ReservaDeMesa, on_delete=models.CASCADE, related_name='turnos')
+    numero_mesa = models.IntegerField()
+    fecha = models.DateField()
+    inicio = models.TimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['fecha', 'inicio', 'numero_mesa'], name='tabla_turno_mesa_unico'),
+        ]
 
 
 
@@ -182,52 +602,132 @@ class GananciaMes(models.Model):
     ganancia_reservas = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
     ganancia_registros_venta = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
     ganancia_total = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
-    fechas = []  
-    ganancias_reservas = []  
-    ganancias_ventas = [] 
 
     def __str__(self):
         return f'Ganancias de {self.mes.strftime("%B %Y")}'
 
+    @classmethod
+    def aplicar_delta(cls, fecha, tipo, cantidad, monto):
+        # Suma (o resta) una reserva o venta a los contadores del mes y del día
+        # de forma atómica, sin volver a leer las filas del mes.
+        mes = fecha.replace(day=1)
+        contador = 'total_reservas' if tipo == 'reservas' else 'total_registros_venta'
+        ganancia = 'ganancia_reservas' if tipo == 'reservas' else 'ganancia_registros_venta'
+        cambios = {
+            contador: F(contador) + cantidad,
+            ganancia: F(ganancia) + monto,
+            'ganancia_total': F('ganancia_total') + monto,
+        }
+        if not cls.objects.filter(mes=mes).update(**cambios):
+            cls.objects.get_or_create(mes=mes)
+            cls.objects.filter(mes=mes).update(**cambios)
+        if not GananciaDia.objects.filter(dia=fecha).update(**cambios):
+            GananciaDia.objects.get_or_create(dia=fecha, defaults={'ganancia_mes': cls.objects.get(mes=mes)})
+            GananciaDia.objects.filter(dia=fecha).update(**cambios)
+        # La gráfica cacheada del mes deja de ser válida. El PDF no se toca: su
+        # huella cambia con las cifras y el archivo viejo se borra al generar el nuevo
+        transaction.on_commit(lambda: invalidar_grafico_ganancias(mes))
+
     @classmethod
     def actualizar_o_crear_ganancia_mes(cls, fecha_reg):
+        # Recalculo completo del mes; solo como paso de reparación
         mes = fecha_reg.replace(day=1)
         ganancia_mes, created = cls.objects.get_or_create(mes=mes)
         ganancia_mes.actualizar_ganancias(fecha_reg)
         return ganancia_mes
 
+    def serie_diaria(self):
+        # Días con movimiento y sus ganancias, leídos de la tabla GananciaDia
+        dias = [dia for dia in self.dias.all() if dia.total_reservas or dia.total_registros_venta]
+        fechas = [dia.dia.day for dia in dias]
+        ganancias_reservas = [dia.ganancia_reservas for dia in dias]
+        ganancias_ventas = [dia.ganancia_registros_venta for dia in dias]
+        return fechas, ganancias_reservas, ganancias_ventas
+
     def actualizar_ganancias(self, fecha_reg=None):
-        # Actualizamos las reservas
-        reservas = ReservaDeMesa.objects.filter(fecha_reg__year=self.mes.year, fecha_reg__month=self.mes.month)
-        self.total_reservas = reservas.count()
-        self.ganancia_reservas = reservas.aggregate(Sum('precio'))['precio__sum'] or Decimal('0.00')
-
-        # Actualizamos las ventas
-        ventas = RegistroDeVenta.objects.filter(fecha_venta__year=self.mes.year, fecha_venta__month=self.mes.month)
-        self.total_registros_venta = ventas.count()
-        self.ganancia_registros_venta = ventas.aggregate(Sum('total'))['total__sum'] or Decimal('0.00')
-
-        # Actualizamos la ganancia total
-        self.ganancia_total = self.ganancia_reservas + self.ganancia_registros_venta
-
-        # Actualizar las listas de fechas y ganancias
-        self.fechas = sorted(list(set(
-            reservas.values_list('fecha_reg__day', flat=True).distinct()
-        ).union(
-            ventas.values_list('fecha_venta__day', flat=True).distinct()
-        )))
-
-        self.ganancias_reservas = [0] * len(self.fechas)
-        self.ganancias_ventas = [0] * len(self.fechas)
-
-        for reserva in reservas:
-            if reserva.fecha_reg.day in self.fechas:
-                index = self.fechas.index(reserva.fecha_reg.day)
-                self.ganancias_reservas[index] += reserva.precio
-
-        for venta in ventas:
-            if venta.fecha_venta.day in self.fechas:
-                index = self.fechas.index(venta.fecha_venta.day)
-                self.ganancias_ventas[index] += venta.total
-
-        self.save()
\ No newline at end of file
+        # Recalcula el mes y sus días a partir de las reservas y ventas
+        GananciaMes.recalcular_rango(self.mes, siguiente_mes(self.mes))
+        self.refresh_from_db()
+
+    @classmethod
+    def recalcular_rango(cls, desde, hasta, batch_size=500):
+        # Reconstruye GananciaMes y GananciaDia para los meses en [desde, hasta)
+        # con una consulta agrupada por tabla de origen y upserts en bloque.
+        # Devuelve la cantidad de reservas y ventas procesadas.
+        reservas = ReservaDeMesa.objects.filter(fecha_reg__gte=desde, fecha_reg__lt=hasta)
+        ventas = RegistroDeVenta.objects.filter(fecha_venta__gte=desde, fecha_venta__lt=hasta)
+
+        dias = {}
+        for fila in reservas.values('fecha_reg').annotate(cantidad=Count('id'), monto=Sum('precio')).order_by():
+            dia = dias.setdefault(fila['fecha_reg'], GananciaDia(dia=fila['fecha_reg']))
+            dia.total_reservas = fila['cantidad']
+            dia.ganancia_reservas = fila['monto'] or Decimal('0.00')
+        for fila in ventas.values('fecha_venta').annotate(cantidad=Count('id'), monto=Sum('total')).order_by():
+            dia = dias.setdefault(fila['fecha_venta'], GananciaDia(dia=fila['fecha_venta']))
+            dia.total_registros_venta = fila['cantidad']
+            dia.ganancia_registros_venta = fila['monto'] or Decimal('0.00')
+
+        # Los meses ya existentes en el rango se reescriben aunque hayan quedado sin movimiento
+        meses = {mes: cls(mes=mes) for mes in cls.objects.filter(mes__gte=desde, mes__lt=hasta).values_list('mes', flat=True)}
+        for dia in dias.values():
+            dia.ganancia_total = dia.ganancia_reservas + dia.ganancia_registros_venta
+            mes = meses.setdefault(dia.dia.replace(day=1), cls(mes=dia.dia.replace(day=1)))
+            mes.total_reservas += dia.total_reservas
+            mes.ganancia_reservas += dia.ganancia_reservas
+            mes.total_registros_venta += dia.total_registros_venta
+            mes.ganancia_registros_venta += dia.ganancia_registros_venta
+            mes.ganancia_total += dia.ganancia_total
+
+        campos = ['total_reservas', 'total_registros_venta', 'ganancia_reservas',
+                  'ganancia_registros_venta', 'ganancia_total']
+        with transaction.atomic():
+            upsert_en_bloque(cls, meses.values(), ['mes'], campos, batch_size)
+            ids = dict(cls.objects.filter(mes__gte=desde, mes__lt=hasta).values_list('mes', 'id'))
+            for dia in dias.values():
+                dia.ganancia_mes_id = ids[dia.dia.replace(day=1)]
+            sobrantes = [
+                pk for pk, fecha in GananciaDia.objects.filter(dia__gte=desde, dia__lt=hasta).values_list('pk', 'dia')
+                if fecha not in dias
+            ]
+            for inicio in range(0, len(sobrantes), batch_size):
+                GananciaDia.objects.filter(pk__in=sobrantes[inicio:inicio + batch_size]).delete()
+            upsert_en_bloque(GananciaDia, sorted(dias.values(), key=lambda dia: dia.dia), ['dia'],
+                             ['ganancia_mes'] + campos, batch_size)
+            transaction.on_commit(lambda: invalidar_grafico_ganancias(*meses))
+        return sum(dia.total_reservas + dia.total_registros_venta for dia in dias.values())
+
+
+class GananciaDia(models.Model):
+    ganancia_mes = models.ForeignKey(GananciaMes, on_delete=models.CASCADE, related_name='dias')
+    dia = models.DateField(unique=True)
+    total_reservas = models.IntegerField(default=0)
+    total_registros_venta = models.IntegerField(default=0)
+    ganancia_reservas = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
+    ganancia_registros_venta = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
+    ganancia_total = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
+
+    class Meta:
+        ordering = ['dia']
+
+    def __str__(self):
+        return f'Ganancias del {self.dia.strftime("%d/%m/%Y")}'
+
+
+
+class TrabajoReporte(models.Model):
+    PENDIENTE = 'pendiente'
+    TERMINADO = 'terminado'
+    ERROR = 'error'
+    ESTADOS = [(PENDIENTE, 'Pendiente'), (TERMINADO, 'Terminado'), (ERROR, 'Error')]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    ganancia_mes = models.ForeignKey(GananciaMes, on_delete=models.CASCADE, related_name='trabajos_reporte')
+    huella = models.CharField(max_length=64)
+    estado = models.CharField(max_length=10, choices=ESTADOS, default=PENDIENTE)
+    archivo = models.CharField(max_length=255, blank=True)
+    error = models.TextField(blank=True)
+    creado = models.DateTimeField(auto_now_add=True)
+    terminado = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f'Reporte de {self.ganancia_mes} ({self.estado})'
@@ -0,0 +1,70 @@
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from rest_framework.pagination import CursorPagination
+
+
+class PaginacionPorCursor(CursorPagination):
+    # Paginación por cursor (keyset): no ejecuta COUNT(*) y el costo de la
+    # página 10.000 es el mismo que el de la primera. Cada viewset puede
+    # indicar su orden con `orden_cursor`. DRF arma el cursor solo con el
+    # primer campo y desempata con un desplazamiento limitado a offset_cutoff,
+    # así que ese campo debe ser único e indexado (p. ej. el id): con miles de
+    # filas en la misma fecha se repetirían filas y el `next` no terminaría.
+    ordering = 'id'
+    page_size_query_param = 'tamano'
+    max_page_size = getattr(settings, 'API_TAMANO_PAGINA_MAXIMO', 500)
+
+    def get_ordering(self, request, queryset, view):
+        ordering = getattr(view, 'orden_cursor', None) or super().get_ordering(request, queryset, view)
+        campo = queryset.model._meta.get_field(ordering[0].lstrip('-'))
+        if not campo.unique:
+            raise ImproperlyConfigured(
+                f'{type(view).__name__}: el primer campo de orden_cursor ({ordering[0]}) debe ser único.')
+        return ordering
+
+
+def conteo_estimado(modelo, using='default'):
+    """Filas de la tabla según las estadísticas del motor, sin recorrerla.
+
+    Devuelve None si el motor no tiene estimación (en SQLite, hasta que se
+    ejecute ANALYZE).
+    """
+    tabla = modelo._meta.db_table
+    conexion = connections[using]
+    with conexion.cursor() as cursor:
+        if conexion.vendor == 'mysql':
+            cursor.execute('SELECT table_rows FROM information_schema.tables '
+                           'WHERE table_schema = DATABASE() AND table_name = %s', [tabla])
+        elif conexion.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)', [tabla])
+        elif conexion.vendor == 'sqlite':
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'")
+            if cursor.fetchone() is None:
+                return None
+            # Cada fila es "filas [filas por valor...]" de un índice de la tabla
+            # (o de la tabla misma si no tiene índices); CAST toma el primer número
+            cursor.execute('SELECT MAX(CAST(stat AS INTEGER)) FROM sqlite_stat1 WHERE tbl = %s', [tabla])
+        else:
+            return None
+        fila = cursor.fetchone()
+    if fila is None or fila[0] is None:
+        return None
+    # reltuples es -1 en PostgreSQL si la tabla nunca se analizó
+    return int(fila[0]) if fila[0] >= 0 else None
+
+
+class PaginadorEstimado(Paginator):
+    # Para los changelists del admin: sin filtros, una tabla que según las
+    # estadísticas supera ADMIN_CONTEO_EXACTO_MAXIMO filas se cuenta con la
+    # estimación del motor en lugar de un COUNT(*) que la recorre entera.
+    @cached_property
+    def count(self):
+        consulta = getattr(self.object_list, 'query', None)
+        if consulta is not None and not consulta.where:
+            estimado = conteo_estimado(self.object_list.model, self.object_list.db)
+            if estimado is not None and estimado > getattr(settings, 'ADMIN_CONTEO_EXACTO_MAXIMO', 10000):
+                return estimado
+        return super().count
@@ -0,0 +1,198 @@
+# Generación de los reportes PDF. Este módulo (reportlab, y matplotlib/PIL en
+# grafico_matplotlib) se importa solo cuando se genera un reporte.
+import io
+from io import BytesIO
+
+from django.conf import settings
+from reportlab.lib.pagesizes import letter
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Image, Paragraph, Spacer
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib import colors
+from reportlab.lib.units import inch
+from reportlab.graphics.charts.barcharts import VerticalBarChart
+from reportlab.graphics.charts.legends import Legend
+from reportlab.graphics.shapes import Drawing, Group, String
+
+# Mismos colores que la paleta por defecto de matplotlib
+COLOR_RESERVAS = colors.HexColor('#1f77b4')
+COLOR_VENTAS = colors.HexColor('#ff7f0e')
+
+def estilo_tabla():
+    return TableStyle([
+        ('BACKGROUND', (0,0), (-1,0), colors.grey),
+        ('TEXTCOLOR', (0,0), (-1,0), colors.whitesmoke),
+        ('ALIGN', (0,0), (-1,-1), 'CENTER'),
+        ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0,0), (-1,0), 12),
+        ('BOTTOMPADDING', (0,0), (-1,0), 12),
+        ('BACKGROUND', (0,1), (-1,-2), colors.beige),
+        ('BACKGROUND', (0,-1), (-1,-1), colors.lightgrey),
+        ('GRID', (0,0), (-1,-1), 1, colors.black),
+        ('FONTNAME', (0,-1), (-1,-1), 'Helvetica-Bold'),
+        ('ALIGN', (1,1), (-1,-1), 'RIGHT'),
+    ])
+
+def generar_pdf(ganancia_mes):
+    fechas, ganancias_reservas, ganancias_ventas = ganancia_mes.serie_diaria()
+    return generar_pdf_desde_datos(ganancia_mes.mes, fechas, ganancias_reservas, ganancias_ventas)
+
+def generar_pdf_desde_datos(mes, fechas, ganancias_reservas, ganancias_ventas, grafico=None):
+    # Solo recibe datos simples, así puede ejecutarse en otro proceso sin acceso a la base de datos
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter, topMargin=0.5*inch, bottomMargin=0.5*inch)
+    elements = []
+    styles = getSampleStyleSheet()
+
+    # Gráfica de barras: vectorial con reportlab (por defecto) o imagen de matplotlib
+    grafico = grafico or getattr(settings, 'REPORTES_GRAFICO', 'reportlab')
+    if grafico == 'matplotlib':
+        elements.append(grafico_matplotlib(mes, fechas, ganancias_reservas, ganancias_ventas))
+    else:
+        elements.append(grafico_reportlab(mes, fechas, ganancias_reservas, ganancias_ventas))
+    elements.append(Spacer(1, 0.25*inch))
+
+    # Crear la tabla de datos
+    data = [['Día', 'Reservas', 'Ventas', 'Total']]
+    for fecha, reserva, venta in zip(fechas, ganancias_reservas, ganancias_ventas):
+        total = reserva + venta
+        data.append([fecha, f"s/ {reserva:.2f}", f"s/ {venta:.2f}", f"s/ {total:.2f}"])
+    
+    # Añadir fila de totales
+    total_reservas = sum(ganancias_reservas)
+    total_ventas = sum(ganancias_ventas)
+    total_general = total_reservas + total_ventas
+    data.append(['Total', f"s/ {total_reservas:.2f}", f"s/ {total_ventas:.2f}", f"s/ {total_general:.2f}"])
+
+    table = Table(data, colWidths=[1*inch, 2*inch, 2*inch, 2*inch])
+    table.setStyle(estilo_tabla())
+    elements.append(table)
+
+    doc.build(elements)
+    buffer.seek(0)
+    return buffer
+
+def grafico_reportlab(mes, fechas, ganancias_reservas, ganancias_ventas, titulo=None, eje_x='Dias del mes'):
+    ancho, alto = 7.5*inch, 3.75*inch
+    dibujo = Drawing(ancho, alto)
+
+    barras = VerticalBarChart()
+    barras.x, barras.y = 50, 45
+    barras.width, barras.height = ancho - 70, alto - 90
+    barras.data = [[float(valor) for valor in ganancias_reservas] or [0],
+                   [float(valor) for valor in ganancias_ventas] or [0]]
+    barras.categoryAxis.categoryNames = [str(fecha) for fecha in fechas] or ['']
+    barras.categoryAxis.labels.angle = 45
+    barras.categoryAxis.labels.boxAnchor = 'ne'
+    barras.categoryAxis.labels.fontName = 'Helvetica'
+    barras.categoryAxis.labels.fontSize = 7
+    barras.valueAxis.valueMin = 0
+    barras.valueAxis.labels.fontName = 'Helvetica'
+    barras.valueAxis.labels.fontSize = 7
+    barras.barSpacing = 1
+    barras.groupSpacing = 4
+    barras.bars[0].fillColor = COLOR_RESERVAS
+    barras.bars[1].fillColor = COLOR_VENTAS
+    barras.bars.strokeColor = None
+    dibujo.add(barras)
+
+    dibujo.add(String(ancho / 2, alto - 14, titulo or f'Ganancias de {mes.strftime("%B %Y")}',
+                      textAnchor='middle', fontName='Helvetica-Bold', fontSize=12))
+    dibujo.add(String(barras.x + barras.width / 2, 5, eje_x, textAnchor='middle', fontName='Helvetica', fontSize=9))
+    etiqueta_y = String(0, 0, 'Ganancia Monto', textAnchor='middle', fontName='Helvetica', fontSize=9)
+    dibujo.add(Group(etiqueta_y, transform=(0, 1, -1, 0, 12, barras.y + barras.height / 2)))
+
+    leyenda = Legend()
+    leyenda.x, leyenda.y = ancho - 10, alto - 26
+    leyenda.boxAnchor = 'ne'
+    leyenda.alignment = 'right'
+    leyenda.columnMaximum = 1
+    leyenda.fontName = 'Helvetica'
+    leyenda.fontSize = 8
+    leyenda.colorNamePairs = [(COLOR_RESERVAS, 'Reservas'), (COLOR_VENTAS, 'Ventas')]
+    dibujo.add(leyenda)
+    return dibujo
+
+def generar_pdf_rango(desde, hasta, agrupacion, periodos, categorias):
+    # Reporte de un rango arbitrario: serie por periodo y desglose por categoría
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter, topMargin=0.5*inch, bottomMargin=0.5*inch)
+    elements = []
+    styles = getSampleStyleSheet()
+    titulo = f'Ganancias del {desde.strftime("%d/%m/%Y")} al {hasta.strftime("%d/%m/%Y")}'
+
+    # Con demasiados periodos las barras no se leen; en ese caso solo va la tabla
+    if len(periodos) <= 62:
+        elements.append(grafico_reportlab(
+            desde, [fila['periodo'] for fila in periodos],
+            [fila['ganancia_reservas'] for fila in periodos],
+            [fila['ganancia_registros_venta'] for fila in periodos],
+            titulo=titulo, eje_x='Periodo'))
+    else:
+        elements.append(Paragraph(titulo, styles['Title']))
+    elements.append(Spacer(1, 0.25*inch))
+
+    data = [['Periodo', 'Reservas', 'Ventas', 'Total']]
+    for fila in periodos:
+        data.append([fila['periodo'], f"s/ {fila['ganancia_reservas']:.2f}", f"s/ {fila['ganancia_registros_venta']:.2f}",
+                     f"s/ {fila['ganancia_total']:.2f}"])
+    total_reservas = sum(fila['ganancia_reservas'] for fila in periodos)
+    total_ventas = sum(fila['ganancia_registros_venta'] for fila in periodos)
+    data.append(['Total', f"s/ {total_reservas:.2f}", f"s/ {total_ventas:.2f}", f"s/ {total_reservas + total_ventas:.2f}"])
+    table = Table(data, colWidths=[1.5*inch, 2*inch, 2*inch, 2*inch], repeatRows=1)
+    table.setStyle(estilo_tabla())
+    elements.append(table)
+
+    if categorias:
+        elements.append(Spacer(1, 0.25*inch))
+        elements.append(Paragraph('Ventas por categoría (a precio de carta)', styles['Heading2']))
+        data = [['Categoría', 'Cantidad', 'Monto']]
+        for fila in categorias:
+            data.append([fila['categoria'], fila['cantidad'], f"s/ {fila['monto']:.2f}"])
+        data.append(['Total', sum(fila['cantidad'] for fila in categorias),
+                     f"s/ {sum(fila['monto'] for fila in categorias):.2f}"])
+        table = Table(data, colWidths=[3*inch, 1.5*inch, 2*inch], repeatRows=1)
+        table.setStyle(estilo_tabla())
+        elements.append(table)
+
+    doc.build(elements)
+    buffer.seek(0)
+    return buffer
+
+def grafico_matplotlib(mes, fechas, ganancias_reservas, ganancias_ventas):
+    import matplotlib
+    matplotlib.use('Agg')
+    from matplotlib import pyplot as plt
+    from PIL import Image as PILImage
+
+    # Generar la imagen de la gráfica
+    fig, ax = plt.subplots(figsize=(10, 5))
+    x = range(len(fechas))
+    width = 0.10
+    ax.bar([i - width/1 for i in x], ganancias_reservas, width, label='Reservas')
+    ax.bar([i + width/1 for i in x], ganancias_ventas, width, label='Ventas')
+    ax.set_xlabel('Dias del mes')
+    ax.set_ylabel('Ganancia Monto')
+    ax.set_title(f'Ganancias de {mes.strftime("%B %Y")}')
+    ax.set_xticks(x)
+    ax.set_xticklabels(fechas, rotation=45, ha='right')
+    ax.legend()
+    plt.tight_layout()
+    img_buffer = io.BytesIO()
+    fig.savefig(img_buffer, format='png', dpi=300)
+    plt.close(fig)
+    img_buffer.seek(0)
+
+    # Ajustar el tamaño de la imagen
+    img = PILImage.open(img_buffer)
+    max_width = 600
+    img_width, img_height = img.size
+    aspect_ratio = img_height / img_width
+    if img_width > max_width:
+        new_width = max_width
+        new_height = int(new_width * aspect_ratio)
+        img = img.resize((new_width, new_height), PILImage.LANCZOS)
+    img_buffer = io.BytesIO()
+    img.save(img_buffer, format='PNG')
+    img_buffer.seek(0)
+
+    return Image(img_buffer, width=7.5*inch, height=3.75*inch)
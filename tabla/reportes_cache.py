@@ -0,0 +1,90 @@
+import glob
+import hashlib
+import os
+import tempfile
+
+from django.conf import settings
+
+# Incrementar cuando cambie el diseño del PDF, para no servir reportes viejos
+VERSION_REPORTE = 2
+
+
+def directorio():
+    carpeta = getattr(settings, 'REPORTES_CACHE_DIR', os.path.join(settings.BASE_DIR, 'reportes_cache'))
+    os.makedirs(carpeta, exist_ok=True)
+    return carpeta
+
+
+def huella(ganancia_mes):
+    # Hash de las cifras con las que se arma el reporte del mes: si cambia
+    # cualquier venta o reserva del mes, cambia la huella y el archivo
+    fechas, reservas, ventas = ganancia_mes.serie_diaria()
+    datos = [VERSION_REPORTE, getattr(settings, 'REPORTES_GRAFICO', 'reportlab'), ganancia_mes.mes.isoformat(), ganancia_mes.total_reservas,
+             ganancia_mes.total_registros_venta, str(ganancia_mes.ganancia_total),
+             list(zip(fechas, map(str, reservas), map(str, ventas)))]
+    return hashlib.sha256(repr(datos).encode()).hexdigest()
+
+
+def ruta(mes, valor_huella):
+    return os.path.join(directorio(), f'{mes:%Y-%m}-{valor_huella}.pdf')
+
+
+def abrir(ganancia_mes, valor_huella):
+    # Devuelve el PDF ya generado abierto en modo binario, o None
+    destino = ruta(ganancia_mes.mes, valor_huella)
+    try:
+        archivo = open(destino, 'rb')
+    except FileNotFoundError:
+        return None
+    try:
+        # La fecha de modificación marca el último uso para el desalojo LRU
+        os.utime(destino)
+    except FileNotFoundError:
+        pass
+    return archivo
+
+
+def guardar(ganancia_mes, valor_huella, contenido):
+    return guardar_contenido(ganancia_mes.mes, valor_huella, contenido)
+
+
+def guardar_contenido(mes, valor_huella, contenido):
+    destino = ruta(mes, valor_huella)
+    descriptor, temporal = tempfile.mkstemp(dir=directorio(), suffix='.tmp')
+    with os.fdopen(descriptor, 'wb') as archivo:
+        archivo.write(contenido)
+    os.replace(temporal, destino)
+    invalidar(mes, conservar=destino)
+    desalojar()
+    return destino
+
+
+def invalidar(mes, conservar=None):
+    for archivo in glob.glob(os.path.join(directorio(), f'{mes:%Y-%m}-*.pdf')):
+        if archivo != conservar:
+            try:
+                os.remove(archivo)
+            except FileNotFoundError:
+                pass
+
+
+def desalojar():
+    # Borra los reportes menos usados hasta quedar bajo el límite de tamaño
+    limite = getattr(settings, 'REPORTES_CACHE_MAX_BYTES', 200 * 1024 * 1024)
+    archivos = []
+    for entrada in os.scandir(directorio()):
+        if entrada.name.endswith('.pdf'):
+            try:
+                estado = entrada.stat()
+            except FileNotFoundError:
+                continue
+            archivos.append((estado.st_mtime, estado.st_size, entrada.path))
+    total = sum(tamano for _, tamano, _ in archivos)
+    for _, tamano, archivo in sorted(archivos):
+        if total <= limite:
+            break
+        try:
+            os.remove(archivo)
+        except FileNotFoundError:
+            pass
+        total -= tamano
@@ -0,0 +1,139 @@
+import datetime
+from decimal import Decimal
+
+from django.db.models import Count, Sum
+from django.db.models.functions import Trunc
+
+from .models import GananciaDia, RegistroDeVenta
+from .streaming import a_json
+
+AGRUPACIONES = {
+    'dia': 'day',
+    'mes': 'month',
+    'trimestre': 'quarter',
+    'anio': 'year',
+}
+
+CENTIMOS = Decimal('0.01')
+
+CAMPOS = ['total_reservas', 'ganancia_reservas', 'total_registros_venta', 'ganancia_registros_venta', 'ganancia_total']
+
+
+def _monto(valor):
+    # SQLite devuelve las sumas de decimales sin escala fija
+    return (valor or Decimal('0')).quantize(CENTIMOS)
+
+
+def etiqueta_periodo(fecha, agrupacion):
+    if agrupacion == 'mes':
+        return fecha.strftime('%Y-%m')
+    if agrupacion == 'trimestre':
+        return f'{fecha.year}-T{(fecha.month - 1) // 3 + 1}'
+    if agrupacion == 'anio':
+        return str(fecha.year)
+    return fecha.isoformat()
+
+
+def serie_por_periodo(desde, hasta, agrupacion='mes'):
+    # Una consulta agrupada sobre la tabla de días (GananciaDia), recorrida con
+    # iterator() para que un rango de varios años no se cargue entero en memoria
+    dias = (GananciaDia.objects.filter(dia__gte=desde, dia__lte=hasta)
+            .annotate(periodo=Trunc('dia', AGRUPACIONES[agrupacion]))
+            .values('periodo')
+            .annotate(**{campo: Sum(campo) for campo in CAMPOS})
+            .order_by('periodo'))
+    for fila in dias.iterator(chunk_size=500):
+        fila['periodo'] = etiqueta_periodo(fila['periodo'], agrupacion)
+        for campo in CAMPOS:
+            if campo.startswith('ganancia'):
+                fila[campo] = _monto(fila[campo])
+        yield fila
+
+
+def serie_por_categoria(desde, hasta):
+    # Platos vendidos por categoría, más bebidas y entradas, con una consulta
+    # agrupada por tabla intermedia. El monto es a precio de carta, porque el
+    # total de cada venta no está desglosado por ítem.
+    filtro = {'registrodeventa__fecha_venta__gte': desde, 'registrodeventa__fecha_venta__lte': hasta}
+    platos = (RegistroDeVenta.platos.through.objects.filter(**filtro)
+              .values('plato__categoria__nombre')
+              .annotate(cantidad=Count('id'), monto=Sum('plato__precio'))
+              .order_by('plato__categoria__nombre'))
+    for fila in platos.iterator():
+        yield {'categoria': fila['plato__categoria__nombre'], 'cantidad': fila['cantidad'], 'monto': _monto(fila['monto'])}
+    for nombre, campo, precio in (('Bebidas', 'bebidas', 'bebida__precio'), ('Entradas', 'entradas', 'entrada__precio')):
+        fila = getattr(RegistroDeVenta, campo).through.objects.filter(**filtro).aggregate(
+            cantidad=Count('id'), monto=Sum(precio))
+        if fila['cantidad']:
+            yield {'categoria': nombre, 'cantidad': fila['cantidad'], 'monto': _monto(fila['monto'])}
+
+
+def grafico_mes(mes):
+    """Ganancias de cada día del mes (también los días sin movimiento), para la
+    gráfica del changelist de GananciaMes."""
+    siguiente = (mes.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+    dias = (siguiente - mes).days
+    reservas, ventas = [0.0] * dias, [0.0] * dias
+    filas = GananciaDia.objects.filter(dia__gte=mes, dia__lt=siguiente).values_list(
+        'dia', 'ganancia_reservas', 'ganancia_registros_venta')
+    for dia, ganancia_reservas, ganancia_ventas in filas:
+        reservas[dia.day - 1] = float(ganancia_reservas)
+        ventas[dia.day - 1] = float(ganancia_ventas)
+    return {
+        'mes': mes.strftime('%Y-%m'),
+        'titulo': mes.strftime('%B %Y'),
+        'fechas': list(range(1, dias + 1)),
+        'reservas': reservas,
+        'ventas': ventas,
+    }
+
+
+class Totales:
+    # Acumula los totales mientras se recorre la serie, sin guardar las filas
+    def __init__(self):
+        self.valores = {campo: 0 if campo.startswith('total') else Decimal('0.00') for campo in CAMPOS}
+
+    def sumar(self, filas):
+        for fila in filas:
+            for campo in CAMPOS:
+                self.valores[campo] += fila[campo] or 0
+            yield fila
+
+
+def filas_csv(desde, hasta, agrupacion):
+    totales = Totales()
+    yield ['Periodo', 'Reservas', 'Ganancia reservas', 'Ventas', 'Ganancia ventas', 'Ganancia total']
+    for fila in totales.sumar(serie_por_periodo(desde, hasta, agrupacion)):
+        yield [fila['periodo']] + [fila[campo] for campo in CAMPOS]
+    yield ['Total'] + [totales.valores[campo] for campo in CAMPOS]
+    yield []
+    yield ['Categoría', 'Cantidad', 'Monto']
+    for fila in serie_por_categoria(desde, hasta):
+        yield [fila['categoria'], fila['cantidad'], fila['monto']]
+
+
+def fragmentos_json(desde, hasta, agrupacion):
+    # El documento se emite por partes: los totales se conocen al final de la serie
+    totales = Totales()
+    yield f'{{"desde": {a_json(desde)}, "hasta": {a_json(hasta)}, "agrupacion": {a_json(agrupacion)}, "periodos": ['
+    for indice, fila in enumerate(totales.sumar(serie_por_periodo(desde, hasta, agrupacion))):
+        yield (', ' if indice else '') + a_json(fila)
+    yield f'], "totales": {a_json(totales.valores)}, "categorias": ['
+    for indice, fila in enumerate(serie_por_categoria(desde, hasta)):
+        yield (', ' if indice else '') + a_json(fila)
+    yield ']}'
+
+
+def leer_rango(parametros):
+    # Valida desde/hasta (AAAA-MM-DD) y la agrupación; lanza ValueError con un mensaje legible
+    try:
+        desde = datetime.date.fromisoformat(parametros.get('desde', ''))
+        hasta = datetime.date.fromisoformat(parametros.get('hasta', ''))
+    except ValueError:
+        raise ValueError('Indique "desde" y "hasta" con el formato AAAA-MM-DD.')
+    if desde > hasta:
+        raise ValueError('"desde" no puede ser posterior a "hasta".')
+    agrupacion = parametros.get('agrupacion', 'mes')
+    if agrupacion not in AGRUPACIONES:
+        raise ValueError(f'Agrupación inválida; opciones: {", ".join(AGRUPACIONES)}.')
+    return desde, hasta, agrupacion
@@ -1,5 +1,17 @@
 from rest_framework import serializers
-from .models import Usuario, Categoria, NotificacionMovil, ReservaDeMesa, Plato, PromocionDePlato, ComentarioCalificacion, Cliente, RegistroDeVenta, Bebida, Entrada, Contacto, GananciaMes
+from .imagenes import urls_variantes
+from .models import Usuario, Categoria, NotificacionMovil, ReservaDeMesa, Plato, PromocionDePlato, ComentarioCalificacion, Cliente, RegistroDeVenta, Bebida, Entrada, Contacto, GananciaMes, GananciaDia
+
+class VariantesImagenField(serializers.Field):
+    # URLs de las variantes reducidas (tabla/imagenes.py) de un ImageField
+    def __init__(self, **kwargs):
+        kwargs.setdefault('source', 'imagen')
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        request = self.context.get('request')
+        return urls_variantes(value, request.build_absolute_uri if request else None)
 
 class UsuarioSerializer(serializers.ModelSerializer):
     class Meta:
@@ -21,12 +33,23 @@ class ReservaDeMesaSerializer(serializers.ModelSerializer):
         model = ReservaDeMesa
         fields = '__all__'
 
+class ReservarMesaSerializer(serializers.ModelSerializer):
+    # Sin numero_mesa se asigna la mesa libre que mejor se ajuste
+    class Meta:
+        model = ReservaDeMesa
+        fields = ['usuario', 'num_personas', 'fecha', 'hora', 'precio', 'nota', 'numero_mesa']
+        extra_kwargs = {'numero_mesa': {'required': False}, 'num_personas': {'min_value': 1}}
+
 class PlatoSerializer(serializers.ModelSerializer):
+    imagenes = VariantesImagenField()
+
     class Meta:
         model = Plato
         fields = '__all__'
 
 class PromocionDePlatoSerializer(serializers.ModelSerializer):
+    imagenes = VariantesImagenField()
+
     class Meta:
         model = PromocionDePlato
         fields = '__all__'
@@ -49,12 +72,42 @@ class RegistroDeVentaSerializer(serializers.ModelSerializer):
         model = RegistroDeVenta
         fields = '__all__'
 
+class RegistroDeVentaListaSerializer(serializers.ModelSerializer):
+    # Solo lectura, para listados: los ids de las relaciones salen del prefetch
+    platos = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
+    bebidas = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
+    entradas = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
+
+    class Meta:
+        model = RegistroDeVenta
+        fields = '__all__'
+
+class RegistroDeVentaLoteSerializer(serializers.Serializer):
+    # Un elemento del lote de ventas; el cliente se indica por id o por correo
+    cliente = serializers.IntegerField(required=False)
+    correo_electronico = serializers.EmailField(required=False)
+    nombre = serializers.CharField(max_length=100, required=False)
+    apellido = serializers.CharField(max_length=100, required=False)
+    platos = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+    bebidas = serializers.ListField(child=serializers.IntegerField(), required=False, default=list)
+    entradas = serializers.ListField(child=serializers.IntegerField(), required=False, default=list)
+    total = serializers.DecimalField(max_digits=8, decimal_places=2)
+
+    def validate(self, data):
+        if 'cliente' not in data and 'correo_electronico' not in data:
+            raise serializers.ValidationError('Debe indicar el cliente o su correo electrónico.')
+        return data
+
 class BebidaSerializer(serializers.ModelSerializer):
+    imagenes = VariantesImagenField()
+
     class Meta:
         model = Bebida
         fields = '__all__'
 
 class EntradaSerializer(serializers.ModelSerializer):
+    imagenes = VariantesImagenField()
+
     class Meta:
         model = Entrada
         fields = '__all__'
@@ -64,7 +117,45 @@ class ContactoSerializer(serializers.ModelSerializer):
         model = Contacto
         fields = '__all__'
 
+class GananciaDiaSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = GananciaDia
+        exclude = ['id', 'ganancia_mes']
+
+class GananciaMesListaSerializer(serializers.ModelSerializer):
+    # Listado de meses sin el detalle por día
+    class Meta:
+        model = GananciaMes
+        fields = '__all__'
+
 class GananciaMesSerializer(serializers.ModelSerializer):
+    dias = GananciaDiaSerializer(many=True, read_only=True)
+
     class Meta:
         model = GananciaMes
         fields = '__all__'
+
+
+# Serializadores de /api/menu/: categorías con sus platos y las promociones de cada plato
+
+class MenuPromocionSerializer(serializers.ModelSerializer):
+    imagenes = VariantesImagenField()
+
+    class Meta:
+        model = PromocionDePlato
+        fields = ['id', 'enunciado', 'precio_descuento', 'imagen', 'imagenes']
+
+class MenuPlatoSerializer(serializers.ModelSerializer):
+    promociones = MenuPromocionSerializer(many=True, read_only=True, source='promociondeplato_set')
+    imagenes = VariantesImagenField()
+
+    class Meta:
+        model = Plato
+        fields = ['id', 'nombre', 'descripcion', 'precio', 'imagen', 'imagenes', 'promociones']
+
+class MenuCategoriaSerializer(serializers.ModelSerializer):
+    platos = MenuPlatoSerializer(many=True, read_only=True, source='plato_set')
+
+    class Meta:
+        model = Categoria
+        fields = ['id', 'nombre', 'platos']
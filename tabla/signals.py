@@ -0,0 +1,54 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .cache import incrementar_version
+from .imagenes import programar_derivados
+from .models import Bebida, Categoria, ComentarioCalificacion, Entrada, Plato, PromocionDePlato, RegistroDeVenta, ReservaDeMesa
+
+
+@receiver(post_delete, sender=RegistroDeVenta)
+@receiver(post_delete, sender=ReservaDeMesa)
+def revertir_ganancia(sender, instance, **kwargs):
+    # Cubre también los borrados en cascada y por queryset, que no llaman a delete()
+    instance.revertir_movimiento()
+
+
+@receiver(post_delete, sender=ComentarioCalificacion)
+def revertir_calificacion(sender, instance, **kwargs):
+    instance.revertir_calificacion()
+
+
+@receiver(post_save, sender=Plato)
+@receiver(post_save, sender=Bebida)
+@receiver(post_save, sender=Entrada)
+@receiver(post_save, sender=Categoria)
+@receiver(post_save, sender=PromocionDePlato)
+@receiver(post_delete, sender=Plato)
+@receiver(post_delete, sender=Bebida)
+@receiver(post_delete, sender=Entrada)
+@receiver(post_delete, sender=Categoria)
+@receiver(post_delete, sender=PromocionDePlato)
+def invalidar_cache_menu(sender, **kwargs):
+    # Tras el commit, para que nadie guarde en caché datos aún no confirmados
+    # bajo la versión nueva
+    transaction.on_commit(lambda: incrementar_version(sender))
+
+
+@receiver(post_delete, sender=Plato)
+@receiver(post_delete, sender=Bebida)
+@receiver(post_delete, sender=Entrada)
+@receiver(post_delete, sender=PromocionDePlato)
+def liberar_imagen(sender, instance, **kwargs):
+    # Como revertir_ganancia: cubre borrados en cascada y por queryset
+    instance.liberar_imagen()
+
+
+@receiver(post_save, sender=Plato)
+@receiver(post_save, sender=Bebida)
+@receiver(post_save, sender=Entrada)
+@receiver(post_save, sender=PromocionDePlato)
+def generar_variantes_imagen(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and 'imagen' not in update_fields:
+        return
+    # Tras el commit: el archivo ya está escrito y la fila es visible para el pool
+    transaction.on_commit(lambda: programar_derivados(instance.imagen))
@@ -0,0 +1,11 @@
+// Filtros de FiltroAutocompletar (admin.py): el parámetro solo se envía si hay
+// un objeto elegido; vacío, Django lo rechazaría como valor inválido.
+document.addEventListener('submit', function(event) {
+    event.target.querySelectorAll('select[data-parametro]').forEach(function(select) {
+        if (select.value) {
+            select.name = select.dataset.parametro;
+        } else {
+            select.removeAttribute('name');
+        }
+    });
+}, true);
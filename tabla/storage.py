@@ -0,0 +1,77 @@
+import hashlib
+import os
+import re
+import uuid
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+# images/ab/ab12...ef.png y sus variantes, images/ab/derivados/ab12...ef/tarjeta.webp
+PATRON_CONTENIDO = re.compile(
+    r'^[\w-]+/[0-9a-f]{2}/(?:[0-9a-f]{64}\.[a-z0-9]+|derivados/[0-9a-f]{64}/[\w-]+\.[a-z0-9]+)$')
+
+
+def es_nombre_por_contenido(nombre):
+    return bool(nombre) and PATRON_CONTENIDO.match(nombre) is not None
+
+
+@deconstructible
+class AlmacenamientoPorContenido(FileSystemStorage):
+    """Guarda cada archivo bajo el SHA-256 de su contenido.
+
+    Subir dos veces el mismo archivo (aunque sea para modelos distintos) no lo
+    duplica: se devuelve el nombre existente. Como un nombre nunca cambia de
+    contenido, sus URLs pueden cachearse indefinidamente. Quién usa cada
+    archivo se lleva en ``ReferenciaImagen``.
+    """
+
+    def nombre_por_contenido(self, name, content):
+        digest = hashlib.sha256()
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        for bloque in content.chunks():
+            digest.update(bloque)
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        # Se conserva la carpeta raíz que propone upload_to (p. ej. "images")
+        partes = name.replace('\\', '/').split('/')
+        raiz = partes[0] if len(partes) > 1 else 'images'
+        extension = os.path.splitext(name)[1].lower()
+        huella = digest.hexdigest()
+        return f'{raiz}/{huella[:2]}/{huella}{extension}'
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        nombre = self.nombre_por_contenido(name, content)
+        if self.exists(nombre):
+            return nombre
+        return super().save(nombre, content, max_length=max_length)
+
+    def get_available_name(self, name, max_length=None):
+        # Si otra subida del mismo contenido ganó la carrera, el archivo que ya
+        # existe es idéntico: se usa el mismo nombre en vez de uno con sufijo
+        if es_nombre_por_contenido(name):
+            return name
+        return super().get_available_name(name, max_length=max_length)
+
+    def _save(self, name, content):
+        if not es_nombre_por_contenido(name):
+            return super()._save(name, content)
+        # Se escribe en un temporal y se publica con os.replace, que es atómico:
+        # nadie lee un archivo a medio escribir y, si dos procesos guardan el
+        # mismo contenido a la vez, el segundo reemplaza el archivo por otro igual.
+        temporal = super()._save(f'{name}.{uuid.uuid4().hex}.tmp', content)
+        try:
+            os.replace(self.path(temporal), self.path(name))
+        except OSError:
+            self.delete(temporal)
+            raise
+        return name
+
+    def guardar_con_nombre(self, name, content, max_length=None):
+        # Para archivos derivados cuya ruta ya depende del contenido del original
+        return super().save(name, content, max_length=max_length)
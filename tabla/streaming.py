@@ -0,0 +1,27 @@
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+
+class _Eco:
+    # Objeto tipo archivo para csv.writer: devuelve la línea en vez de guardarla
+    def write(self, valor):
+        return valor
+
+
+def lineas_csv(filas):
+    """Convierte un iterable de filas en líneas CSV, sin acumularlas en memoria."""
+    escritor = csv.writer(_Eco())
+    for fila in filas:
+        yield escritor.writerow(fila)
+
+
+def lineas_ndjson(objetos):
+    """Convierte un iterable de dicts en líneas JSON (NDJSON)."""
+    for objeto in objetos:
+        yield json.dumps(objeto, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+def a_json(valor):
+    return json.dumps(valor, cls=DjangoJSONEncoder, ensure_ascii=False)
@@ -0,0 +1,99 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import django
+from django.apps import apps
+from django.conf import settings
+from django.db import close_old_connections, connections
+
+# Pools locales para trabajo fuera del ciclo de la petición; no requieren broker
+_pool = None
+_pool_procesos = None
+
+
+def _pool_de_hilos():
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=getattr(settings, 'TAREAS_HILOS', 2), thread_name_prefix='tabla-tarea')
+    return _pool
+
+
+def _iniciar_proceso():
+    # Necesario si el sistema crea los procesos con "spawn" en lugar de "fork"
+    django.setup()
+
+
+def _pool_de_procesos():
+    # Cada hilo vigila un proceso hijo: REPORTES_PROCESOS renders a la vez
+    global _pool_procesos
+    if _pool_procesos is None:
+        _pool_procesos = ThreadPoolExecutor(max_workers=getattr(settings, 'REPORTES_PROCESOS', 2),
+                                            thread_name_prefix='tabla-proceso')
+    return _pool_procesos
+
+
+def _en_proceso_hijo(conexion, funcion, args, kwargs):
+    if not apps.ready:
+        _iniciar_proceso()
+    try:
+        resultado = (True, funcion(*args, **kwargs))
+    except BaseException as error:
+        # La excepción podría no ser serializable; basta con su descripción
+        resultado = (False, repr(error))
+    conexion.send(resultado)
+    conexion.close()
+
+
+def _vigilar_proceso(funcion, args, kwargs, limite):
+    # Un proceso por tarea, y no un ProcessPoolExecutor: un worker del pool que
+    # se cuelga no se puede interrumpir y ocuparía su lugar para siempre. Este
+    # proceso se termina si no responde en `limite` segundos.
+    receptor, emisor = multiprocessing.Pipe(duplex=False)
+    proceso = multiprocessing.Process(target=_en_proceso_hijo, args=(emisor, funcion, args, kwargs), daemon=True)
+    proceso.start()
+    emisor.close()
+    try:
+        # Se lee antes de esperar al proceso: un resultado grande llenaría la tubería
+        if not receptor.poll(limite):
+            raise TimeoutError(f'El proceso no terminó en {limite} s.')
+        try:
+            correcto, resultado = receptor.recv()
+        except EOFError:
+            raise RuntimeError('El proceso terminó sin devolver un resultado.')
+    finally:
+        receptor.close()
+        if proceso.is_alive():
+            proceso.terminate()
+        proceso.join()
+    if not correcto:
+        raise RuntimeError(resultado)
+    return resultado
+
+
+def _ejecutar(funcion, args, kwargs):
+    close_old_connections()
+    try:
+        return funcion(*args, **kwargs)
+    finally:
+        # Cada hilo abre su propia conexión; se cierra al terminar la tarea
+        connections.close_all()
+
+
+def pool_de_procesos(procesos):
+    """Devuelve un ``ProcessPoolExecutor`` para los comandos de gestión, con
+    Django configurado en cada proceso hijo."""
+    # Las conexiones abiertas no deben heredarse en los procesos hijos
+    connections.close_all()
+    return ProcessPoolExecutor(max_workers=procesos, initializer=_iniciar_proceso)
+
+
+def en_segundo_plano(funcion, *args, **kwargs):
+    """Ejecuta ``funcion`` en el pool de hilos y devuelve su ``Future``."""
+    return _pool_de_hilos().submit(_ejecutar, funcion, args, kwargs)
+
+
+def en_otro_proceso(funcion, *args, limite=None, **kwargs):
+    """Ejecuta ``funcion`` (trabajo de CPU, sin base de datos) en un proceso hijo
+    y devuelve su ``Future``. Si no termina en ``limite`` segundos, el proceso
+    se termina y el ``Future`` falla con TimeoutError."""
+    return _pool_de_procesos().submit(_vigilar_proceso, funcion, args, kwargs, limite)
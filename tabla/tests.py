@@ -1,3 +1,1188 @@
-from django.test import TestCase
+import datetime
+import itertools
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import Future
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.admin.models import LogEntry
+from django.contrib.auth.hashers import check_password, make_password
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F, Sum
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.request import Request
+from PIL import Image
+from rest_framework.test import APIRequestFactory
+
+from . import metricas, reportes_cache, trabajos
+from .imagenes import generar_derivados, ruta_derivado
+from .cache import cache_menu
+from .models import (Bebida, Categoria, Cliente, ComentarioCalificacion, Contacto, Entrada, GananciaDia, GananciaMes,
+                     MesaNoDisponible, NotificacionMovil, Plato, PromocionDePlato, ReferenciaImagen, RegistroDeVenta,
+                     ResumenCalificacion, ReservaDeMesa, TrabajoReporte, TurnoMesa, Usuario, image_storage,
+                     turnos_de_reserva)
+from .paginacion import PaginacionPorCursor, conteo_estimado
+from .reportes import generar_pdf
+from .serializers import BebidaSerializer, PlatoSerializer
+from .storage import es_nombre_por_contenido
+
+
+class GananciaMesDeltaTests(TestCase):
+    def setUp(self):
+        self.cliente = Cliente.objects.create(nombre='Ana', apellido='Díaz', correo_electronico='ana@example.com')
+        self.usuario = Usuario.objects.create(
+            nombre='Luis', apellido='Pérez', correo_electronico='luis@example.com',
+            nombre_usuario='luis', contraseña='secreta',
+        )
+        # Una mesa distinta por reserva, para que no se solapen
+        self.mesas = itertools.count(1)
+
+    def crear_venta(self, total, fecha=None):
+        venta = RegistroDeVenta.objects.create(cliente=self.cliente, total=total)
+        if fecha:
+            venta.fecha_venta = fecha
+            venta.save()
+        return venta
+
+    def crear_reserva(self, precio, fecha=None):
+        reserva = ReservaDeMesa.objects.create(
+            usuario=self.usuario, num_personas=2, numero_mesa=next(self.mesas),
+            fecha=datetime.date(2024, 5, 1), precio=precio, hora=datetime.time(20, 0),
+        )
+        if fecha:
+            reserva.fecha_reg = fecha
+            reserva.save()
+        return reserva
+
+    def assertCoincideConRecalculo(self):
+        campos = ['total_reservas', 'total_registros_venta', 'ganancia_reservas',
+                  'ganancia_registros_venta', 'ganancia_total']
+        for ganancia in GananciaMes.objects.all():
+            con_deltas = {campo: getattr(ganancia, campo) for campo in campos}
+            # Los días sin movimiento (por borrados o cambios de fecha) no cuentan
+            dias_con_deltas = list(ganancia.dias.exclude(total_reservas=0, total_registros_venta=0).values('dia', *campos))
+            ganancia.actualizar_ganancias()
+            recalculado = {campo: getattr(ganancia, campo) for campo in campos}
+            self.assertEqual(con_deltas, recalculado, ganancia.mes)
+            self.assertEqual(dias_con_deltas, list(ganancia.dias.values('dia', *campos)), ganancia.mes)
+
+    def test_deltas_coinciden_con_recalculo_completo(self):
+        enero, febrero = datetime.date(2024, 1, 15), datetime.date(2024, 2, 3)
+        ventas = [self.crear_venta(Decimal('10.50')), self.crear_venta(Decimal('20.00'), enero),
+                  self.crear_venta(Decimal('7.25'), febrero)]
+        reservas = [self.crear_reserva(Decimal('30.00')), self.crear_reserva(Decimal('15.00'), enero)]
+        self.assertCoincideConRecalculo()
+
+        # Actualizaciones de monto y de mes
+        ventas[0].total = Decimal('12.00')
+        ventas[0].save()
+        ventas[2].fecha_venta = enero
+        ventas[2].save()
+        reserva = ReservaDeMesa.objects.get(pk=reservas[1].pk)
+        reserva.precio = Decimal('18.00')
+        reserva.fecha_reg = febrero
+        reserva.save()
+        self.assertCoincideConRecalculo()
+
+        # Borrados individuales y en cascada
+        ventas[1].delete()
+        ReservaDeMesa.objects.filter(pk=reservas[0].pk).delete()
+        self.assertCoincideConRecalculo()
+        self.cliente.delete()
+        self.assertCoincideConRecalculo()
+        self.assertEqual(GananciaMes.objects.get(mes=enero.replace(day=1)).total_registros_venta, 0)
+
+    def test_borrar_con_cambios_sin_guardar_revierte_lo_guardado(self):
+        marzo = datetime.date(2024, 3, 10)
+        venta = self.crear_venta(Decimal('10.00'))
+        reserva = ReservaDeMesa.objects.get(pk=self.crear_reserva(Decimal('30.00')).pk)
+        self.crear_venta(Decimal('4.00'), marzo)
+        self.assertCoincideConRecalculo()
+
+        venta.total = Decimal('99.00')
+        venta.fecha_venta = marzo
+        venta.delete()
+        reserva.precio = Decimal('1.00')
+        reserva.fecha_reg = marzo
+        reserva.delete()
+        self.assertCoincideConRecalculo()
+        self.assertEqual(GananciaMes.objects.get(mes=marzo.replace(day=1)).ganancia_total, Decimal('4.00'))
+
+    def test_guardar_sin_cambios_no_modifica_ganancias(self):
+        venta = self.crear_venta(Decimal('10.00'))
+        venta = RegistroDeVenta.objects.get(pk=venta.pk)
+        with self.assertNumQueries(3):
+            # SAVEPOINT + UPDATE + RELEASE, sin tocar GananciaMes
+            venta.save()
+        ganancia = GananciaMes.objects.get()
+        self.assertEqual(ganancia.total_registros_venta, 1)
+        self.assertEqual(ganancia.ganancia_total, Decimal('10.00'))
+
+    def test_serie_diaria_desde_tabla_de_dias(self):
+        self.crear_venta(Decimal('10.00'), datetime.date(2024, 3, 2))
+        self.crear_venta(Decimal('5.00'), datetime.date(2024, 3, 2))
+        self.crear_reserva(Decimal('20.00'), datetime.date(2024, 3, 9))
+        ganancia = GananciaMes.objects.get(mes=datetime.date(2024, 3, 1))
+        with self.assertNumQueries(1):
+            fechas, reservas, ventas = ganancia.serie_diaria()
+        self.assertEqual(fechas, [2, 9])
+        self.assertEqual(reservas, [Decimal('0.00'), Decimal('20.00')])
+        self.assertEqual(ventas, [Decimal('15.00'), Decimal('0.00')])
+        self.assertEqual(GananciaDia.objects.get(dia=datetime.date(2024, 3, 2)).total_registros_venta, 2)
+
+    def test_comando_recalcular_ganancias(self):
+        self.crear_venta(Decimal('10.00'), datetime.date(2023, 11, 30))
+        self.crear_venta(Decimal('4.00'), datetime.date(2024, 2, 1))
+        self.crear_reserva(Decimal('25.00'), datetime.date(2024, 2, 14))
+        esperado = list(GananciaMes.objects.order_by('mes').values())
+        # Se simula un estado desfasado, como tras una importación directa
+        GananciaMes.objects.update(total_registros_venta=0, ganancia_total=Decimal('0.00'))
+        GananciaDia.objects.all().delete()
+
+        salida = StringIO()
+        call_command('recalcular_ganancias', '--meses-por-tramo', '2', stdout=salida)
+        self.assertIn('Verificación correcta', salida.getvalue())
+        obtenido = list(GananciaMes.objects.order_by('mes').values())
+        self.assertEqual([{k: v for k, v in fila.items() if k != 'id'} for fila in obtenido],
+                         [{k: v for k, v in fila.items() if k != 'id'} for fila in esperado])
+        self.assertEqual(GananciaDia.objects.count(), 3)
+
+    @skipUnless(connection.vendor == 'sqlite', 'Simula MySQL con el upsert sin columna de conflicto de SQLite')
+    def test_recalculo_sin_unique_fields_como_en_mysql(self):
+        self.crear_venta(Decimal('10.00'), datetime.date(2024, 2, 1))
+        self.crear_reserva(Decimal('25.00'), datetime.date(2024, 2, 14))
+        esperado = list(GananciaDia.objects.filter(dia__year=2024).values('dia', 'ganancia_total'))
+        GananciaMes.objects.update(ganancia_total=Decimal('0.00'))
+        GananciaDia.objects.update(ganancia_total=Decimal('0.00'))
+
+        sufijo_original = connection.ops.on_conflict_suffix_sql
+        columnas_unicas = []
+
+        def sufijo_sin_destino(fields, on_conflict, update_fields, unique_fields):
+            # Como ON DUPLICATE KEY UPDATE: sin indicar la columna única
+            unique_fields = list(unique_fields)
+            if on_conflict is None or unique_fields:
+                columnas_unicas.extend(unique_fields)
+                return sufijo_original(fields, on_conflict, update_fields, unique_fields)
+            columnas = map(connection.ops.quote_name, update_fields)
+            return 'ON CONFLICT DO UPDATE SET ' + ', '.join(f'{columna} = EXCLUDED.{columna}' for columna in columnas)
+
+        with mock.patch.object(connection.features, 'supports_update_conflicts_with_target', False), \
+                mock.patch.object(connection.ops, 'on_conflict_suffix_sql', sufijo_sin_destino):
+            GananciaMes.objects.get(mes=datetime.date(2024, 2, 1)).actualizar_ganancias()
+        self.assertEqual(columnas_unicas, [])
+        self.assertEqual(GananciaMes.objects.get(mes=datetime.date(2024, 2, 1)).ganancia_total, Decimal('35.00'))
+        self.assertEqual(list(GananciaDia.objects.filter(dia__year=2024).values('dia', 'ganancia_total')), esperado)
+
+
+class RegistroDeVentaLoteTests(TestCase):
+    def setUp(self):
+        categoria = Categoria.objects.create(nombre='Fondos')
+        self.plato = Plato.objects.create(nombre='Lomo', descripcion='-', categoria=categoria, precio=Decimal('30.00'))
+        self.bebida = Bebida.objects.create(nombre='Chicha', precio=Decimal('5.00'))
+        self.cliente = Cliente.objects.create(nombre='Ana', apellido='Díaz', correo_electronico='ana@example.com')
+
+    def test_lote_registra_validos_e_informa_errores(self):
+        lote = [
+            {'cliente': self.cliente.pk, 'platos': [self.plato.pk], 'bebidas': [self.bebida.pk], 'total': '35.00'},
+            {'correo_electronico': 'ana@example.com', 'platos': [self.plato.pk], 'total': '30.00'},
+            {'correo_electronico': 'nuevo@example.com', 'nombre': 'Eva', 'apellido': 'Ríos',
+             'platos': [self.plato.pk, self.plato.pk], 'total': '60.00'},
+            {'correo_electronico': 'otro@example.com', 'platos': [self.plato.pk], 'total': '30.00'},
+            {'cliente': self.cliente.pk, 'platos': [9999], 'total': '1.00'},
+            {'platos': [], 'total': 'x'},
+        ]
+        respuesta = self.client.post('/api/registros-venta/lote/', lote, content_type='application/json')
+        self.assertEqual(respuesta.status_code, 201)
+        self.assertEqual(len(respuesta.json()['creados']), 3)
+        self.assertEqual([error['indice'] for error in respuesta.json()['errores']], [3, 4, 5])
+
+        self.assertEqual(RegistroDeVenta.objects.count(), 3)
+        self.assertEqual(Cliente.objects.filter(correo_electronico='nuevo@example.com').count(), 1)
+        self.assertEqual(RegistroDeVenta.platos.through.objects.count(), 3)
+        self.assertEqual(RegistroDeVenta.bebidas.through.objects.count(), 1)
+        ganancia = GananciaMes.objects.get()
+        self.assertEqual(ganancia.total_registros_venta, 3)
+        self.assertEqual(ganancia.ganancia_registros_venta, Decimal('125.00'))
+
+    def test_lote_sin_validos_devuelve_400(self):
+        respuesta = self.client.post('/api/registros-venta/lote/', [{'total': '1.00'}], content_type='application/json')
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertFalse(RegistroDeVenta.objects.exists())
+
+
+class NotificacionMovilTests(TestCase):
+    def test_enviar_a_todos_por_lotes(self):
+        Usuario.objects.bulk_create([
+            Usuario(nombre='U', apellido=str(i), correo_electronico=f'u{i}@example.com',
+                    nombre_usuario=f'u{i}', contraseña='x')
+            for i in range(5)
+        ])
+        avances = []
+        with self.assertNumQueries(4):
+            # Lectura de ids + tres bulk_create de 2, 2 y 1 notificaciones
+            enviadas = NotificacionMovil.enviar_a_todos('Hola', 'Mensaje', tamano_lote=2, progreso=avances.append)
+        self.assertEqual(enviadas, 5)
+        self.assertEqual(avances, [2, 4, 5])
+        self.assertEqual(NotificacionMovil.objects.filter(titulo='Hola').count(), 5)
+
+
+class PaginacionPorCursorTests(TestCase):
+    def test_comentarios_paginados_sin_count(self):
+        for calificacion in [5, 4, 3, 2, 1]:
+            ComentarioCalificacion.objects.create(nombre_cliente='Ana', calificacion=calificacion, comentario='ok')
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get('/api/comentarios-calificacion/?tamano=2')
+        self.assertFalse(any('COUNT(' in consulta['sql'] for consulta in consultas.captured_queries))
+        datos = respuesta.json()
+        self.assertNotIn('count', datos)
+
+        vistas = [comentario['calificacion'] for comentario in datos['results']]
+        while datos['next']:
+            datos = self.client.get(datos['next']).json()
+            vistas += [comentario['calificacion'] for comentario in datos['results']]
+        # Mismo instante de creación: el orden por -id mantiene el orden estable
+        self.assertEqual(sorted(vistas), [1, 2, 3, 4, 5])
+        self.assertEqual(len(vistas), 5)
+
+    def test_mas_de_mil_filas_en_la_misma_fecha(self):
+        # Pasado offset_cutoff (1000), un cursor sobre fecha repetía filas sin terminar
+        cliente = Cliente.objects.create(nombre='Ana', apellido='Díaz', correo_electronico='ana@example.com')
+        RegistroDeVenta.objects.bulk_create(RegistroDeVenta(cliente=cliente, total=Decimal('1.00')) for _ in range(2600))
+        datos = self.client.get('/api/registros-venta/?tamano=500').json()
+        ids, paginas = [venta['id'] for venta in datos['results']], 1
+        while datos['next'] and paginas < 10:
+            datos = self.client.get(datos['next']).json()
+            ids += [venta['id'] for venta in datos['results']]
+            paginas += 1
+        self.assertIsNone(datos['next'])
+        self.assertEqual(ids, sorted(RegistroDeVenta.objects.values_list('id', flat=True)))
+
+    def test_orden_cursor_debe_empezar_por_un_campo_unico(self):
+        vista = mock.Mock(orden_cursor=('fecha_venta', 'id'))
+        with self.assertRaises(ImproperlyConfigured):
+            PaginacionPorCursor().get_ordering(None, RegistroDeVenta.objects.all(), vista)
+
+    def test_tamano_de_pagina_acotado(self):
+        peticion = Request(APIRequestFactory().get('/api/platos/', {'tamano': 100000}))
+        self.assertEqual(PaginacionPorCursor().get_page_size(peticion), 500)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Los planes de consulta se verifican con EXPLAIN QUERY PLAN de SQLite')
+class IndicesTests(TestCase):
+    # Evita que un cambio en las consultas deje de usar los índices sin que nadie lo note
+    desde = datetime.date(2024, 1, 1)
+    hasta = datetime.date(2024, 2, 1)
+
+    def assertUsaIndice(self, queryset, indice):
+        plan = queryset.explain()
+        self.assertIn(f'INDEX {indice}', plan)
+
+    def test_ganancias_por_rango_de_fechas(self):
+        self.assertUsaIndice(
+            ReservaDeMesa.objects.filter(fecha_reg__gte=self.desde, fecha_reg__lt=self.hasta)
+            .values('fecha_reg').annotate(monto=Sum('precio')).order_by(),
+            'tabla_reserva_fecha_reg_idx')
+        self.assertUsaIndice(
+            RegistroDeVenta.objects.filter(fecha_venta__gte=self.desde, fecha_venta__lt=self.hasta)
+            .values('fecha_venta').annotate(monto=Sum('total')).order_by(),
+            'tabla_venta_fecha_idx')
+
+    def test_reservas_por_mesa(self):
+        self.assertUsaIndice(ReservaDeMesa.objects.filter(fecha=self.desde, numero_mesa=3), 'tabla_reserva_mesa_idx')
+
+    def test_notificaciones_por_usuario(self):
+        self.assertUsaIndice(NotificacionMovil.objects.filter(usuario_id=1).order_by('-fecha'),
+                             'tabla_notif_usuario_fecha_idx')
+
+    def test_comentarios_recientes(self):
+        self.assertUsaIndice(ComentarioCalificacion.objects.order_by('-fecha', '-id')[:50], 'tabla_comentario_fecha_idx')
+
+
+class CacheMenuTests(TestCase):
+    def setUp(self):
+        cache_menu().clear()
+        self.bebida = Bebida.objects.create(nombre='Chicha', precio=Decimal('5.00'))
+
+    def test_respuesta_cacheada_y_get_condicional(self):
+        primera = self.client.get('/api/bebidas/')
+        self.assertEqual(primera.status_code, 200)
+        etag = primera['ETag']
+
+        with self.assertNumQueries(0):
+            segunda = self.client.get('/api/bebidas/')
+        self.assertEqual(segunda.json(), primera.json())
+        with self.assertNumQueries(0):
+            no_modificada = self.client.get('/api/bebidas/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(no_modificada.status_code, 304)
+
+    def test_guardar_invalida_la_cache(self):
+        etag = self.client.get('/api/bebidas/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.bebida.precio = Decimal('6.00')
+            self.bebida.save()
+        respuesta = self.client.get('/api/bebidas/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotEqual(respuesta['ETag'], etag)
+        self.assertEqual(respuesta.json()['results'][0]['precio'], '6.00')
+
+    def test_menu_anidado_en_consultas_fijas(self):
+        for nombre in ['Fondos', 'Postres']:
+            categoria = Categoria.objects.create(nombre=nombre)
+            for i in range(3):
+                plato = Plato.objects.create(nombre=f'{nombre} {i}', descripcion='-', categoria=categoria,
+                                             precio=Decimal('20.00'))
+                PromocionDePlato.objects.create(plato=plato, enunciado='2x1', precio_descuento=Decimal('15.00'))
+        with self.assertNumQueries(5):
+            menu = self.client.get('/api/menu/').json()
+        self.assertEqual([categoria['nombre'] for categoria in menu['categorias']], ['Fondos', 'Postres'])
+        self.assertEqual(len(menu['categorias'][0]['platos']), 3)
+        self.assertEqual(menu['categorias'][0]['platos'][0]['promociones'][0]['precio_descuento'], '15.00')
+        self.assertEqual(menu['bebidas'][0]['nombre'], 'Chicha')
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/menu/').json(), menu)
+
+
+class ReporteCacheTests(TestCase):
+    def setUp(self):
+        self.directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directorio, ignore_errors=True)
+        ajustes = override_settings(REPORTES_CACHE_DIR=self.directorio)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'admin'))
+        self.cliente = Cliente.objects.create(nombre='Ana', apellido='Díaz', correo_electronico='ana@example.com')
+
+    def descargar(self, ganancia):
+        respuesta = self.client.get(reverse('admin:descargar_reporte_pdf', args=[ganancia.pk]))
+        self.assertEqual(respuesta.status_code, 200)
+        return b''.join(respuesta.streaming_content)
+
+    def test_descarga_repetida_se_sirve_del_archivo(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            RegistroDeVenta.objects.create(cliente=self.cliente, total=Decimal('10.00'))
+        ganancia = GananciaMes.objects.get()
+        with mock.patch('tabla.reportes.generar_pdf', wraps=generar_pdf) as generar:
+            primero = self.descargar(ganancia)
+            segundo = self.descargar(ganancia)
+            self.assertEqual(generar.call_count, 1)
+            self.assertEqual(primero, segundo)
+            self.assertEqual(len(os.listdir(self.directorio)), 1)
+
+            # Una venta nueva no toca el disco: cambia la huella y el PDF viejo
+            # se reemplaza al generar el nuevo
+            with self.captureOnCommitCallbacks(execute=True), mock.patch('tabla.reportes_cache.invalidar') as invalidar:
+                RegistroDeVenta.objects.create(cliente=self.cliente, total=Decimal('5.00'))
+            invalidar.assert_not_called()
+            ganancia.refresh_from_db()
+            self.assertNotEqual(self.descargar(ganancia), primero)
+            self.assertEqual(generar.call_count, 2)
+            self.assertEqual(len(os.listdir(self.directorio)), 1)
+
+    def test_desalojo_por_tamano(self):
+        with override_settings(REPORTES_CACHE_MAX_BYTES=20):
+            for mes in (1, 2, 3):
+                ganancia = GananciaMes.objects.create(mes=datetime.date(2024, mes, 1))
+                ruta = reportes_cache.guardar(ganancia, reportes_cache.huella(ganancia), b'12345678')
+                # Último uso explícito: enero es el menos reciente
+                os.utime(ruta, (mes, mes))
+        self.assertEqual(sorted(nombre[:7] for nombre in os.listdir(self.directorio)), ['2024-02', '2024-03'])
+
+    @override_settings(REPORTES_EN_SEGUNDO_PLANO=False)
+    def test_trabajo_de_reporte(self):
+        RegistroDeVenta.objects.create(cliente=self.cliente, total=Decimal('10.00'))
+        ganancia = GananciaMes.objects.get()
+        respuesta = self.client.post(reverse('admin:solicitar_reporte_pdf', args=[ganancia.pk]))
+        self.assertEqual(respuesta.status_code, 202)
+        estado = self.client.get(respuesta.json()['estado_url']).json()
+        self.assertEqual(estado['estado'], TrabajoReporte.TERMINADO)
+        descarga = self.client.get(estado['descarga_url'])
+        self.assertTrue(b''.join(descarga.streaming_content).startswith(b'%PDF'))
+
+        # Con el PDF en caché el trabajo nace terminado, sin volver a generarlo
+        with mock.patch('tabla.trabajos.renderizar_pdf') as renderizar:
+            segundo = self.client.post(reverse('admin:solicitar_reporte_pdf', args=[ganancia.pk])).json()
+        renderizar.assert_not_called()
+        self.assertEqual(segundo['estado'], TrabajoReporte.TERMINADO)
+        # ...y se reutiliza el mismo trabajo en lugar de crear una fila por clic
+        self.assertEqual(segundo['id'], estado['id'])
+        self.assertEqual(TrabajoReporte.objects.count(), 1)
+
+    def test_purga_de_trabajos_antiguos(self):
+        ganancia = GananciaMes.objects.create(mes=datetime.date(2024, 1, 1))
+        antiguo = TrabajoReporte.objects.create(ganancia_mes=ganancia, huella='x', estado=TrabajoReporte.ERROR,
+                                                terminado=timezone.now() - datetime.timedelta(days=2))
+        reciente = TrabajoReporte.objects.create(ganancia_mes=ganancia, huella='y', estado=TrabajoReporte.ERROR,
+                                                 terminado=timezone.now())
+        with override_settings(REPORTES_EN_SEGUNDO_PLANO=False):
+            trabajos.solicitar_reporte(ganancia)
+        self.assertFalse(TrabajoReporte.objects.filter(pk=antiguo.pk).exists())
+        self.assertTrue(TrabajoReporte.objects.filter(pk=reciente.pk).exists())
+
+    @override_settings(REPORTES_TIMEOUT=0)
+    def test_trabajo_vencido_en_cola_se_cancela(self):
+        ganancia = GananciaMes.objects.create(mes=datetime.date(2024, 1, 1))
+        futuro = Future()
+        with mock.patch('tabla.tareas.en_otro_proceso', return_value=futuro):
+            trabajo = trabajos.solicitar_reporte(ganancia)
+        trabajos.vencer_trabajos()
+        self.assertTrue(futuro.cancelled())
+        trabajo.refresh_from_db()
+        self.assertEqual(trabajo.estado, TrabajoReporte.ERROR)
+        self.assertNotIn(trabajo.pk, trabajos._en_cola)
+
+    def test_trabajos_vencidos(self):
+        ganancia = GananciaMes.objects.create(mes=datetime.date(2024, 1, 1))
+        trabajo = TrabajoReporte.objects.create(ganancia_mes=ganancia, huella='x')
+        TrabajoReporte.objects.filter(pk=trabajo.pk).update(creado=timezone.now() - datetime.timedelta(hours=1))
+        estado = self.client.get(reverse('admin:estado_reporte_pdf', args=[trabajo.pk])).json()
+        self.assertEqual(estado['estado'], TrabajoReporte.ERROR)
+
+
+def _renderizar_colgado(*datos):
+    time.sleep(60)
+
+
+@override_settings(REPORTES_EN_SEGUNDO_PLANO=True, REPORTES_PROCESOS=1, REPORTES_TIMEOUT=1)
+class ReporteTimeoutTests(TransactionTestCase):
+    # Transaccional: el resultado lo guarda un hilo con su propia conexión
+    def setUp(self):
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio, ignore_errors=True)
+        self.enterContext(override_settings(REPORTES_CACHE_DIR=directorio))
+        # Un pool nuevo con REPORTES_PROCESOS=1
+        self.enterContext(mock.patch('tabla.tareas._pool_procesos', None))
+
+    def esperar(self, trabajo, segundos=30):
+        limite = time.monotonic() + segundos
+        while time.monotonic() < limite:
+            trabajo.refresh_from_db()
+            if trabajo.estado != TrabajoReporte.PENDIENTE:
+                return trabajo
+            time.sleep(0.1)
+        self.fail(f'{trabajo} sigue pendiente')
+
+    def test_render_colgado_se_termina_y_no_bloquea_el_siguiente(self):
+        enero = GananciaMes.objects.create(mes=datetime.date(2024, 1, 1))
+        febrero = GananciaMes.objects.create(mes=datetime.date(2024, 2, 1))
+        with mock.patch('tabla.trabajos.renderizar_pdf', _renderizar_colgado):
+            colgado = trabajos.solicitar_reporte(enero)
+        siguiente = trabajos.solicitar_reporte(febrero)
+
+        self.assertEqual(self.esperar(colgado).estado, TrabajoReporte.ERROR)
+        self.assertIn('TimeoutError', colgado.error)
+        self.assertEqual(self.esperar(siguiente).estado, TrabajoReporte.TERMINADO)
+        with open(siguiente.archivo, 'rb') as archivo:
+            self.assertTrue(archivo.read().startswith(b'%PDF'))
+
+
+class ImportacionesTests(SimpleTestCase):
+    def test_arranque_no_importa_librerias_de_reportes(self):
+        # python -X importtime lista cada módulo importado al levantar Django y cargar las URLs
+        codigo = 'import django; django.setup(); from django.urls import get_resolver; get_resolver().url_patterns'
+        proceso = subprocess.run([sys.executable, '-X', 'importtime', '-c', codigo],
+                                 cwd=settings.BASE_DIR, env=os.environ.copy(), capture_output=True, text=True)
+        self.assertEqual(proceso.returncode, 0, proceso.stderr[-2000:])
+        modulos = {linea.rsplit('|', 1)[-1].strip() for linea in proceso.stderr.splitlines()
+                   if linea.startswith('import time:')}
+        self.assertIn('tabla.views', modulos)
+        pesados = sorted(modulo for modulo in modulos if modulo.split('.')[0] in ('matplotlib', 'reportlab'))
+        self.assertEqual(pesados, [])
+
+
+class ReporteRangoTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'admin'))
+        cliente = Cliente.objects.create(nombre='Ana', apellido='Díaz', correo_electronico='ana@example.com')
+        categoria = Categoria.objects.create(nombre='Fondos')
+        plato = Plato.objects.create(nombre='Lomo', descripcion='-', categoria=categoria, precio=Decimal('30.00'))
+        bebida = Bebida.objects.create(nombre='Chicha', precio=Decimal('5.00'))
+        for fecha, total in ((datetime.date(2024, 1, 10), '35.00'), (datetime.date(2024, 2, 5), '30.00'),
+                             (datetime.date(2024, 4, 1), '30.00')):
+            venta = RegistroDeVenta.objects.create(cliente=cliente, total=Decimal(total))
+            venta.fecha_venta = fecha
+            venta.save()
+            venta.platos.add(plato)
+            if total == '35.00':
+                venta.bebidas.add(bebida)
+        self.url = reverse('admin:reporte_rango_ganancias')
+
+    def test_json_por_trimestre(self):
+        respuesta = self.client.get(self.url, {'desde': '2024-01-01', 'hasta': '2024-12-31', 'agrupacion': 'trimestre'})
+        self.assertTrue(respuesta.streaming)
+        datos = json.loads(b''.join(respuesta.streaming_content))
+        self.assertEqual([(fila['periodo'], fila['total_registros_venta']) for fila in datos['periodos']],
+                         [('2024-T1', 2), ('2024-T2', 1)])
+        self.assertEqual(datos['totales']['ganancia_total'], '95.00')
+        self.assertEqual(datos['categorias'], [{'categoria': 'Fondos', 'cantidad': 3, 'monto': '90.00'},
+                                               {'categoria': 'Bebidas', 'cantidad': 1, 'monto': '5.00'}])
+
+    def test_csv_y_pdf(self):
+        parametros = {'desde': '2024-01-01', 'hasta': '2024-02-29', 'formato': 'csv'}
+        lineas = b''.join(self.client.get(self.url, parametros).streaming_content).decode().splitlines()
+        self.assertEqual(lineas[1:4], ['2024-01,0,0.00,1,35.00,35.00', '2024-02,0,0.00,1,30.00,30.00',
+                                       'Total,0,0.00,2,65.00,65.00'])
+        parametros['formato'] = 'pdf'
+        self.assertTrue(b''.join(self.client.get(self.url, parametros).streaming_content).startswith(b'%PDF'))
+
+    def test_rango_invalido(self):
+        respuesta = self.client.get(self.url, {'desde': '2024-02-01', 'hasta': '2024-01-01'})
+        self.assertEqual(respuesta.status_code, 400)
+
+
+@override_settings(EXPORTACION_TAMANO_LOTE=2)
+class ExportacionTests(TestCase):
+    def setUp(self):
+        self.cliente = Cliente.objects.create(nombre='Ana', apellido='Díaz', correo_electronico='ana@example.com')
+        otro = Cliente.objects.create(nombre='Juan', apellido='Ruiz', correo_electronico='juan@example.com')
+        categoria = Categoria.objects.create(nombre='Fondos')
+        self.plato = Plato.objects.create(nombre='Lomo', descripcion='-', categoria=categoria, precio=Decimal('30.00'))
+        self.bebida = Bebida.objects.create(nombre='Chicha', precio=Decimal('5.00'))
+        for i in range(5):
+            venta = RegistroDeVenta.objects.create(cliente=self.cliente if i < 4 else otro, total=Decimal('35.00'))
+            venta.platos.add(self.plato)
+            venta.bebidas.add(self.bebida)
+
+    def test_ndjson_con_relaciones_prefetch_por_lote(self):
+        respuesta = self.client.get('/api/registros-venta/exportar/', {'cliente': self.cliente.pk})
+        self.assertEqual(respuesta['Content-Type'], 'application/x-ndjson')
+        # Un cursor sobre las ventas y 3 prefetch por cada lote de 2 filas, sin consultas por fila
+        with self.assertNumQueries(7):
+            filas = [json.loads(linea) for linea in b''.join(respuesta.streaming_content).splitlines()]
+        self.assertEqual(len(filas), 4)
+        self.assertEqual((filas[0]['platos'], filas[0]['bebidas'], filas[0]['entradas']),
+                         ([self.plato.pk], [self.bebida.pk], []))
+
+    def test_csv_y_comando(self):
+        respuesta = self.client.get('/api/registros-venta/exportar/', {'formato': 'csv'})
+        lineas = b''.join(respuesta.streaming_content).decode().splitlines()
+        self.assertEqual(lineas[0], 'id,fecha_venta,cliente,total,platos,bebidas,entradas')
+        self.assertEqual(len(lineas), 6)
+        salida = StringIO()
+        call_command('exportar_datos', 'ventas', '--formato', 'csv', stdout=salida)
+        self.assertEqual(salida.getvalue().splitlines(), lineas)
+
+    def test_filtro_invalido(self):
+        respuesta = self.client.get('/api/reservas-mesa/exportar/', {'desde': '2024-13-01'})
+        self.assertEqual(respuesta.status_code, 400)
+
+
+@override_settings(IMAGENES_EN_SEGUNDO_PLANO=False)
+class ImagenesDerivadasTests(TestCase):
+    def setUp(self):
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio)
+        self.storage = FileSystemStorage(location=directorio)
+        parche = mock.patch('tabla.imagenes.almacenamiento', return_value=self.storage)
+        parche.start()
+        self.addCleanup(parche.stop)
+        foto = BytesIO()
+        Image.new('RGB', (3000, 2000), (200, 80, 40)).save(foto, 'JPEG')
+        self.nombre = self.storage.save('images/plato/foto.jpg', ContentFile(foto.getvalue()))
+
+    def test_variantes_sin_ampliar(self):
+        self.assertEqual(generar_derivados(self.nombre, self.storage), 6)
+        self.assertEqual(generar_derivados(self.nombre, self.storage), 0)
+        with self.storage.open('images/plato/derivados/foto/tarjeta.webp') as archivo:
+            imagen = Image.open(archivo)
+            self.assertEqual((imagen.format, imagen.size), ('WEBP', (480, 320)))
+        # Una imagen menor que la variante se conserva en su tamaño
+        with open(os.path.join(settings.MEDIA_ROOT, 'images/bebida/icon_maps.png'), 'rb') as archivo:
+            icono = self.storage.save('images/bebida/icon_maps.png', archivo)
+        generar_derivados(icono, self.storage)
+        with self.storage.open('images/bebida/derivados/icon_maps/completa.jpeg') as archivo:
+            self.assertEqual(Image.open(archivo).size, (94, 94))
+
+    def test_serializer_y_generacion_bajo_demanda(self):
+        categoria = Categoria.objects.create(nombre='Fondos')
+        plato = Plato(nombre='Lomo', descripcion='-', categoria=categoria, precio=Decimal('30.00'))
+        plato.imagen.name = self.nombre
+        plato.save()
+        imagenes = PlatoSerializer(plato).data['imagenes']
+        self.assertEqual(imagenes['tarjeta']['webp'], '/imagenes/tarjeta.webp/images/plato/foto.jpg')
+        self.assertTrue(imagenes['srcset']['jpeg'].endswith('/imagenes/completa.jpeg/images/plato/foto.jpg 1200w'))
+
+        respuesta = self.client.get(imagenes['miniatura']['webp'])
+        self.assertEqual((respuesta.status_code, respuesta['Content-Type']), (200, 'image/webp'))
+        self.assertTrue(self.storage.exists('images/plato/derivados/foto/completa.jpeg'))
+        self.assertEqual(self.client.get('/imagenes/miniatura.webp/images/plato/otra.jpg').status_code, 404)
+        self.assertEqual(self.client.get('/imagenes/enorme.webp/images/plato/foto.jpg').status_code, 404)
+
+    def test_solo_se_generan_variantes_de_imagenes_referenciadas(self):
+        # Un archivo de MEDIA_ROOT que no usa ninguna fila del menú
+        self.assertEqual(self.client.get('/imagenes/tarjeta.webp/images/plato/foto.jpg').status_code, 404)
+        self.assertFalse(self.storage.exists('images/plato/derivados'))
+
+        ReferenciaImagen.objects.create(nombre=self.nombre, referencias=1)
+        self.assertEqual(self.client.get('/imagenes/tarjeta.webp/images/plato/foto.jpg').status_code, 200)
+        derivado = 'images/plato/derivados/foto/tarjeta.webp'
+        ReferenciaImagen.objects.create(nombre=derivado, referencias=1)
+        self.assertEqual(self.client.get(f'/imagenes/tarjeta.webp/{derivado}').status_code, 404)
+        self.assertFalse(self.storage.exists('images/plato/derivados/foto/derivados'))
+
+    def test_bomba_de_descompresion(self):
+        ReferenciaImagen.objects.create(nombre=self.nombre, referencias=1)
+        with mock.patch.object(Image, 'MAX_IMAGE_PIXELS', 1000):
+            self.assertEqual(self.client.get('/imagenes/tarjeta.webp/images/plato/foto.jpg').status_code, 404)
+
+    def test_al_guardar_se_programan_las_variantes(self):
+        categoria = Categoria.objects.create(nombre='Fondos')
+        with mock.patch.object(Plato._meta.get_field('imagen'), 'storage', self.storage), \
+                self.captureOnCommitCallbacks(execute=True):
+            plato = Plato(nombre='Lomo', descripcion='-', categoria=categoria, precio=Decimal('30.00'))
+            plato.imagen.name = self.nombre
+            plato.save()
+        self.assertTrue(self.storage.exists('images/plato/derivados/foto/miniatura.jpeg'))
+
+
+class AlmacenamientoPorContenidoTests(TestCase):
+    def setUp(self):
+        with open(os.path.join(settings.MEDIA_ROOT, 'images/bebida/icon_maps.png'), 'rb') as archivo:
+            self.icono = archivo.read()
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio)
+        self.enterContext(override_settings(MEDIA_ROOT=directorio, IMAGENES_EN_SEGUNDO_PLANO=False))
+        self.plato = Plato.objects.create(nombre='Lomo', descripcion='-', precio=Decimal('30.00'),
+                                          categoria=Categoria.objects.create(nombre='Fondos'))
+
+    def subir(self, contenido, nombre='icon_maps.png'):
+        return SimpleUploadedFile(nombre, contenido, content_type='image/png')
+
+    def test_subidas_iguales_comparten_archivo(self):
+        bebida = Bebida.objects.create(nombre='Chicha', precio=Decimal('5.00'), imagen=self.subir(self.icono))
+        promocion = PromocionDePlato.objects.create(plato=self.plato, precio_descuento=Decimal('25.00'),
+                                                    imagen=self.subir(self.icono, 'otro_nombre.PNG'))
+        self.assertEqual(bebida.imagen.name, promocion.imagen.name)
+        self.assertTrue(es_nombre_por_contenido(bebida.imagen.name))
+        self.assertEqual(ReferenciaImagen.objects.get(nombre=bebida.imagen.name).referencias, 2)
+        carpeta = os.path.dirname(image_storage.path(bebida.imagen.name))
+        self.assertEqual(len([f for f in os.listdir(carpeta) if os.path.isfile(os.path.join(carpeta, f))]), 1)
+
+    def test_reemplazo_y_borrado_liberan_el_archivo(self):
+        bebida = Bebida.objects.create(nombre='Chicha', precio=Decimal('5.00'), imagen=self.subir(self.icono))
+        entrada = Entrada.objects.create(nombre='Causa', precio=Decimal('8.00'), imagen=self.subir(self.icono))
+        nombre = bebida.imagen.name
+        with self.captureOnCommitCallbacks(execute=True):
+            bebida.delete()
+        self.assertTrue(image_storage.exists(nombre))
+
+        # La última referencia se reemplaza: se borran el archivo y sus variantes
+        generar_derivados(nombre, image_storage)
+        entrada = Entrada.objects.get(pk=entrada.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            entrada.imagen = self.subir(self.icono + b'\0')
+            entrada.save()
+        self.assertFalse(image_storage.exists(nombre))
+        self.assertFalse(image_storage.exists(ruta_derivado(nombre, 'tarjeta', 'webp')))
+        self.assertFalse(ReferenciaImagen.objects.filter(nombre=nombre).exists())
+        self.assertEqual(ReferenciaImagen.objects.get(nombre=entrada.imagen.name).referencias, 1)
+
+    def test_subidas_simultaneas_no_generan_sufijos(self):
+        nombre = image_storage.save('images/icon_maps.png', ContentFile(self.icono))
+        # La otra subida comprobó exists() antes de que se escribiera el archivo
+        with mock.patch.object(type(image_storage), 'exists', return_value=False):
+            self.assertEqual(image_storage.save('images/icon_maps.png', ContentFile(self.icono)), nombre)
+        carpeta = os.path.dirname(image_storage.path(nombre))
+        self.assertEqual(os.listdir(carpeta), [os.path.basename(nombre)])
+        with open(image_storage.path(nombre), 'rb') as archivo:
+            self.assertEqual(archivo.read(), self.icono)
+
+    def test_depurar_imagenes_migra_y_borra_huerfanos(self):
+        antiguo = FileSystemStorage().save('images/bebida/icon_maps.png', ContentFile(self.icono))
+        FileSystemStorage().save('images/plato/huerfano.png', ContentFile(b'x'))
+        bebida = Bebida.objects.create(nombre='Chicha', precio=Decimal('5.00'))
+        Bebida.objects.filter(pk=bebida.pk).update(imagen=antiguo)
+
+        call_command('depurar_imagenes', '--migrar', '--edad-minima', '0', stdout=StringIO())
+        bebida.refresh_from_db()
+        self.assertTrue(es_nombre_por_contenido(bebida.imagen.name))
+        self.assertEqual(ReferenciaImagen.objects.get().nombre, bebida.imagen.name)
+        self.assertFalse(image_storage.exists(antiguo))
+        self.assertFalse(image_storage.exists('images/plato/huerfano.png'))
+        self.assertTrue(image_storage.exists(bebida.imagen.name))
+
+    def test_cabeceras_de_cache(self):
+        bebida = Bebida.objects.create(nombre='Chicha', precio=Decimal('5.00'), imagen=self.subir(self.icono))
+        respuesta = self.client.get(settings.MEDIA_URL + bebida.imagen.name)
+        self.assertEqual(respuesta['Cache-Control'], 'public, max-age=31536000, immutable')
+        respuesta = self.client.get(BebidaSerializer(bebida).data['imagenes']['tarjeta']['webp'])
+        self.assertEqual(respuesta['Cache-Control'], 'public, max-age=31536000, immutable')
+
+
+class ServirMediaTests(TestCase):
+    # Sobre la carpeta media/ del proyecto
+    url = '/media/images/bebida/icon_maps.png'
+
+    def setUp(self):
+        with open(os.path.join(settings.MEDIA_ROOT, 'images/bebida/icon_maps.png'), 'rb') as archivo:
+            self.contenido = archivo.read()
+
+    def test_completo_y_condicional(self):
+        respuesta = self.client.get(self.url)
+        self.assertEqual((respuesta.status_code, respuesta['Content-Type']), (200, 'image/png'))
+        self.assertEqual(b''.join(respuesta.streaming_content), self.contenido)
+        self.assertEqual(respuesta['Content-Length'], str(len(self.contenido)))
+        self.assertEqual(respuesta['Accept-Ranges'], 'bytes')
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=respuesta['ETag']).status_code, 304)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=respuesta['Last-Modified']).status_code, 304)
+
+    def test_rangos(self):
+        respuesta = self.client.get(self.url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(respuesta.status_code, 206)
+        self.assertEqual(respuesta['Content-Range'], f'bytes 10-19/{len(self.contenido)}')
+        self.assertEqual(b''.join(respuesta.streaming_content), self.contenido[10:20])
+        respuesta = self.client.get(self.url, HTTP_RANGE='bytes=-5')
+        self.assertEqual(b''.join(respuesta.streaming_content), self.contenido[-5:])
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.contenido)}-').status_code, 416)
+        # Con un If-Range de otra versión se envía el archivo completo
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"otra"').status_code, 200)
+
+    def test_delegacion_al_servidor_web(self):
+        with self.settings(MEDIA_SERVIDOR='x-accel'):
+            respuesta = self.client.get(self.url)
+            self.assertEqual(respuesta['X-Accel-Redirect'], '/media-interno/images/bebida/icon_maps.png')
+            self.assertEqual(respuesta.content, b'')
+        with self.settings(MEDIA_SERVIDOR='x-sendfile'):
+            respuesta = self.client.get(self.url)
+            self.assertEqual(respuesta['X-Sendfile'], os.path.join(settings.MEDIA_ROOT, 'images/bebida/icon_maps.png'))
+
+    def test_rutas_fuera_de_media(self):
+        self.assertEqual(self.client.get('/media/../manage.py').status_code, 404)
+        self.assertEqual(self.client.get('/media/images/bebida/').status_code, 404)
+        self.assertEqual(self.client.post(self.url).status_code, 405)
+
+
+class UsuarioContraseñaTests(TestCase):
+    def test_solo_se_hashean_contraseñas_nuevas(self):
+        usuario = Usuario.objects.create(nombre='Luis', apellido='Pérez', correo_electronico='luis@example.com',
+                                         nombre_usuario='luis', contraseña='secreta')
+        self.assertTrue(check_password('secreta', usuario.contraseña))
+        hash_inicial = usuario.contraseña
+
+        usuario = Usuario.objects.get(pk=usuario.pk)
+        usuario.nombre = 'Luis Alberto'
+        with mock.patch('tabla.models.make_password') as make_password, self.assertNumQueries(1):
+            usuario.save()
+        make_password.assert_not_called()
+        self.assertEqual(Usuario.objects.get(pk=usuario.pk).contraseña, hash_inicial)
+
+        usuario.contraseña = 'otra'
+        usuario.save()
+        self.assertTrue(check_password('otra', Usuario.objects.get(pk=usuario.pk).contraseña))
+
+        # Un valor con forma de hash se hashea como cualquier otra contraseña...
+        usuario.contraseña = 'pbkdf2_sha256$x'
+        usuario.save()
+        self.assertTrue(check_password('pbkdf2_sha256$x', Usuario.objects.get(pk=usuario.pk).contraseña))
+
+        # ...salvo que quien lo calculó lo marque como hash
+        usuario.contraseña = hash_inicial
+        usuario._contraseña_hasheada = True
+        usuario.save()
+        self.assertEqual(Usuario.objects.get(pk=usuario.pk).contraseña, hash_inicial)
+        usuario.contraseña = 'nueva'
+        usuario.save()
+        self.assertTrue(check_password('nueva', Usuario.objects.get(pk=usuario.pk).contraseña))
+
+    def test_importar_usuarios(self):
+        hash_leo = make_password('clave-leo')
+        Usuario.objects.create(nombre='Ana', apellido='Díaz', correo_electronico='ana@example.com',
+                               nombre_usuario='ana', contraseña='x')
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False, encoding='utf-8') as archivo:
+            archivo.write('nombre,apellido,correo_electronico,nombre_usuario,contraseña\n'
+                          'Ana,Díaz,ana@example.com,ana2,clave\n'
+                          'Eva,Soto,eva@example.com,eva,clave-eva\n'
+                          'Eva,Soto,eva@example.com,eva-bis,clave-eva\n'
+                          f'Leo,Ríos,leo@example.com,leo,{hash_leo}\n'
+                          'Sin,Clave,sin@example.com,sin,\n')
+        self.addCleanup(os.remove, archivo.name)
+        salida, errores = StringIO(), StringIO()
+        call_command('importar_usuarios', archivo.name, '--procesos', '1', '--lote', '2', stdout=salida, stderr=errores)
+        self.assertIn('2 usuarios importados y 3 filas omitidas', salida.getvalue())
+        self.assertTrue(check_password('clave-eva', Usuario.objects.get(nombre_usuario='eva').contraseña))
+        # Sin --hasheadas, un valor con forma de hash es una contraseña más
+        self.assertTrue(check_password(hash_leo, Usuario.objects.get(nombre_usuario='leo').contraseña))
+
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False, encoding='utf-8') as archivo:
+            archivo.write('nombre,apellido,correo_electronico,nombre_usuario,contraseña\n'
+                          f'Ada,Ríos,ada@example.com,ada,{hash_leo}\n')
+        self.addCleanup(os.remove, archivo.name)
+        call_command('importar_usuarios', archivo.name, '--procesos', '1', '--hasheadas', stdout=StringIO())
+        self.assertEqual(Usuario.objects.get(nombre_usuario='ada').contraseña, hash_leo)
+
+
+@override_settings(MESAS_CAPACIDAD={1: 2, 2: 4, 3: 6}, RESERVA_DURACION_MINUTOS=120, RESERVA_INTERVALO_MINUTOS=30,
+                   RESERVA_APERTURA='19:00', RESERVA_ULTIMO_TURNO='21:00')
+class DisponibilidadTests(TestCase):
+    def setUp(self):
+        self.usuario = Usuario.objects.create(nombre='Luis', apellido='Pérez', correo_electronico='luis@example.com',
+                                              nombre_usuario='luis', contraseña='secreta')
+        self.fecha = datetime.date(2024, 5, 1)
+
+    def reserva(self, mesa, hora, **datos):
+        datos.setdefault('num_personas', 2)
+        return ReservaDeMesa.objects.create(usuario=self.usuario, numero_mesa=mesa, fecha=self.fecha,
+                                            hora=hora, precio=Decimal('10.00'), **datos)
+
+    def test_solapamiento_en_la_misma_mesa(self):
+        reserva = self.reserva(2, datetime.time(20, 0))
+        with self.assertRaises(MesaNoDisponible):
+            self.reserva(2, datetime.time(21, 45))
+        self.reserva(2, datetime.time(22, 0))
+        self.reserva(1, datetime.time(20, 0))
+        # Mover la reserva libera sus franjas anteriores
+        reserva.hora = datetime.time(18, 0)
+        reserva.save()
+        self.reserva(2, datetime.time(20, 0))
+        self.assertEqual(ReservaDeMesa.objects.filter(numero_mesa=2).count(), 3)
+
+    def test_reserva_que_pasa_de_medianoche(self):
+        self.reserva(3, datetime.time(23, 30))
+        with self.assertRaises(MesaNoDisponible):
+            ReservaDeMesa.objects.create(usuario=self.usuario, num_personas=2, numero_mesa=3, hora=datetime.time(0, 30),
+                                         fecha=self.fecha + datetime.timedelta(days=1), precio=Decimal('10.00'))
+
+    def test_disponibilidad_y_reserva_por_api(self):
+        self.reserva(2, datetime.time(20, 0))
+        url = '/api/reservas-mesa/disponibilidad/'
+        respuesta = self.client.get(url, {'fecha': '2024-05-01', 'hora': '19:00', 'personas': 3})
+        self.assertEqual(respuesta.json()['mesas'], [3])
+        with self.assertNumQueries(1):
+            respuesta = self.client.get(url, {'fecha': '2024-05-01', 'personas': 2})
+        self.assertEqual([(h['hora'], h['mesas']) for h in respuesta.json()['horarios']],
+                         [('19:00:00', [1, 3]), ('19:30:00', [1, 3]), ('20:00:00', [1, 3]),
+                          ('20:30:00', [1, 3]), ('21:00:00', [1, 3])])
+
+        datos = {'usuario': self.usuario.pk, 'num_personas': 2, 'fecha': '2024-05-01', 'hora': '20:00', 'precio': '10.00'}
+        self.assertEqual(self.client.post('/api/reservas-mesa/reservar/', datos).json()['numero_mesa'], 1)
+        self.assertEqual(self.client.post('/api/reservas-mesa/reservar/', datos).json()['numero_mesa'], 3)
+        self.assertEqual(self.client.post('/api/reservas-mesa/reservar/', datos).status_code, 409)
+        self.assertEqual(self.client.post('/api/reservas-mesa/reservar/', dict(datos, hora='22:00', num_personas=5,
+                                                                                numero_mesa=1)).status_code, 400)
+        self.assertEqual(self.client.post('/api/reservas-mesa/', dict(datos, numero_mesa=2)).status_code, 409)
+
+    def test_capacidad_en_todas_las_vias_de_alta(self):
+        datos = {'usuario': self.usuario.pk, 'num_personas': 6, 'numero_mesa': 1, 'fecha': '2024-05-01',
+                 'hora': '20:00', 'precio': '10.00'}
+        respuesta = self.client.post('/api/reservas-mesa/', datos)
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertIn('para 2 personas como máximo', respuesta.json()['detail'])
+        self.assertEqual(self.client.post('/api/reservas-mesa/', dict(datos, numero_mesa=9)).status_code, 400)
+        with self.assertRaises(ValidationError):
+            self.reserva(1, datetime.time(20, 0), num_personas=6)
+        self.assertFalse(ReservaDeMesa.objects.exists())
+        self.assertFalse(TurnoMesa.objects.exists())
+        self.assertEqual(self.client.post('/api/reservas-mesa/', dict(datos, numero_mesa=3)).status_code, 201)
+
+    def test_solapamiento_en_el_admin(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'admin'))
+        self.reserva(2, datetime.time(20, 0))
+        reserva = self.reserva(3, datetime.time(20, 0))
+        url = reverse('admin:tabla_reservademesa_change', args=[reserva.pk])
+        datos = {'usuario': self.usuario.pk, 'num_personas': 2, 'numero_mesa': 2, 'fecha': '2024-05-01',
+                 'hora': '21:00', 'precio': '10.00', 'nota': ''}
+        respuesta = self.client.post(url, datos)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertContains(respuesta, 'La mesa 2 ya está reservada')
+
+        # Si la mesa se ocupa entre la validación y el guardado, el formulario
+        # se vuelve a validar y muestra el error, sin cambios ni historial
+        with mock.patch('tabla.disponibilidad.mesa_ocupada', side_effect=[False, True]):
+            respuesta = self.client.post(url, datos)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertContains(respuesta, 'La mesa 2 ya está reservada')
+        self.assertEqual(ReservaDeMesa.objects.get(pk=reserva.pk).numero_mesa, 3)
+        self.assertEqual(reserva.turnos.count(), 4)
+        self.assertFalse(LogEntry.objects.exists())
+
+        # Si vuelve a fallar, se informa con un mensaje y tampoco queda nada guardado
+        with mock.patch('tabla.disponibilidad.mesa_ocupada', return_value=False):
+            respuesta = self.client.post(url, datos, follow=True)
+        self.assertEqual(respuesta.redirect_chain, [(url, 302)])
+        self.assertContains(respuesta, 'La mesa 2 ya está reservada')
+        self.assertEqual(ReservaDeMesa.objects.get(pk=reserva.pk).numero_mesa, 3)
+        self.assertFalse(LogEntry.objects.exists())
+
+        # Guardar la reserva en su propio horario no choca consigo misma
+        respuesta = self.client.post(url, dict(datos, numero_mesa=3))
+        self.assertRedirects(respuesta, reverse('admin:tabla_reservademesa_changelist'))
+
+
+class ResumenCalificacionTests(TestCase):
+    def comentario(self, calificacion, hace_dias=0):
+        comentario = ComentarioCalificacion.objects.create(calificacion=calificacion, comentario='-')
+        if hace_dias:
+            # fecha es auto_now_add: se mueve con update() y el resumen se recalcula
+            ComentarioCalificacion.objects.filter(pk=comentario.pk).update(
+                fecha=timezone.now() - datetime.timedelta(days=hace_dias))
+        return comentario
+
+    def test_resumen_por_deltas_y_ventana(self):
+        self.comentario(5)
+        self.comentario(4)
+        comentario = self.comentario(1)
+        self.comentario(3, hace_dias=40)
+        ResumenCalificacion.recalcular()
+        respuesta = self.client.get('/api/comentarios-calificacion/resumen/')
+        self.assertEqual(respuesta.json(), {'cantidad': 4, 'promedio': 3.25, 'dias': None,
+                                            'distribucion': {'1': 1, '2': 0, '3': 1, '4': 1, '5': 1}})
+
+        comentario = ComentarioCalificacion.objects.get(pk=comentario.pk)
+        comentario.calificacion = 2
+        comentario.save()
+        ComentarioCalificacion.objects.filter(calificacion=4).delete()
+        with self.assertNumQueries(1):
+            respuesta = self.client.get('/api/comentarios-calificacion/resumen/', {'dias': 30})
+        self.assertEqual(respuesta.json(), {'cantidad': 2, 'promedio': 3.5, 'dias': 30,
+                                            'distribucion': {'1': 0, '2': 1, '3': 0, '4': 0, '5': 1}})
+
+        # Los deltas dejan el mismo resultado que recalcular desde cero
+        antes = ResumenCalificacion.obtener(), ResumenCalificacion.obtener(30)
+        ResumenCalificacion.recalcular()
+        self.assertEqual((ResumenCalificacion.obtener(), ResumenCalificacion.obtener(30)), antes)
+        self.assertEqual(self.client.get('/api/comentarios-calificacion/resumen/', {'dias': 'x'}).status_code, 400)
+
+    def test_borrar_con_cambios_sin_guardar_revierte_lo_guardado(self):
+        self.comentario(4)
+        comentario = ComentarioCalificacion.objects.get(pk=self.comentario(5, hace_dias=40).pk)
+        ResumenCalificacion.recalcular()
+        comentario.calificacion = 1
+        comentario.fecha = timezone.now()
+        comentario.delete()
+        antes = ResumenCalificacion.obtener(), ResumenCalificacion.obtener(30)
+        ResumenCalificacion.recalcular()
+        self.assertEqual((ResumenCalificacion.obtener(), ResumenCalificacion.obtener(30)), antes)
+        self.assertEqual(antes[0]['cantidad'], 1)
+
+
+class PresupuestoConsultasTests(TestCase):
+    # Consultas máximas por listado; deben ser las mismas con N y con 2N filas
+    presupuestos = {
+        '/api/usuarios/': 1,
+        '/api/categorias/': 1,
+        '/api/notificaciones-movil/': 1,
+        '/api/reservas-mesa/': 1,
+        '/api/platos/': 1,
+        '/api/promociones-plato/': 1,
+        '/api/comentarios-calificacion/': 1,
+        '/api/clientes/': 1,
+        '/api/registros-venta/': 4,
+        '/api/bebidas/': 1,
+        '/api/entradas/': 1,
+        '/api/contactos/': 1,
+        '/api/ganancias-mes/': 1,
+        '/api/menu/': 5,
+    }
+
+    def setUp(self):
+        self.sembradas = 0
+
+    def sembrar(self, n):
+        for _ in range(n):
+            i = self.sembradas = self.sembradas + 1
+            usuario = Usuario.objects.create(nombre='U', apellido=str(i), correo_electronico=f'u{i}@example.com',
+                                             nombre_usuario=f'u{i}', contraseña=make_password(None))
+            categoria = Categoria.objects.create(nombre=f'C{i}')
+            plato = Plato.objects.create(nombre=f'P{i}', descripcion='-', categoria=categoria, precio=Decimal('10.00'))
+            PromocionDePlato.objects.create(plato=plato, precio_descuento=Decimal('8.00'))
+            bebida = Bebida.objects.create(nombre=f'B{i}', precio=Decimal('3.00'))
+            entrada = Entrada.objects.create(nombre=f'E{i}', precio=Decimal('5.00'))
+            cliente = Cliente.objects.create(nombre='C', apellido=str(i), correo_electronico=f'c{i}@example.com')
+            venta = RegistroDeVenta.objects.create(cliente=cliente, total=Decimal('18.00'))
+            venta.platos.add(plato)
+            venta.bebidas.add(bebida)
+            venta.entradas.add(entrada)
+            ReservaDeMesa.objects.create(usuario=usuario, num_personas=2, numero_mesa=i, fecha=datetime.date(2024, 5, 1),
+                                         hora=datetime.time(20, 0), precio=Decimal('10.00'))
+            ComentarioCalificacion.objects.create(usuario=usuario, calificacion=5, comentario='-')
+            NotificacionMovil.objects.create(usuario=usuario, titulo='T', mensaje='-')
+            Contacto.objects.create(nombre='C', correo_electronico=f'c{i}@example.com', mensaje='-')
+            GananciaMes.objects.create(mes=datetime.date(2000 + i, 1, 1))
+
+    def consultas(self):
+        resultado = {}
+        for url in self.presupuestos:
+            cache_menu().clear()
+            with CaptureQueriesContext(connection) as contexto:
+                respuesta = self.client.get(url)
+            self.assertEqual(respuesta.status_code, 200, url)
+            resultado[url] = len(contexto)
+        return resultado
+
+    def test_consultas_constantes_por_listado(self):
+        self.sembrar(3)
+        con_n = self.consultas()
+        self.sembrar(3)
+        con_2n = self.consultas()
+        self.assertEqual(con_2n, con_n)
+        for url, presupuesto in self.presupuestos.items():
+            self.assertLessEqual(con_n[url], presupuesto, url)
+
+
+class MetricasTests(TestCase):
+    def setUp(self):
+        metricas.reiniciar()
+
+    def test_server_timing_y_histogramas_por_ruta(self):
+        Contacto.objects.create(nombre='C', correo_electronico='c@example.com', mensaje='-')
+        respuesta = self.client.get('/api/contactos/')
+        self.assertRegex(respuesta['Server-Timing'], r'^sql;dur=[\d.]+;desc="1 consultas", total;dur=[\d.]+$')
+        self.client.get(f'/api/contactos/{Contacto.objects.get().pk}/')
+
+        texto = self.client.get(reverse('metricas')).content.decode()
+        self.assertIn('http_request_sql_queries_count{route="/api/contactos/",method="GET"} 1', texto)
+        self.assertIn('http_request_sql_queries_bucket{route="/api/contactos/",method="GET",le="1"} 1', texto)
+        # El id no forma parte de la serie, solo el patrón de la ruta
+        self.assertIn('route="/api/contactos/(?P<pk>[^/.]+)/"', texto)
+        self.assertIn('http_request_duration_seconds_count{route="/api/contactos/",method="GET",status="200"} 1', texto)
+
+    def test_metodos_desconocidos_comparten_serie(self):
+        for metodo in ('FOO', 'BAR'):
+            self.client.generic(metodo, '/api/contactos/')
+        texto = metricas.exportar()
+        self.assertIn('http_request_sql_queries_count{route="/api/contactos/",method="other"} 2', texto)
+        self.assertNotIn('FOO', texto)
+
+    @override_settings(METRICAS_IPS=[])
+    def test_metricas_solo_para_ips_permitidas(self):
+        self.assertEqual(self.client.get(reverse('metricas')).status_code, 404)
+
+    @override_settings(METRICAS_CONSULTA_LENTA_MS=0)
+    def test_consulta_lenta_registra_sql_y_origen(self):
+        with self.assertLogs('tabla.metricas', 'WARNING') as registro:
+            self.client.get('/api/comentarios-calificacion/resumen/')
+        self.assertIn('tabla_resumencalificacion', registro.output[0])
+        self.assertIn('tabla/models.py', registro.output[0].replace(os.sep, '/'))
+        with self.assertLogs('tabla.metricas', 'WARNING') as registro:
+            self.client.get('/api/contactos/')
+        # Consulta hecha dentro de DRF: no hay código del proyecto que señalar
+        self.assertIn('desde desconocido', registro.output[0])
+
+
+class GenerarDatosTests(TestCase):
+    def test_datos_coherentes_y_bench_en_json(self):
+        call_command('generar_datos', ventas=60, reservas=30, comentarios=40, usuarios=5, clientes=8, platos=6,
+                     bebidas=3, entradas=2, dias=20, hasta='2024-03-10', lote=25, stdout=StringIO())
+        self.assertEqual(RegistroDeVenta.objects.count(), 60)
+        self.assertFalse(RegistroDeVenta.objects.filter(platos__isnull=True).exists())
+        self.assertEqual(RegistroDeVenta.objects.filter(fecha_venta__range=('2024-02-20', '2024-03-10')).count(), 60)
+        # Las fechas auto_now_add conservan los valores generados, no la fecha de hoy
+        self.assertFalse(ReservaDeMesa.objects.filter(fecha_reg__gt=F('fecha')).exists())
+        self.assertEqual(ComentarioCalificacion.objects.filter(fecha__date__range=('2024-02-20', '2024-03-10')).count(), 40)
+        # Cada reserva ocupa sus franjas, sin solaparse con otra
+        self.assertEqual(TurnoMesa.objects.count(), 30 * len(turnos_de_reserva(datetime.date(2024, 3, 1), datetime.time(20))))
+        # Las tablas derivadas quedan reconstruidas
+        self.assertEqual(GananciaMes.objects.aggregate(total=Sum('total_registros_venta'))['total'], 60)
+        self.assertEqual(GananciaMes.objects.aggregate(total=Sum('total_reservas'))['total'], 30)
+        self.assertEqual(ResumenCalificacion.obtener()['cantidad'], 40)
+
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio)
+        salida = os.path.join(directorio, 'bench.json')
+        call_command('bench', repeticiones=1, calentamiento=0, salida=salida, stdout=StringIO())
+        with open(salida, encoding='utf-8') as archivo:
+            informe = json.load(archivo)
+        self.assertEqual(informe['filas']['RegistroDeVenta'], 60)
+        self.assertIn('admin:gananciames', informe['resultados'])
+        self.assertIn('ventas:crear', informe['resultados'])
+        self.assertEqual(RegistroDeVenta.objects.count(), 60)
+
+
+class AdminEscalableTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'admin'))
+        self.sembradas = 0
+        cache.clear()
+
+    def sembrar(self, n):
+        for _ in range(n):
+            i = self.sembradas = self.sembradas + 1
+            usuario = Usuario.objects.create(nombre='U', apellido=str(i), correo_electronico=f'u{i}@example.com',
+                                             nombre_usuario=f'u{i}', contraseña=make_password(None))
+            plato = Plato.objects.create(nombre=f'P{i}', descripcion='-', categoria=Categoria.objects.create(nombre=f'C{i}'),
+                                         precio=Decimal('10.00'))
+            PromocionDePlato.objects.create(plato=plato, precio_descuento=Decimal('8.00'))
+            cliente = Cliente.objects.create(nombre='C', apellido=str(i), correo_electronico=f'c{i}@example.com')
+            RegistroDeVenta.objects.create(cliente=cliente, total=Decimal('10.00'))
+            ReservaDeMesa.objects.create(usuario=usuario, num_personas=2, numero_mesa=i, fecha=datetime.date(2024, 5, 1),
+                                         hora=datetime.time(20, 0), precio=Decimal('10.00'))
+            ComentarioCalificacion.objects.create(usuario=usuario, calificacion=4, comentario='-')
+
+    def consultas(self):
+        resultado = {}
+        for modelo in ('reservademesa', 'plato', 'promociondeplato', 'registrodeventa', 'comentariocalificacion'):
+            with CaptureQueriesContext(connection) as contexto:
+                respuesta = self.client.get(reverse(f'admin:tabla_{modelo}_changelist'))
+            self.assertEqual(respuesta.status_code, 200, modelo)
+            resultado[modelo] = len(contexto)
+        return resultado
+
+    def test_changelists_con_consultas_constantes(self):
+        self.sembrar(3)
+        con_n = self.consultas()
+        self.sembrar(3)
+        self.assertEqual(self.consultas(), con_n)
+
+    def test_filtro_autocompletar_sin_lista_de_usuarios(self):
+        self.sembrar(2)
+        usuario = Usuario.objects.get(nombre_usuario='u2')
+        respuesta = self.client.get(reverse('admin:tabla_reservademesa_changelist'), {'usuario__id__exact': usuario.pk})
+        self.assertEqual(respuesta.context['cl'].result_count, 1)
+        self.assertContains(respuesta, 'data-parametro="usuario__id__exact"')
+        self.assertContains(respuesta, f'<option value="{usuario.pk}" selected>')
+        self.assertNotContains(respuesta, 'u1')
+        respuesta = self.client.get(reverse('admin:autocomplete'), {
+            'app_label': 'tabla', 'model_name': 'reservademesa', 'field_name': 'usuario', 'term': 'u1'})
+        self.assertEqual([r['id'] for r in respuesta.json()['results']],
+                         [str(Usuario.objects.get(nombre_usuario='u1').pk)])
+
+    def test_conteo_estimado_solo_sin_filtros(self):
+        self.sembrar(3)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.assertEqual(conteo_estimado(RegistroDeVenta), 3)
+        url = reverse('admin:tabla_registrodeventa_changelist')
+        with override_settings(ADMIN_CONTEO_EXACTO_MAXIMO=2), \
+                mock.patch('tabla.paginacion.conteo_estimado', return_value=50000):
+            self.assertEqual(self.client.get(url).context['cl'].result_count, 50000)
+            cliente = Cliente.objects.first()
+            self.assertEqual(self.client.get(url, {'cliente__id__exact': cliente.pk}).context['cl'].result_count, 1)
+        self.assertEqual(self.client.get(url).context['cl'].result_count, 3)
+
+    def test_grafico_de_cualquier_mes_se_invalida_con_cada_venta(self):
+        cliente = Cliente.objects.create(nombre='C', apellido='C', correo_electronico='c@example.com')
+        with self.captureOnCommitCallbacks(execute=True):
+            venta = RegistroDeVenta.objects.create(cliente=cliente, total=Decimal('12.50'))
+        url = reverse('admin:grafico_ganancias_mes')
+        mes = venta.fecha_venta.strftime('%Y-%m')
+        datos = self.client.get(url, {'mes': mes}).json()
+        self.assertEqual(len(datos['fechas']), len(datos['ventas']))
+        self.assertEqual(datos['ventas'][venta.fecha_venta.day - 1], 12.5)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            RegistroDeVenta.objects.create(cliente=cliente, total=Decimal('7.50'))
+        datos = self.client.get(url, {'mes': mes}).json()
+        self.assertEqual(datos['ventas'][venta.fecha_venta.day - 1], 20.0)
+        with self.assertNumQueries(2):  # sesión y usuario: la serie sale de la caché
+            self.assertEqual(self.client.get(url, {'mes': mes}).json(), datos)
+        self.assertEqual(self.client.get(url, {'mes': '2024-02'}).json()['fechas'][-1], 29)
+        self.assertEqual(self.client.get(url, {'mes': 'febrero'}).status_code, 400)
@@ -0,0 +1,99 @@
+import datetime
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+from . import reportes_cache, tareas
+from .models import TrabajoReporte
+
+
+# Futuros de este proceso que aún pueden cancelarse: {id de trabajo: (futuro, vencimiento)}
+_en_cola = {}
+
+
+def solicitar_reporte(ganancia_mes):
+    # Devuelve un TrabajoReporte para el mes. Si el PDF ya está en caché se
+    # reutiliza el trabajo terminado con esa huella (o nace uno terminado); si
+    # hay uno en curso con la misma huella, se reutiliza. Devuelve None si se
+    # alcanzó el límite de trabajos pendientes.
+    purgar_trabajos()
+    valor_huella = reportes_cache.huella(ganancia_mes)
+    archivo = reportes_cache.abrir(ganancia_mes, valor_huella)
+    if archivo is not None:
+        archivo.close()
+        ruta = reportes_cache.ruta(ganancia_mes.mes, valor_huella)
+        terminado = TrabajoReporte.objects.filter(ganancia_mes=ganancia_mes, huella=valor_huella, archivo=ruta,
+                                                  estado=TrabajoReporte.TERMINADO).order_by('-terminado').first()
+        if terminado is not None:
+            return terminado
+        return TrabajoReporte.objects.create(
+            ganancia_mes=ganancia_mes, huella=valor_huella, estado=TrabajoReporte.TERMINADO,
+            archivo=ruta, terminado=timezone.now())
+
+    vencer_trabajos()
+    en_curso = TrabajoReporte.objects.filter(huella=valor_huella, estado=TrabajoReporte.PENDIENTE).first()
+    if en_curso is not None:
+        return en_curso
+    if TrabajoReporte.objects.filter(estado=TrabajoReporte.PENDIENTE).count() >= getattr(settings, 'REPORTES_MAX_PENDIENTES', 10):
+        return None
+
+    trabajo = TrabajoReporte.objects.create(ganancia_mes=ganancia_mes, huella=valor_huella)
+    fechas, ganancias_reservas, ganancias_ventas = ganancia_mes.serie_diaria()
+    datos = (ganancia_mes.mes, fechas, ganancias_reservas, ganancias_ventas)
+    if getattr(settings, 'REPORTES_EN_SEGUNDO_PLANO', True):
+        limite = getattr(settings, 'REPORTES_TIMEOUT', 120)
+        futuro = tareas.en_otro_proceso(renderizar_pdf, *datos, limite=limite)
+        _en_cola[trabajo.pk] = (futuro, time.monotonic() + limite)
+        futuro.add_done_callback(lambda futuro: _registrar_resultado(trabajo.pk, ganancia_mes.mes, valor_huella, futuro))
+    else:
+        _guardar_resultado(trabajo.pk, ganancia_mes.mes, valor_huella, lambda: renderizar_pdf(*datos))
+    return trabajo
+
+
+def renderizar_pdf(mes, fechas, ganancias_reservas, ganancias_ventas):
+    # Se ejecuta en el proceso hijo; la importación pesada queda fuera del proceso web
+    from .reportes import generar_pdf_desde_datos
+    return generar_pdf_desde_datos(mes, fechas, ganancias_reservas, ganancias_ventas).getvalue()
+
+
+def _registrar_resultado(trabajo_id, mes, valor_huella, futuro):
+    # Corre en un hilo del proceso web cuando termina, vence o se cancela el proceso hijo
+    _en_cola.pop(trabajo_id, None)
+    try:
+        _guardar_resultado(trabajo_id, mes, valor_huella, futuro.result)
+    finally:
+        connections.close_all()
+
+
+def _guardar_resultado(trabajo_id, mes, valor_huella, obtener_contenido):
+    try:
+        contenido = obtener_contenido()
+    except Exception as error:
+        TrabajoReporte.objects.filter(pk=trabajo_id, estado=TrabajoReporte.PENDIENTE).update(
+            estado=TrabajoReporte.ERROR, error=repr(error), terminado=timezone.now())
+        return
+    ruta = reportes_cache.guardar_contenido(mes, valor_huella, contenido)
+    TrabajoReporte.objects.filter(pk=trabajo_id, estado=TrabajoReporte.PENDIENTE).update(
+        estado=TrabajoReporte.TERMINADO, archivo=ruta, terminado=timezone.now())
+
+
+def vencer_trabajos():
+    # Los trabajos que superan REPORTES_TIMEOUT se marcan con error, y los que
+    # siguen en la cola de este proceso se cancelan. Un render ya iniciado lo
+    # termina tareas.en_otro_proceso al cumplirse el mismo plazo.
+    ahora = time.monotonic()
+    for futuro, vencimiento in list(_en_cola.values()):
+        if vencimiento < ahora:
+            futuro.cancel()
+    limite = timezone.now() - datetime.timedelta(seconds=getattr(settings, 'REPORTES_TIMEOUT', 120))
+    TrabajoReporte.objects.filter(estado=TrabajoReporte.PENDIENTE, creado__lt=limite).update(
+        estado=TrabajoReporte.ERROR, error='Tiempo de espera agotado.', terminado=timezone.now())
+
+
+def purgar_trabajos():
+    # Los trabajos terminados o con error se conservan REPORTES_RETENCION segundos,
+    # lo suficiente para que el admin consulte su estado y descargue el PDF
+    limite = timezone.now() - datetime.timedelta(seconds=getattr(settings, 'REPORTES_RETENCION', 24 * 60 * 60))
+    TrabajoReporte.objects.exclude(estado=TrabajoReporte.PENDIENTE).filter(terminado__lt=limite).delete()
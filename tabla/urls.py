@@ -3,7 +3,8 @@ from rest_framework.routers import DefaultRouter
 from .views import UsuarioViewSet, CategoriaViewSet, NotificacionMovilViewSet
 from .views import ReservaDeMesaViewSet, PlatoViewSet, PromocionDePlatoViewSet
 from .views import ComentarioCalificacionViewSet, ClienteViewSet, RegistroDeVentaViewSet
-from .views import BebidaViewSet, EntradaViewSet, ContactoViewSet, GananciaMesViewSet
+from .views import BebidaViewSet, EntradaViewSet, ContactoViewSet, GananciaMesViewSet, MenuView
+from .views import exponer_metricas, imagen_derivada
 
 router = DefaultRouter()
 router.register(r'usuarios', UsuarioViewSet)
@@ -21,6 +22,9 @@ router.register(r'contactos', ContactoViewSet)
 router.register(r'ganancias-mes', GananciaMesViewSet)
 
 urlpatterns = [
+    path('api/menu/', MenuView.as_view(), name='menu'),
     path('api/', include(router.urls)),
+    path('imagenes/<slug:variante>.<slug:formato>/<path:nombre>', imagen_derivada, name='imagen_derivada'),
+    path('metrics', exponer_metricas, name='metricas'),
     
 ]
@@ -1,39 +1,139 @@
 from django.shortcuts import render
-from django.contrib import admin
 # views.py
-from matplotlib import pyplot as plt
-from rest_framework import viewsets
-from .models import Usuario, Categoria, NotificacionMovil, ReservaDeMesa, Plato, PromocionDePlato, ComentarioCalificacion, Cliente, RegistroDeVenta, Bebida, Entrada, Contacto, GananciaMes
-from .serializers import UsuarioSerializer, CategoriaSerializer, NotificacionMovilSerializer, ReservaDeMesaSerializer, PlatoSerializer, PromocionDePlatoSerializer, ComentarioCalificacionSerializer, ClienteSerializer, RegistroDeVentaSerializer, BebidaSerializer, EntradaSerializer, ContactoSerializer, GananciaMesSerializer
+import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Prefetch
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import APIException, ValidationError as DatosInvalidos
+from rest_framework.response import Response
+from rest_framework.renderers import JSONRenderer
+from rest_framework.views import APIView
+from . import disponibilidad, exportaciones, imagenes, metricas, reportes_cache, resumen_financiero, streaming, trabajos
+from .cache import CacheMenuMixin, cache_menu, clave_grafico_ganancias, etag_de_versiones
+from .models import Usuario, Categoria, NotificacionMovil, ReservaDeMesa, Plato, PromocionDePlato, ComentarioCalificacion, Cliente, RegistroDeVenta, Bebida, Entrada, Contacto, GananciaMes, TrabajoReporte, MesaNoDisponible, ReferenciaImagen, ResumenCalificacion
+from .serializers import UsuarioSerializer, CategoriaSerializer, NotificacionMovilSerializer, ReservaDeMesaSerializer, PlatoSerializer, PromocionDePlatoSerializer, ComentarioCalificacionSerializer, ClienteSerializer, RegistroDeVentaSerializer, BebidaSerializer, EntradaSerializer, ContactoSerializer, GananciaMesSerializer, RegistroDeVentaLoteSerializer, ReservarMesaSerializer
+from .serializers import GananciaMesListaSerializer, RegistroDeVentaListaSerializer
+from .serializers import MenuCategoriaSerializer
 
 class UsuarioViewSet(viewsets.ModelViewSet):
     queryset = Usuario.objects.all()
     serializer_class = UsuarioSerializer
 
-class CategoriaViewSet(viewsets.ModelViewSet):
+class CategoriaViewSet(CacheMenuMixin, viewsets.ModelViewSet):
     queryset = Categoria.objects.all()
     serializer_class = CategoriaSerializer
+    modelos_cache = (Categoria,)
 
 class NotificacionMovilViewSet(viewsets.ModelViewSet):
     queryset = NotificacionMovil.objects.all()
     serializer_class = NotificacionMovilSerializer
+    orden_cursor = ('-id',)
+
+def respuesta_exportacion(tipo, request):
+    # Exportación completa en streaming: ?formato=csv|ndjson más los filtros del tipo
+    formato = request.query_params.get('formato', 'ndjson')
+    try:
+        lineas = exportaciones.lineas(tipo, request.query_params, formato)
+    except ValueError as error:
+        return Response({'detail': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+    respuesta = StreamingHttpResponse(lineas, content_type=exportaciones.FORMATOS[formato])
+    respuesta['Content-Disposition'] = f'attachment; filename="{tipo}.{formato}"'
+    return respuesta
+
+class Conflicto(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'El recurso está ocupado.'
+    default_code = 'conflicto'
 
 class ReservaDeMesaViewSet(viewsets.ModelViewSet):
     queryset = ReservaDeMesa.objects.all()
     serializer_class = ReservaDeMesaSerializer
 
-class PlatoViewSet(viewsets.ModelViewSet):
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        fecha = self.request.query_params.get('fecha')
+        if fecha:
+            queryset = queryset.filter(fecha=fecha)
+        return queryset
+
+    def perform_create(self, serializer):
+        try:
+            serializer.save()
+        except MesaNoDisponible as error:
+            raise Conflicto(error.message)
+        except ValidationError as error:
+            # Mesa inexistente o con menos lugares que num_personas
+            raise DatosInvalidos({'detail': error.message})
+
+    def perform_update(self, serializer):
+        self.perform_create(serializer)
+
+    @action(detail=False, methods=['get'])
+    def disponibilidad(self, request):
+        # ?fecha=AAAA-MM-DD&personas=N[&hora=HH:MM]: sin hora, todos los horarios del día
+        try:
+            fecha = datetime.date.fromisoformat(request.query_params.get('fecha', ''))
+            personas = int(request.query_params.get('personas', 1))
+            hora = request.query_params.get('hora')
+            hora = datetime.time.fromisoformat(hora) if hora else None
+        except ValueError:
+            return Response({'detail': 'Use fecha=AAAA-MM-DD, personas entero y hora=HH:MM.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if hora is None:
+            return Response({'fecha': fecha, 'personas': personas,
+                             'horarios': disponibilidad.horarios_del_dia(fecha, personas)})
+        return Response({'fecha': fecha, 'hora': hora, 'personas': personas,
+                         'mesas': disponibilidad.mesas_libres(fecha, hora, personas)})
+
+    @action(detail=False, methods=['post'])
+    def reservar(self, request):
+        serializer = ReservarMesaSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            reserva = disponibilidad.reservar(**serializer.validated_data)
+        except MesaNoDisponible as error:
+            raise Conflicto(error.message)
+        except ValidationError as error:
+            return Response({'detail': error.message}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(ReservaDeMesaSerializer(reserva).data, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['get'], url_path='exportar')
+    def exportar(self, request):
+        return respuesta_exportacion('reservas', request)
+
+class PlatoViewSet(CacheMenuMixin, viewsets.ModelViewSet):
     queryset = Plato.objects.all()
     serializer_class = PlatoSerializer
+    modelos_cache = (Plato,)
 
-class PromocionDePlatoViewSet(viewsets.ModelViewSet):
+class PromocionDePlatoViewSet(CacheMenuMixin, viewsets.ModelViewSet):
     queryset = PromocionDePlato.objects.all()
     serializer_class = PromocionDePlatoSerializer
+    modelos_cache = (PromocionDePlato,)
 
 
 class ComentarioCalificacionViewSet(viewsets.ModelViewSet):
-    queryset = ComentarioCalificacion.objects.all().order_by('-fecha')
+    queryset = ComentarioCalificacion.objects.select_related('usuario').order_by('-fecha')
     serializer_class = ComentarioCalificacionSerializer
+    orden_cursor = ('-id',)
+
+    @action(detail=False, methods=['get'])
+    def resumen(self, request):
+        # Promedio y distribución de estrellas; ?dias=N para los últimos N días
+        dias = request.query_params.get('dias')
+        if dias is not None:
+            if not dias.isdigit() or not 1 <= int(dias) <= 3660:
+                return Response({'detail': 'dias debe ser un entero entre 1 y 3660.'}, status=status.HTTP_400_BAD_REQUEST)
+            dias = int(dias)
+        return Response(dict(ResumenCalificacion.obtener(dias), dias=dias))
 
 
 class ClienteViewSet(viewsets.ModelViewSet):
@@ -41,16 +141,97 @@ class ClienteViewSet(viewsets.ModelViewSet):
     serializer_class = ClienteSerializer
 
 class RegistroDeVentaViewSet(viewsets.ModelViewSet):
-    queryset = RegistroDeVenta.objects.all()
+    queryset = RegistroDeVenta.objects.prefetch_related(*RegistroDeVenta.prefetch_ids())
     serializer_class = RegistroDeVentaSerializer
 
-class BebidaViewSet(viewsets.ModelViewSet):
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return RegistroDeVentaListaSerializer
+        return super().get_serializer_class()
+
+    @action(detail=False, methods=['get'], url_path='exportar')
+    def exportar(self, request):
+        return respuesta_exportacion('ventas', request)
+
+    @action(detail=False, methods=['post'], url_path='lote')
+    def lote(self, request):
+        # Carga en lote desde el POS: los elementos inválidos se informan por
+        # índice y el resto se registra en una sola transacción.
+        items = request.data
+        maximo = getattr(settings, 'LOTE_VENTAS_MAXIMO', 1000)
+        if not isinstance(items, list):
+            return Response({'detail': 'Se esperaba una lista de ventas.'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > maximo:
+            return Response({'detail': f'El lote no puede tener más de {maximo} ventas.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        errores = {}
+        validos = {}
+        for indice, item in enumerate(items):
+            serializer = RegistroDeVentaLoteSerializer(data=item)
+            if serializer.is_valid():
+                validos[indice] = serializer.validated_data
+            else:
+                errores[indice] = serializer.errors
+
+        # Una consulta por modelo para comprobar todas las referencias del lote
+        existentes = {}
+        for campo, modelo in (('platos', Plato), ('bebidas', Bebida), ('entradas', Entrada)):
+            ids = {i for venta in validos.values() for i in venta[campo]}
+            existentes[campo] = set(modelo.objects.filter(pk__in=ids).values_list('pk', flat=True))
+        clientes = Cliente.objects.in_bulk({venta['cliente'] for venta in validos.values() if 'cliente' in venta})
+        correos = {venta['correo_electronico'] for venta in validos.values() if 'cliente' not in venta}
+        clientes_por_correo = {cliente.correo_electronico: cliente for cliente in Cliente.objects.filter(correo_electronico__in=correos)}
+
+        nuevos = {}
+        for indice, venta in list(validos.items()):
+            error = {}
+            for campo in ('platos', 'bebidas', 'entradas'):
+                faltantes = [i for i in venta[campo] if i not in existentes[campo]]
+                if faltantes:
+                    error[campo] = [f'No existen: {faltantes}']
+            if 'cliente' in venta:
+                if venta['cliente'] not in clientes:
+                    error['cliente'] = ['Cliente inexistente.']
+            elif venta['correo_electronico'] not in clientes_por_correo:
+                if not venta.get('nombre') or not venta.get('apellido'):
+                    error['correo_electronico'] = ['Cliente nuevo: se requieren nombre y apellido.']
+                else:
+                    nuevos.setdefault(venta['correo_electronico'], Cliente(
+                        nombre=venta['nombre'], apellido=venta['apellido'], correo_electronico=venta['correo_electronico']))
+            if error:
+                errores[indice] = error
+                del validos[indice]
+
+        registros = []
+        if validos:
+            with transaction.atomic():
+                if nuevos:
+                    Cliente.objects.bulk_create(nuevos.values(), ignore_conflicts=True)
+                    clientes_por_correo.update(
+                        (cliente.correo_electronico, cliente)
+                        for cliente in Cliente.objects.filter(correo_electronico__in=list(nuevos)))
+                for venta in validos.values():
+                    if 'cliente' in venta:
+                        venta['cliente'] = clientes[venta['cliente']]
+                    else:
+                        venta['cliente'] = clientes_por_correo[venta['correo_electronico']]
+                registros = RegistroDeVenta.registrar_lote(list(validos.values()))
+
+        respuesta = {
+            'creados': [registro.pk for registro in registros],
+            'errores': [{'indice': indice, 'errores': errores[indice]} for indice in sorted(errores)],
+        }
+        return Response(respuesta, status=status.HTTP_201_CREATED if registros else status.HTTP_400_BAD_REQUEST)
+
+class BebidaViewSet(CacheMenuMixin, viewsets.ModelViewSet):
     queryset = Bebida.objects.all()
     serializer_class = BebidaSerializer
+    modelos_cache = (Bebida,)
 
-class EntradaViewSet(viewsets.ModelViewSet):
+class EntradaViewSet(CacheMenuMixin, viewsets.ModelViewSet):
     queryset = Entrada.objects.all()
     serializer_class = EntradaSerializer
+    modelos_cache = (Entrada,)
 
 class ContactoViewSet(viewsets.ModelViewSet):
     queryset = Contacto.objects.all()
@@ -59,117 +240,187 @@ class ContactoViewSet(viewsets.ModelViewSet):
 class GananciaMesViewSet(viewsets.ModelViewSet):
     queryset = GananciaMes.objects.all()
     serializer_class = GananciaMesSerializer
-
-
+    orden_cursor = ('-mes',)
+
+    def get_queryset(self):
+        # El detalle por día solo se incluye fuera del listado
+        if self.action == 'list':
+            return super().get_queryset()
+        return super().get_queryset().prefetch_related('dias')
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return GananciaMesListaSerializer
+        return super().get_serializer_class()
+
+
+class MenuView(APIView):
+    # Menú completo en una sola respuesta. Se sirve desde una instantánea JSON
+    # ya serializada, que solo se reconstruye cuando cambia algún modelo del
+    # menú. Las URLs de imágenes son relativas a MEDIA_URL.
+    modelos_cache = (Categoria, Plato, PromocionDePlato, Bebida, Entrada)
+
+    def get(self, request):
+        etag, ultima_modificacion = etag_de_versiones(self.modelos_cache)
+        no_modificado = get_conditional_response(request, etag=etag, last_modified=ultima_modificacion)
+        if no_modificado is not None:
+            return no_modificado
+
+        cache = cache_menu()
+        clave = f'menu:instantanea:{etag}'
+        contenido = cache.get(clave)
+        if contenido is None:
+            contenido = JSONRenderer().render(construir_menu())
+            cache.set(clave, contenido, getattr(settings, 'MENU_CACHE_TIMEOUT', 60 * 60 * 24))
+        respuesta = HttpResponse(contenido, content_type='application/json')
+        respuesta['ETag'] = etag
+        respuesta['Last-Modified'] = http_date(ultima_modificacion)
+        return respuesta
+
+
+def construir_menu():
+    # Cinco consultas fijas, sin importar el tamaño del menú
+    categorias = Categoria.objects.prefetch_related(
+        Prefetch('plato_set', queryset=Plato.objects.prefetch_related('promociondeplato_set')))
+    return {
+        'categorias': MenuCategoriaSerializer(categorias, many=True).data,
+        'bebidas': BebidaSerializer(Bebida.objects.all(), many=True).data,
+        'entradas': EntradaSerializer(Entrada.objects.all(), many=True).data,
+    }
 
 
 ## CODIGO PARA LOS DATOS DEL PDF
+# La generación del PDF vive en reportes.py y se importa solo al usarse, para
+# que los workers de la API no carguen reportlab ni matplotlib.
 
-from django.urls import path, reverse
-from django.utils.html import format_html
+from django.urls import reverse
 from django.shortcuts import get_object_or_404
-from django.http import FileResponse
-from io import BytesIO
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Image, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.lib import colors
-from reportlab.lib.units import inch
-import matplotlib
-matplotlib.use('Agg')
-import io
-from PIL import Image as PILImage
-
-class GananciaMesAdmin(admin.ModelAdmin):
-    list_display = ['mes', 'total_reservas', 'total_registros_venta', 'ganancia_reservas', 'ganancia_registros_venta', 'ganancia_total', 'acciones']
-
-    def acciones(self, obj):
-        return format_html('<a class="button" href="{}">Descargar PDF</a>', reverse('admin:descargar_reporte_pdf', args=[obj.pk]))
-    acciones.short_description = 'Acciones'
-
-    def get_urls(self):
-        urls = super().get_urls()
-        custom_urls = [
-            path('descargar-reporte-pdf/<int:pk>/', self.admin_site.admin_view(descargar_reporte_pdf), name='descargar_reporte_pdf'),
-        ]
-        return custom_urls + urls
+from django.http import FileResponse, Http404, JsonResponse
+from django.views.decorators.http import require_POST, require_safe
+from .media import servir_archivo
+from .storage import es_nombre_por_contenido
 
 def descargar_reporte_pdf(request, pk):
-    ganancia_mes = get_object_or_404(GananciaMes, pk=pk)
-    ganancia_mes.actualizar_ganancias()
-    buffer = generar_pdf(ganancia_mes)
-    return FileResponse(buffer, as_attachment=True, filename=f'Ganancias_{ganancia_mes.mes.strftime("%B_%Y")}.pdf')
-
-def generar_pdf(ganancia_mes):
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter, topMargin=0.5*inch, bottomMargin=0.5*inch)
-    elements = []
-    styles = getSampleStyleSheet()
-
-
-    # Generar la imagen de la gráfica
-    fig, ax = plt.subplots(figsize=(10, 5))
-    x = range(len(ganancia_mes.fechas))
-    width = 0.10
-    ax.bar([i - width/1 for i in x], ganancia_mes.ganancias_reservas, width, label='Reservas')
-    ax.bar([i + width/1 for i in x], ganancia_mes.ganancias_ventas, width, label='Ventas')
-    ax.set_xlabel('Dias del mes')
-    ax.set_ylabel('Ganancia Monto')
-    ax.set_title(f'Ganancias de {ganancia_mes.mes.strftime("%B %Y")}')
-    ax.set_xticks(x)
-    ax.set_xticklabels(ganancia_mes.fechas, rotation=45, ha='right')
-    ax.legend()
-    plt.tight_layout()
-    img_buffer = io.BytesIO()
-    fig.savefig(img_buffer, format='png', dpi=300)
-    img_buffer.seek(0)
-
-    # Ajustar el tamaño de la imagen
-    img = PILImage.open(img_buffer)
-    max_width = 600
-    img_width, img_height = img.size
-    aspect_ratio = img_height / img_width
-    if img_width > max_width:
-        new_width = max_width
-        new_height = int(new_width * aspect_ratio)
-        img = img.resize((new_width, new_height), PILImage.LANCZOS)
-    img_buffer = io.BytesIO()
-    img.save(img_buffer, format='PNG')
-    img_buffer.seek(0)
-
-    image = Image(img_buffer, width=7.5*inch, height=3.75*inch)
-    elements.append(image)
-    elements.append(Spacer(1, 0.25*inch))
-
-    # Crear la tabla de datos
-    data = [['Día', 'Reservas', 'Ventas', 'Total']]
-    for fecha, reserva, venta in zip(ganancia_mes.fechas, ganancia_mes.ganancias_reservas, ganancia_mes.ganancias_ventas):
-        total = reserva + venta
-        data.append([fecha, f"s/ {reserva:.2f}", f"s/ {venta:.2f}", f"s/ {total:.2f}"])
-    
-    # Añadir fila de totales
-    total_reservas = sum(ganancia_mes.ganancias_reservas)
-    total_ventas = sum(ganancia_mes.ganancias_ventas)
-    total_general = total_reservas + total_ventas
-    data.append(['Total', f"s/ {total_reservas:.2f}", f"s/ {total_ventas:.2f}", f"s/ {total_general:.2f}"])
-
-    table = Table(data, colWidths=[1*inch, 2*inch, 2*inch, 2*inch])
-    style = TableStyle([
-        ('BACKGROUND', (0,0), (-1,0), colors.grey),
-        ('TEXTCOLOR', (0,0), (-1,0), colors.whitesmoke),
-        ('ALIGN', (0,0), (-1,-1), 'CENTER'),
-        ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0,0), (-1,0), 12),
-        ('BOTTOMPADDING', (0,0), (-1,0), 12),
-        ('BACKGROUND', (0,1), (-1,-2), colors.beige),
-        ('BACKGROUND', (0,-1), (-1,-1), colors.lightgrey),
-        ('GRID', (0,0), (-1,-1), 1, colors.black),
-        ('FONTNAME', (0,-1), (-1,-1), 'Helvetica-Bold'),
-        ('ALIGN', (1,1), (-1,-1), 'RIGHT'),
-    ])
-    table.setStyle(style)
-    elements.append(table)
-
-    doc.build(elements)
-    buffer.seek(0)
-    return buffer
\ No newline at end of file
+    ganancia_mes = get_object_or_404(GananciaMes.objects.prefetch_related('dias'), pk=pk)
+    valor_huella = reportes_cache.huella(ganancia_mes)
+    archivo = reportes_cache.abrir(ganancia_mes, valor_huella)
+    if archivo is None:
+        from .reportes import generar_pdf
+        ruta = reportes_cache.guardar(ganancia_mes, valor_huella, generar_pdf(ganancia_mes).getvalue())
+        archivo = open(ruta, 'rb')
+    return FileResponse(archivo, as_attachment=True, filename=f'Ganancias_{ganancia_mes.mes.strftime("%B_%Y")}.pdf')
+
+@require_POST
+def solicitar_reporte_pdf(request, pk):
+    ganancia_mes = get_object_or_404(GananciaMes.objects.prefetch_related('dias'), pk=pk)
+    trabajo = trabajos.solicitar_reporte(ganancia_mes)
+    if trabajo is None:
+        return JsonResponse({'error': 'Hay demasiados reportes en preparación, intente en unos segundos.'}, status=429)
+    return JsonResponse(_estado_trabajo(trabajo), status=202)
+
+def estado_reporte_pdf(request, trabajo_id):
+    trabajos.vencer_trabajos()
+    trabajo = get_object_or_404(TrabajoReporte, pk=trabajo_id)
+    return JsonResponse(_estado_trabajo(trabajo))
+
+def descargar_trabajo_pdf(request, trabajo_id):
+    trabajo = get_object_or_404(TrabajoReporte.objects.select_related('ganancia_mes'), pk=trabajo_id,
+                                estado=TrabajoReporte.TERMINADO)
+    try:
+        archivo = open(trabajo.archivo, 'rb')
+    except FileNotFoundError:
+        # Desalojado de la caché: se genera en el momento
+        return descargar_reporte_pdf(request, trabajo.ganancia_mes_id)
+    return FileResponse(archivo, as_attachment=True, filename=f'Ganancias_{trabajo.ganancia_mes.mes.strftime("%B_%Y")}.pdf')
+
+@require_safe
+def grafico_ganancias_mes(request):
+    # Serie diaria de ?mes=AAAA-MM para la gráfica del changelist de GananciaMes
+    try:
+        mes = datetime.datetime.strptime(request.GET.get('mes', ''), '%Y-%m').date()
+    except ValueError:
+        return JsonResponse({'error': 'Mes inválido; se espera AAAA-MM.'}, status=400)
+    return JsonResponse(datos_grafico_ganancias(mes))
+
+def datos_grafico_ganancias(mes):
+    # Se invalida al aplicar un delta o recalcular el mes (ver GananciaMes)
+    return cache.get_or_set(clave_grafico_ganancias(mes), lambda: resumen_financiero.grafico_mes(mes),
+                            getattr(settings, 'GRAFICO_GANANCIAS_CACHE_TIMEOUT', 60 * 60))
+
+def reporte_rango(request):
+    # Reporte de cualquier rango de fechas en JSON, CSV (ambos en streaming) o PDF
+    try:
+        desde, hasta, agrupacion = resumen_financiero.leer_rango(request.GET)
+    except ValueError as error:
+        return JsonResponse({'error': str(error)}, status=400)
+    formato = request.GET.get('formato', 'json')
+    nombre = f'Ganancias_{desde.isoformat()}_{hasta.isoformat()}.{formato}'
+    if formato == 'pdf':
+        from .reportes import generar_pdf_rango
+        buffer = generar_pdf_rango(desde, hasta, agrupacion,
+                                   list(resumen_financiero.serie_por_periodo(desde, hasta, agrupacion)),
+                                   list(resumen_financiero.serie_por_categoria(desde, hasta)))
+        return FileResponse(buffer, as_attachment=True, filename=nombre)
+    if formato == 'csv':
+        respuesta = StreamingHttpResponse(streaming.lineas_csv(resumen_financiero.filas_csv(desde, hasta, agrupacion)),
+                                          content_type='text/csv; charset=utf-8')
+    elif formato == 'json':
+        respuesta = StreamingHttpResponse(resumen_financiero.fragmentos_json(desde, hasta, agrupacion),
+                                          content_type='application/json')
+    else:
+        return JsonResponse({'error': 'Formato inválido; opciones: json, csv, pdf.'}, status=400)
+    respuesta['Content-Disposition'] = f'attachment; filename="{nombre}"'
+    return respuesta
+
+def imagen_derivada(request, variante, formato, nombre):
+    # Variantes reducidas de las imágenes del menú; si aún no existen (por
+    # ejemplo, imágenes anteriores al backfill) se generan en esta petición
+    if variante not in imagenes.VARIANTES or formato not in imagenes.FORMATOS:
+        raise Http404
+    # Solo imágenes que usa alguna fila del menú: ni derivados de derivados ni
+    # cualquier archivo de MEDIA_ROOT, que llenarían el disco de variantes
+    if '/derivados/' in f'/{nombre}':
+        raise Http404
+    storage = imagenes.almacenamiento()
+    ruta = imagenes.ruta_derivado(nombre, variante, formato)
+    if not storage.exists(ruta):
+        if not ReferenciaImagen.objects.filter(nombre=nombre).exists() or not storage.exists(nombre):
+            raise Http404
+        from PIL import Image
+        try:
+            imagenes.generar_derivados(nombre, storage)
+        except (OSError, ValueError, Image.DecompressionBombError):
+            # UnidentifiedImageError (subclase de OSError) si no es una imagen;
+            # DecompressionBombError si supera el límite de píxeles de Pillow
+            raise Http404
+    return servir_archivo(request, ruta, raiz=storage.location, cache_control=cache_control_media(ruta),
+                          content_type=f'image/{formato}')
+
+def cache_control_media(nombre):
+    # Un nombre por contenido (storage.py) nunca cambia de contenido
+    if es_nombre_por_contenido(nombre):
+        return 'public, max-age=31536000, immutable'
+    return 'public, max-age=86400'
+
+@require_safe
+def servir_media(request, path):
+    # MEDIA_URL en producción: ETag, Range y, si se configura, envío por nginx/Apache
+    return servir_archivo(request, path, cache_control=cache_control_media(path))
+
+@require_safe
+def exponer_metricas(request):
+    # Formato de texto de Prometheus; solo para las IPs de METRICAS_IPS
+    if request.META.get('REMOTE_ADDR') not in getattr(settings, 'METRICAS_IPS', ('127.0.0.1', '::1')):
+        raise Http404
+    return HttpResponse(metricas.exportar(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+def _estado_trabajo(trabajo):
+    estado = {
+        'id': str(trabajo.pk),
+        'estado': trabajo.estado,
+        'error': trabajo.error,
+        'estado_url': reverse('admin:estado_reporte_pdf', args=[trabajo.pk]),
+    }
+    if trabajo.estado == TrabajoReporte.TERMINADO:
+        estado['descarga_url'] = reverse('admin:descargar_trabajo_pdf', args=[trabajo.pk])
+    return estado